@@ -6,10 +6,14 @@ import win32print
 import win32ui
 from PIL import Image
 import tempfile
+from progress import ProgressReporter
+from cancellation import OperationCancelled, check_cancelled
 
-def batch_print_pdfs(pdf_paths, printer_name=None):
+def batch_print_pdfs(pdf_paths, printer_name=None, progress=None, cancel_token=None):
     """
     批量打印PDF文件
+    progress: 可选的进度回调 (已发送文件数, 总文件数, 每秒文件数)
+    cancel_token: 可选的取消令牌，取消后不再发送剩余文件
     """
     try:
         if not pdf_paths:
@@ -20,11 +24,16 @@ def batch_print_pdfs(pdf_paths, printer_name=None):
             printer_name = win32print.GetDefaultPrinter()
         
         # 打印每个PDF文件
+        reporter = ProgressReporter(progress, len(pdf_paths))
         for pdf_path in pdf_paths:
+            check_cancelled(cancel_token)
             print_pdf(pdf_path, printer_name)
+            reporter.advance()
         
         return f"批量打印完成！共打印 {len(pdf_paths)} 个PDF文件"
         
+    except OperationCancelled:
+        raise
     except Exception as e:
         raise Exception(f"批量打印失败: {str(e)}")
 
@@ -52,9 +61,10 @@ def print_pdf(pdf_path, printer_name):
     except Exception as e:
         raise Exception(f"打印PDF失败 {pdf_path}: {str(e)}")
 
-def batch_print_images(image_paths, printer_name=None):
+def batch_print_images(image_paths, printer_name=None, progress=None):
     """
     批量打印图片文件
+    progress: 可选的进度回调 (已发送图片数, 总图片数, 每秒图片数)
     """
     try:
         if not image_paths:
@@ -63,8 +73,10 @@ def batch_print_images(image_paths, printer_name=None):
         if printer_name is None:
             printer_name = win32print.GetDefaultPrinter()
         
+        reporter = ProgressReporter(progress, len(image_paths))
         for image_path in image_paths:
             print_image(image_path, printer_name)
+            reporter.advance()
         
         return f"批量图片打印完成！共打印 {len(image_paths)} 张图片"
         
@@ -0,0 +1,430 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import os
+import sys
+import time
+import subprocess
+import shutil
+import argparse
+import tempfile
+
+def bench_render(pdf_path, worker_counts, dpi=150, chunk_size=4, backend='auto'):
+    """
+    测试PDF转图片在不同进程数下的渲染速度（页/秒）
+    """
+    from pdf_to_image import get_page_count, render_pages_to_files, resolve_backend
+    
+    page_count = get_page_count(pdf_path, backend)
+    print(f"渲染测试: {os.path.basename(pdf_path)}，共 {page_count} 页，DPI={dpi}，"
+          f"后端 {resolve_backend(backend)}")
+    
+    baseline = None
+    for workers in worker_counts:
+        output_dir = tempfile.mkdtemp(prefix="pdf_bench_")
+        try:
+            start = time.perf_counter()
+            render_pages_to_files(pdf_path, output_dir, "page_", "png", dpi=dpi,
+                                  chunk_size=chunk_size, workers=workers, backend=backend)
+            elapsed = time.perf_counter() - start
+        finally:
+            shutil.rmtree(output_dir, ignore_errors=True)
+        
+        pages_per_second = page_count / elapsed if elapsed else 0
+        if baseline is None:
+            baseline = pages_per_second
+        speedup = pages_per_second / baseline if baseline else 0
+        print(f"  进程数 {workers:>3}: {elapsed:8.2f} 秒  {pages_per_second:8.2f} 页/秒  加速比 {speedup:.2f}x")
+
+def bench_render_backends(pdf_path, backends, dpi=150, fmt='PNG', latency_pages=5):
+    """
+    比较各渲染后端的单页延迟（每次只渲染一页并保存，类似预览）和整份文档的吞吐量（页/秒）
+    首页延迟包含打开文件的开销，单独列出；某个后端不可用（例如找不到poppler）时跳过
+    """
+    from pdf_to_image import get_page_count, render_pages_to_files
+    import pdf_session
+    
+    file_ext = 'jpg' if fmt.upper() == 'JPEG' else fmt.lower()
+    print(f"渲染后端测试: {os.path.basename(pdf_path)}，DPI={dpi}，格式 {fmt.upper()}")
+    for backend in backends:
+        # 每个后端从关闭的文件开始，首页延迟包含解析文件的时间
+        pdf_session.close_all()
+        output_dir = tempfile.mkdtemp(prefix="pdf_bench_")
+        try:
+            page_count = get_page_count(pdf_path, backend)
+            latencies = []
+            for page_num in range(1, min(latency_pages, page_count) + 1):
+                start = time.perf_counter()
+                render_pages_to_files(pdf_path, output_dir, "single_", file_ext, dpi=dpi, fmt=fmt,
+                                      first_page=page_num, last_page=page_num, backend=backend)
+                latencies.append(time.perf_counter() - start)
+            
+            start = time.perf_counter()
+            render_pages_to_files(pdf_path, output_dir, "page_", file_ext, dpi=dpi, fmt=fmt,
+                                  backend=backend)
+            elapsed = time.perf_counter() - start
+        except Exception as e:
+            print(f"  {backend:>10}: 跳过（{str(e).splitlines()[0]}）")
+            continue
+        finally:
+            shutil.rmtree(output_dir, ignore_errors=True)
+        
+        later = latencies[1:] or latencies
+        print(f"  {backend:>10}: 首页 {latencies[0] * 1000:8.1f} 毫秒  "
+              f"之后每页 {sum(later) / len(later) * 1000:8.1f} 毫秒  "
+              f"整份 {page_count} 页 {elapsed:7.2f} 秒  {page_count / elapsed:8.2f} 页/秒")
+
+# 测量从开始导入到主窗口显示的耗时，在子进程中运行以排除当前进程已导入模块的影响
+_STARTUP_SCRIPT = """
+import time
+start = time.perf_counter()
+from PyQt5.QtWidgets import QApplication
+import ui
+app = QApplication([])
+window = ui.PDFToolbox()
+window.show()
+app.processEvents()
+print(time.perf_counter() - start)
+"""
+
+def bench_startup(top=15, offscreen=False):
+    """
+    统计启动耗时：python -X importtime 的模块导入报告，以及窗口显示耗时
+    """
+    project_dir = os.path.dirname(os.path.abspath(__file__))
+    
+    result = subprocess.run([sys.executable, "-X", "importtime", "-c", "import ui"],
+                            cwd=project_dir, capture_output=True, text=True)
+    if result.returncode != 0:
+        print(f"导入ui失败:\n{result.stderr}")
+        return
+    
+    # 每行格式: import time: self [us] | cumulative | imported package
+    rows = []
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:"):
+            continue
+        fields = line[len("import time:"):].split("|")
+        if len(fields) != 3 or not fields[0].strip().isdigit():
+            continue
+        rows.append((int(fields[1]), int(fields[0]), fields[2].rstrip()))
+    
+    total = next((cumulative for cumulative, _, name in rows if name.strip() == "ui"), 0)
+    print(f"导入ui模块总耗时: {total / 1000:.1f} 毫秒")
+    print(f"累计耗时最多的 {top} 个模块:")
+    for cumulative, self_time, name in sorted(rows, reverse=True)[:top]:
+        print(f"  {cumulative / 1000:8.1f} 毫秒  (自身 {self_time / 1000:7.1f} 毫秒)  {name.strip()}")
+    
+    env = dict(os.environ)
+    if offscreen:
+        env["QT_QPA_PLATFORM"] = "offscreen"
+    result = subprocess.run([sys.executable, "-c", _STARTUP_SCRIPT],
+                            cwd=project_dir, capture_output=True, text=True, env=env)
+    if result.returncode == 0:
+        print(f"从导入到窗口显示: {float(result.stdout.strip().splitlines()[-1]) * 1000:.1f} 毫秒")
+    else:
+        print(f"窗口启动测试失败:\n{result.stderr}")
+
+def _folder_size(folder):
+    return sum(os.path.getsize(os.path.join(root, name))
+               for root, _, names in os.walk(folder) for name in names)
+
+def _legacy_split(pdf_path, output_folder):
+    """
+    原拆分实现：每页创建一个PdfWriter并直接写文件，资源整体复制
+    """
+    from PyPDF2 import PdfReader, PdfWriter
+    
+    reader = PdfReader(pdf_path)
+    for page_num in range(len(reader.pages)):
+        writer = PdfWriter()
+        writer.add_page(reader.pages[page_num])
+        with open(os.path.join(output_folder, f"page_{page_num + 1}.pdf"), 'wb') as output_file:
+            writer.write(output_file)
+
+def bench_split(pdf_path, thread_counts):
+    """
+    测试逐页拆分的速度（页/秒）和输出总大小，与原实现对比
+    """
+    from PyPDF2 import PdfReader
+    from pdf_split import split_pdf
+    
+    page_count = len(PdfReader(pdf_path).pages)
+    print(f"拆分测试: {os.path.basename(pdf_path)}，共 {page_count} 页，"
+          f"原文件 {os.path.getsize(pdf_path) / 1024 / 1024:.2f} MB")
+    
+    cases = [("原实现", lambda folder: _legacy_split(pdf_path, folder))]
+    for threads in thread_counts:
+        cases.append((f"线程数 {threads}",
+                      lambda folder, threads=threads: split_pdf(pdf_path, folder, threads=threads)))
+    
+    for label, run in cases:
+        output_dir = tempfile.mkdtemp(prefix="pdf_bench_")
+        try:
+            start = time.perf_counter()
+            run(output_dir)
+            elapsed = time.perf_counter() - start
+            size = _folder_size(output_dir)
+        finally:
+            shutil.rmtree(output_dir, ignore_errors=True)
+        
+        pages_per_second = page_count / elapsed if elapsed else 0
+        print(f"  {label:>8}: {elapsed:8.2f} 秒  {pages_per_second:8.2f} 页/秒  "
+              f"输出 {size / 1024 / 1024:8.2f} MB")
+
+# 在子进程中执行一次合并并输出 耗时 和 峰值内存（字节），每种参数单独一个进程，峰值内存互不影响
+_MERGE_SCRIPT = """
+import sys, json, time
+from pdf_merge import merge_pdfs
+
+def peak_rss():
+    try:
+        import resource
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak if sys.platform == "darwin" else peak * 1024
+    except ImportError:
+        import ctypes
+        from ctypes import wintypes
+        class Counters(ctypes.Structure):
+            _fields_ = [("cb", wintypes.DWORD), ("PageFaultCount", wintypes.DWORD),
+                        ("PeakWorkingSetSize", ctypes.c_size_t), ("WorkingSetSize", ctypes.c_size_t),
+                        ("QuotaPeakPagedPoolUsage", ctypes.c_size_t), ("QuotaPagedPoolUsage", ctypes.c_size_t),
+                        ("QuotaPeakNonPagedPoolUsage", ctypes.c_size_t), ("QuotaNonPagedPoolUsage", ctypes.c_size_t),
+                        ("PagefileUsage", ctypes.c_size_t), ("PeakPagefileUsage", ctypes.c_size_t)]
+        counters = Counters()
+        counters.cb = ctypes.sizeof(counters)
+        ctypes.windll.psapi.GetProcessMemoryInfo(ctypes.windll.kernel32.GetCurrentProcess(),
+                                                 ctypes.byref(counters), counters.cb)
+        return counters.PeakWorkingSetSize
+
+input_paths, output_path, streaming = json.loads(sys.argv[1])
+start = time.perf_counter()
+merge_pdfs(input_paths, output_path, streaming=streaming)
+print(json.dumps([time.perf_counter() - start, peak_rss()]))
+"""
+
+def bench_merge(pdf_paths):
+    """
+    测试合并大量PDF文件的吞吐量（文件/秒、页/秒）和峰值内存，对比一次合并与流式合并
+    """
+    import json
+    from PyPDF2 import PdfReader
+    
+    page_count = sum(len(PdfReader(path).pages) for path in pdf_paths)
+    print(f"合并测试: {len(pdf_paths)} 个文件，共 {page_count} 页")
+    
+    project_dir = os.path.dirname(os.path.abspath(__file__))
+    for label, streaming in (("一次合并", False), ("流式合并", True)):
+        output_dir = tempfile.mkdtemp(prefix="pdf_bench_")
+        try:
+            payload = json.dumps([pdf_paths, os.path.join(output_dir, "merged.pdf"), streaming])
+            result = subprocess.run([sys.executable, "-c", _MERGE_SCRIPT, payload],
+                                    cwd=project_dir, capture_output=True, text=True)
+        finally:
+            shutil.rmtree(output_dir, ignore_errors=True)
+        
+        if result.returncode != 0:
+            print(f"  {label:>8}: 失败\n{result.stderr}")
+            continue
+        elapsed, peak = json.loads(result.stdout.strip().splitlines()[-1])
+        print(f"  {label:>8}: {elapsed:8.2f} 秒  {len(pdf_paths) / elapsed:8.1f} 文件/秒  "
+              f"{page_count / elapsed:8.1f} 页/秒  峰值内存 {peak / 1024 / 1024:8.1f} MB")
+
+def _legacy_extract_images(pdf_path, output_folder, min_width, min_height):
+    """
+    原实现：每个图片先用 extract_image 完整解码，再检查尺寸，返回解码次数
+    """
+    import fitz
+    
+    decoded = 0
+    pdf_document = fitz.open(pdf_path)
+    for page_num in range(len(pdf_document)):
+        for img_index, img in enumerate(pdf_document.load_page(page_num).get_images()):
+            base_image = pdf_document.extract_image(img[0])
+            decoded += 1
+            if base_image["width"] >= min_width and base_image["height"] >= min_height:
+                image_path = os.path.join(output_folder,
+                                          f"page_{page_num + 1}_img_{img_index + 1}.{base_image['ext']}")
+                with open(image_path, "wb") as image_file:
+                    image_file.write(base_image["image"])
+    pdf_document.close()
+    return decoded
+
+def make_icon_pdf(pdf_path, page_count=100, icons_per_page=40):
+    """
+    生成图标很多的测试文档：每页一张JPEG照片和若干张PNG小图标，所有图片互不相同
+    """
+    import io
+    import fitz
+    from PIL import Image
+    
+    def image_bytes(size, seed, fmt):
+        output = io.BytesIO()
+        Image.effect_noise(size, 30 + seed % 50).convert("RGB").save(output, fmt)
+        return output.getvalue()
+    
+    pdf_document = fitz.open()
+    for page_num in range(page_count):
+        page = pdf_document.new_page()
+        page.insert_image(fitz.Rect(50, 400, 550, 775), stream=image_bytes((800, 600), page_num, "JPEG"))
+        for icon in range(icons_per_page):
+            x = 40 + (icon % 20) * 26
+            y = 40 + (icon // 20) * 26
+            page.insert_image(fitz.Rect(x, y, x + 20, y + 20),
+                              stream=image_bytes((32, 32), page_num * icons_per_page + icon, "PNG"))
+    pdf_document.save(pdf_path, deflate=True)
+    pdf_document.close()
+
+def bench_extract_images(pdf_path, min_width=100, min_height=100):
+    """
+    测试带尺寸过滤的图片提取：原实现先解码后过滤，新实现按元数据过滤，被过滤的图片不解码
+    """
+    from pdf_image_extract import extract_images_with_quality
+    
+    print(f"图片提取测试: {os.path.basename(pdf_path)}，过滤小于 {min_width}x{min_height} 的图片")
+    cases = [("原实现", lambda folder: _legacy_extract_images(pdf_path, folder, min_width, min_height)),
+             ("元数据过滤", lambda folder: extract_images_with_quality(pdf_path, folder, min_width,
+                                                                    min_height))]
+    for label, run in cases:
+        output_dir = tempfile.mkdtemp(prefix="pdf_bench_")
+        try:
+            start = time.perf_counter()
+            result = run(output_dir)
+            elapsed = time.perf_counter() - start
+            saved = sum(len([name for name in names if not name.endswith(".json")])
+                        for _, _, names in os.walk(output_dir))
+        finally:
+            shutil.rmtree(output_dir, ignore_errors=True)
+        
+        detail = f"解码 {result} 张" if isinstance(result, int) else result.split("！", 1)[-1]
+        print(f"  {label:>8}: {elapsed:8.2f} 秒  保存 {saved} 张  {detail}")
+
+def make_mixed_image_folder(folder, count=60, size=(2000, 1500)):
+    """
+    生成PNG、JPEG、TIFF混合的测试图片文件夹
+    """
+    from PIL import Image
+    
+    os.makedirs(folder, exist_ok=True)
+    formats = [("png", "PNG"), ("jpg", "JPEG"), ("tif", "TIFF")]
+    base = Image.effect_noise(size, 40).convert("RGB").resize((size[0] // 8, size[1] // 8)).resize(size)
+    for index in range(count):
+        ext, fmt = formats[index % len(formats)]
+        base.rotate(index % 360).save(os.path.join(folder, f"img_{index:04d}.{ext}"), fmt)
+
+def _legacy_images_to_pdf_pillow(image_paths, output_path):
+    """
+    原实现：所有图片解码、转换后保存在列表中，最后一次写出，JPEG也重新编码
+    """
+    from PIL import Image
+    
+    images = [Image.open(path).convert("RGB") for path in image_paths]
+    images[0].save(output_path, "PDF", save_all=True, append_images=images[1:])
+
+def bench_images_to_pdf(image_paths, worker_counts):
+    """
+    测试图片转PDF的速度（张/秒），原样嵌入JPEG并用进程池转换其余图片，与原实现对比
+    """
+    from image_to_pdf import images_to_pdf, images_to_pdf_pillow
+    
+    print(f"图片转PDF测试: {len(image_paths)} 张图片")
+    cases = [("Pillow原实现", lambda output: _legacy_images_to_pdf_pillow(image_paths, output))]
+    for workers in worker_counts:
+        cases.append((f"Pillow 进程数 {workers}",
+                      lambda output, workers=workers: images_to_pdf_pillow(image_paths, output,
+                                                                           workers=workers)))
+        cases.append((f"img2pdf 进程数 {workers}",
+                      lambda output, workers=workers: images_to_pdf(image_paths, output,
+                                                                    workers=workers)))
+    
+    for label, run in cases:
+        output_dir = tempfile.mkdtemp(prefix="pdf_bench_")
+        try:
+            output_path = os.path.join(output_dir, "images.pdf")
+            start = time.perf_counter()
+            run(output_path)
+            elapsed = time.perf_counter() - start
+            size = os.path.getsize(output_path)
+        finally:
+            shutil.rmtree(output_dir, ignore_errors=True)
+        
+        print(f"  {label:>14}: {elapsed:8.2f} 秒  {len(image_paths) / elapsed:8.2f} 张/秒  "
+              f"输出 {size / 1024 / 1024:8.2f} MB")
+
+def main():
+    parser = argparse.ArgumentParser(description="PDF工具箱性能测试")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    
+    render_parser = subparsers.add_parser("render", help="PDF转图片并行渲染测试")
+    render_parser.add_argument("pdf", help="测试用PDF文件")
+    render_parser.add_argument("--workers", type=int, nargs="+",
+                               default=[1, 2, 4, os.cpu_count() or 1],
+                               help="要测试的进程数列表")
+    render_parser.add_argument("--dpi", type=int, default=150)
+    render_parser.add_argument("--chunk-size", type=int, default=4)
+    render_parser.add_argument("--backend", choices=['auto', 'pdf2image', 'fitz'], default='auto')
+    
+    backends_parser = subparsers.add_parser("render-backends",
+                                            help="渲染后端对比（单页延迟与吞吐量）")
+    backends_parser.add_argument("pdf", help="测试用PDF文件")
+    backends_parser.add_argument("--backends", nargs="+", choices=['pdf2image', 'fitz'],
+                                 default=['pdf2image', 'fitz'])
+    backends_parser.add_argument("--dpi", type=int, default=150)
+    backends_parser.add_argument("--fmt", default="PNG", help="图片格式，如 PNG、JPEG")
+    backends_parser.add_argument("--latency-pages", type=int, default=5,
+                                 help="逐页测量延迟的页数")
+    
+    split_parser = subparsers.add_parser("split", help="PDF逐页拆分速度与输出大小测试")
+    split_parser.add_argument("pdf", help="测试用PDF文件")
+    split_parser.add_argument("--threads", type=int, nargs="+", default=[1, 4],
+                              help="要测试的写出线程数列表")
+    
+    merge_parser = subparsers.add_parser("merge", help="大量PDF文件合并的吞吐量与峰值内存测试")
+    merge_parser.add_argument("pattern", help="输入文件通配符，例如 \"invoices/*.pdf\"")
+    
+    images_parser = subparsers.add_parser("extract-images", help="图片提取（按尺寸过滤）速度测试")
+    images_parser.add_argument("pdf", help="测试用PDF文件，与 --generate 同时使用时为生成的文件路径")
+    images_parser.add_argument("--generate", action="store_true",
+                               help="先生成图标很多的测试文档（每页一张大图和40个小图标）")
+    images_parser.add_argument("--min-width", type=int, default=100)
+    images_parser.add_argument("--min-height", type=int, default=100)
+    
+    to_pdf_parser = subparsers.add_parser("images-to-pdf", help="图片转PDF速度测试（PNG/JPEG/TIFF混合）")
+    to_pdf_parser.add_argument("folder", help="图片文件夹，与 --generate 同时使用时在其中生成测试图片")
+    to_pdf_parser.add_argument("--generate", action="store_true", help="先生成PNG、JPEG、TIFF混合的测试图片")
+    to_pdf_parser.add_argument("--workers", type=int, nargs="+", default=[1, os.cpu_count() or 1],
+                               help="要测试的进程数列表")
+    
+    startup_parser = subparsers.add_parser("startup", help="启动耗时测试（模块导入与窗口显示）")
+    startup_parser.add_argument("--top", type=int, default=15, help="显示耗时最多的模块数")
+    startup_parser.add_argument("--offscreen", action="store_true", help="不显示窗口（无显示器的环境）")
+    
+    args = parser.parse_args()
+    
+    if args.command == "render":
+        worker_counts = sorted(set(args.workers))
+        bench_render(args.pdf, worker_counts, args.dpi, args.chunk_size, args.backend)
+    elif args.command == "render-backends":
+        bench_render_backends(args.pdf, args.backends, args.dpi, args.fmt, args.latency_pages)
+    elif args.command == "split":
+        bench_split(args.pdf, sorted(set(args.threads)))
+    elif args.command == "merge":
+        import glob
+        pdf_paths = sorted(os.path.abspath(path) for path in glob.glob(args.pattern, recursive=True))
+        bench_merge(pdf_paths)
+    elif args.command == "extract-images":
+        if args.generate:
+            make_icon_pdf(args.pdf)
+        bench_extract_images(args.pdf, args.min_width, args.min_height)
+    elif args.command == "images-to-pdf":
+        if args.generate:
+            make_mixed_image_folder(args.folder)
+        extensions = ('.png', '.jpg', '.jpeg', '.tif', '.tiff', '.bmp')
+        image_paths = sorted(os.path.join(args.folder, name) for name in os.listdir(args.folder)
+                             if name.lower().endswith(extensions))
+        bench_images_to_pdf(image_paths, sorted(set(args.workers)))
+    elif args.command == "startup":
+        bench_startup(args.top, args.offscreen)
+
+if __name__ == "__main__":
+    main()
@@ -20,6 +20,13 @@ def check_files():
         'batch_print.py',
         'pdf_protect.py',
         'pdf_preview.py',
+        'parallel.py',
+        'result_cache.py',
+        'progress.py',
+        'cancellation.py',
+        'stream_writer.py',
+        'pdf_optimize.py',
+        'pdf_session.py',
         'pdf_icon.ico',
         'requirements.txt'
     ]
@@ -0,0 +1,72 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import os
+import shutil
+import threading
+
+class OperationCancelled(Exception):
+    """
+    操作被用户取消
+    """
+
+    def __init__(self, message="操作已取消"):
+        super().__init__(message)
+
+class CancelToken:
+    """
+    取消令牌
+    长时间运行的功能函数接受 cancel_token 参数，在处理每一页之间检查，
+    调用 cancel() 后函数会在当前页处理完后抛出 OperationCancelled
+    """
+
+    def __init__(self, event=None):
+        # event 可以是 multiprocessing.Event，用于在子进程中检查取消请求
+        self._event = event if event is not None else threading.Event()
+        self._callbacks = []
+        self._lock = threading.Lock()
+
+    @property
+    def cancelled(self):
+        return self._event.is_set()
+
+    def cancel(self):
+        with self._lock:
+            self._event.set()
+            callbacks = list(self._callbacks)
+        for callback in callbacks:
+            callback()
+
+    def on_cancel(self, callback):
+        """
+        注册取消时调用的函数，已经取消时立即调用
+        """
+        with self._lock:
+            if not self._event.is_set():
+                self._callbacks.append(callback)
+                return
+        callback()
+
+    def raise_if_cancelled(self):
+        if self._event.is_set():
+            raise OperationCancelled()
+
+def check_cancelled(cancel_token):
+    """
+    检查是否已请求取消，cancel_token为None时不做任何事
+    """
+    if cancel_token is not None and cancel_token.cancelled:
+        raise OperationCancelled()
+
+def remove_outputs(paths):
+    """
+    删除取消操作时已生成的部分输出（文件或文件夹），忽略删除失败
+    """
+    for path in paths:
+        try:
+            if os.path.isdir(path):
+                shutil.rmtree(path, ignore_errors=True)
+            elif os.path.exists(path):
+                os.remove(path)
+        except OSError:
+            pass
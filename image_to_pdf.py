@@ -1,89 +1,399 @@
 #!/usr/bin/env python3
 # -*- coding: utf-8 -*-
 
+import io
 import os
+import re
+import functools
+import itertools
+from collections import deque
 import img2pdf
 from PIL import Image
+from PyPDF2 import PdfReader
+from stream_writer import StreamingPdfWriter
+from parallel import create_process_pool, imap_ordered, resolve_workers, worker_cancel_token
+from progress import ProgressReporter
+from cancellation import OperationCancelled, check_cancelled, remove_outputs
 
-def images_to_pdf(image_paths, output_path):
+# 默认支持的图片扩展名
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.bmp', '.tiff', '.tif')
+
+# 可能包含多页的图片格式，每一帧作为PDF的一页
+MULTIPAGE_EXTENSIONS = ('.tif', '.tiff')
+
+# 可以不解码、原样嵌入PDF的图片格式
+PASSTHROUGH_FORMATS = ('JPEG', 'JPEG2000')
+
+# Pillow保存PDF时默认按72DPI计算页面大小，原样嵌入的图片使用相同的页面大小
+_PILLOW_LAYOUT = img2pdf.get_fixed_dpi_layout_fun((72, 72))
+
+def natural_sort_key(text):
+    """
+    自然排序的排序键：数字部分按数值比较，page2 排在 page10 之前，不区分大小写
+    """
+    parts = re.split(r'(\d+)', text.lower())
+    parts[1::2] = [int(part) for part in parts[1::2]]
+    return parts
+
+def find_images(folder_path, image_extensions=None, recursive=False, cancel_token=None):
+    """
+    用 os.scandir 查找文件夹中的图片，返回按自然顺序排列的路径列表
+    每个文件夹先列出其中的图片，再依次进入子文件夹；不跟随指向文件夹的符号链接
+    recursive: 是否查找子文件夹
+    """
+    extensions = {ext.lower() for ext in (image_extensions or IMAGE_EXTENSIONS)}
+    image_files = []
+    
+    def scan(directory):
+        check_cancelled(cancel_token)
+        files = []
+        subfolders = []
+        with os.scandir(directory) as entries:
+            for entry in entries:
+                if entry.is_dir(follow_symlinks=False):
+                    subfolders.append(entry.name)
+                elif os.path.splitext(entry.name)[1].lower() in extensions and entry.is_file():
+                    files.append(entry.name)
+        
+        files.sort(key=natural_sort_key)
+        image_files.extend(os.path.join(directory, name) for name in files)
+        if recursive:
+            for name in sorted(subfolders, key=natural_sort_key):
+                scan(os.path.join(directory, name))
+    
+    scan(folder_path)
+    return image_files
+
+def expand_frames(image_paths, cancel_token=None):
+    """
+    把图片列表展开为页面列表 [(图片路径, 帧序号), ...]
+    多页TIFF的每一帧是一页；单帧图片的帧序号为None，按整张图片转换
+    只读取TIFF文件头统计帧数，不解码图片
+    """
+    pages = []
+    for img_path in image_paths:
+        check_cancelled(cancel_token)
+        frame_count = 1
+        if img_path.lower().endswith(MULTIPAGE_EXTENSIONS):
+            with Image.open(img_path) as img:
+                frame_count = getattr(img, 'n_frames', 1)
+        if frame_count > 1:
+            pages.extend((img_path, frame) for frame in range(frame_count))
+        else:
+            pages.append((img_path, None))
+    return pages
+
+def _frame_image(img_path, frame):
+    """
+    取出多页图片中的一帧，保存为单帧图片数据供img2pdf嵌入，保留分辨率
+    黑白帧保存为CCITT G4压缩的TIFF，灰度、RGB和调色板帧保存为PNG，img2pdf都可以直接嵌入
+    """
+    with Image.open(img_path) as img:
+        img.seek(frame)
+        options = {}
+        if 'dpi' in img.info:
+            options['dpi'] = img.info['dpi']
+        
+        buffer = io.BytesIO()
+        if img.mode == '1':
+            img.save(buffer, "TIFF", compression="group4", **options)
+        elif img.mode in ('L', 'RGB', 'P'):
+            img.save(buffer, "PNG", **options)
+        else:
+            img.save(buffer, "TIFF", compression="tiff_adobe_deflate", **options)
+        return buffer.getvalue()
+
+def _img2pdf_page(img_path, frame=None):
+    """
+    用img2pdf把一张图片（或多页图片中的一帧）转换为单页PDF，JPEG等格式不重新编码
+    """
+    check_cancelled(worker_cancel_token())
+    if frame is None:
+        return img2pdf.convert(img_path)
+    return img2pdf.convert(_frame_image(img_path, frame))
+
+def _is_passthrough(img_path, size=None, modes=None):
+    """
+    判断图片能否原样嵌入：JPEG/JPEG2000格式，不需要调整大小，色彩模式在 modes 中（None表示不限）
+    只读取文件头，不解码图片
+    """
+    with Image.open(img_path) as img:
+        return (img.format in PASSTHROUGH_FORMATS and (not size or tuple(size) == img.size)
+                and (modes is None or img.mode in modes))
+
+def _pillow_page(img_path, frame=None, size=None):
+    """
+    用Pillow把一张图片（或多页图片中的一帧）转换为单页PDF：转为RGB、按需调整大小，
+    处理完立即释放图片
+    """
+    check_cancelled(worker_cancel_token())
+    with Image.open(img_path) as img:
+        if frame is not None:
+            img.seek(frame)
+        
+        # 转换为RGB模式（如果需要）
+        if img.mode != 'RGB':
+            img = img.convert('RGB')
+        
+        # 调整大小（如果指定）
+        if size:
+            img = img.resize(size, Image.Resampling.LANCZOS)
+        
+        buffer = io.BytesIO()
+        img.save(buffer, "PDF")
+        return buffer.getvalue()
+
+def _passthrough_pillow_page(img_path):
+    # 不解码，直接嵌入JPEG数据，页面大小与Pillow转换的页面一致；
+    # Pillow转换时不处理EXIF方向，这里也不按EXIF方向旋转页面，两种方式得到的页面相同
+    return img2pdf.convert(img_path, layout_fun=_PILLOW_LAYOUT, rotation=img2pdf.Rotation.none)
+
+def iter_page_pdfs(pages, convert, passthrough=None, is_passthrough=None, workers=1,
+                   cancel_token=None):
+    """
+    按输入顺序生成每一页的单页PDF数据
+    pages: expand_frames 返回的页面列表 [(图片路径, 帧序号), ...]
+    convert: 需要解码转换的页面使用的函数 convert(图片路径, 帧序号)，workers大于1时在进程池中运行
+    passthrough: 可原样嵌入的图片使用的函数，在当前进程中运行（只是读取文件，交给子进程反而多一次数据传输）
+    is_passthrough: 判断图片能否原样嵌入的函数，为None时所有图片都用 convert 处理；
+                    多页图片中的帧总是用 convert 处理
+    同时在途的转换任务不超过 workers * 2 个，内存占用与页数无关
+    """
+    def passes(path, frame):
+        return (frame is None and passthrough is not None and is_passthrough is not None
+                and is_passthrough(path))
+    
+    workers = resolve_workers(workers, len(pages))
+    if workers == 1:
+        for path, frame in pages:
+            check_cancelled(cancel_token)
+            yield passthrough(path) if passes(path, frame) else convert(path, frame)
+        return
+    
+    with create_process_pool(workers, cancel_token) as executor:
+        # 队列中是子进程任务或等待原样嵌入的图片路径，按顺序取出
+        pending = deque()
+        running = 0
+        for path, frame in pages:
+            check_cancelled(cancel_token)
+            if passes(path, frame):
+                pending.append((path, None))
+            else:
+                pending.append((path, executor.submit(convert, path, frame)))
+                running += 1
+            # 队首是原样嵌入的图片时立即输出；转换任务过多时等待最早的任务
+            while pending and (pending[0][1] is None or running >= workers * 2):
+                path, future = pending.popleft()
+                if future is None:
+                    yield passthrough(path)
+                else:
+                    running -= 1
+                    yield future.result()
+        
+        while pending:
+            path, future = pending.popleft()
+            yield passthrough(path) if future is None else future.result()
+
+def write_page_pdfs(page_pdfs, output_path, deduplicate=False, reporter=None, cancel_token=None):
+    """
+    把逐个生成的单页PDF依次写入输出文件，返回 (写入器, 单页PDF总大小)
+    page_pdfs: 单页PDF数据的可迭代对象（通常是生成器），每次只转换一张图片，
+               写入后即释放，内存占用取决于最大的单张图片，与图片数量无关
+    deduplicate: 内容相同的图片只写入一次
+    """
+    total_size = 0
+    with open(output_path, 'wb') as output_file:
+        writer = StreamingPdfWriter(output_file, deduplicate=deduplicate)
+        for data in page_pdfs:
+            check_cancelled(cancel_token)
+            total_size += len(data)
+            writer.import_pages(PdfReader(io.BytesIO(data)))
+            if reporter is not None:
+                reporter.advance()
+        writer.close()
+    return writer, total_size
+
+def _conversion_result(image_count, page_count, output_path, writer, total_size, deduplicate):
+    from pdf_optimize import describe_size_change
+    
+    result = f"图片转PDF完成！共转换 {image_count} 张图片"
+    if page_count != image_count:
+        result += f"（{page_count} 页）"
+    result += f"，输出文件: {output_path}"
+    if deduplicate:
+        size_change = describe_size_change(total_size, os.path.getsize(output_path))
+        result += f"，合并重复对象 {writer.duplicate_count} 个，文件大小 {size_change}"
+    return result
+
+def images_to_pdf(image_paths, output_path, deduplicate=False, workers=1, progress=None,
+                  cancel_token=None):
     """
     将多张图片合并为一个PDF文件
+    图片逐张转换并直接写入输出文件，转换上千张图片时内存占用也只取决于最大的单张图片；
+    多页TIFF逐帧转换，每一帧是一页
+    deduplicate: 内容相同的图片（例如重复出现的封面或logo页）只保留一份
+    workers: 转换进程数，None表示使用全部CPU核心；JPEG/JPEG2000图片原样嵌入，
+             只有PNG、TIFF等需要重新编码的图片交给进程池
+    progress: 可选的进度回调 (已转换页数, 总页数, 每秒页数)
+    cancel_token: 可选的取消令牌，取消时删除写了一半的输出文件
     """
+    written = []
     try:
         # 确保输出目录存在
-        os.makedirs(os.path.dirname(output_path), exist_ok=True)
+        output_folder = os.path.dirname(output_path)
+        if output_folder:
+            os.makedirs(output_folder, exist_ok=True)
         
         # 验证所有图片文件是否存在
         for img_path in image_paths:
             if not os.path.exists(img_path):
                 raise Exception(f"图片文件不存在: {img_path}")
         
-        # 使用img2pdf库转换
-        with open(output_path, "wb") as pdf_file:
-            pdf_file.write(img2pdf.convert(image_paths))
+        # 使用img2pdf逐页转换
+        pages = expand_frames(image_paths, cancel_token)
+        reporter = ProgressReporter(progress, len(pages))
+        written.append(output_path)
+        page_pdfs = iter_page_pdfs(pages, _img2pdf_page, img2pdf.convert, _is_passthrough,
+                                   workers, cancel_token)
+        writer, total_size = write_page_pdfs(page_pdfs, output_path, deduplicate, reporter,
+                                             cancel_token)
+        reporter.finish()
         
-        return f"图片转PDF完成！共转换 {len(image_paths)} 张图片，输出文件: {output_path}"
+        return _conversion_result(len(image_paths), len(pages), output_path, writer, total_size,
+                                  deduplicate)
         
+    except OperationCancelled:
+        remove_outputs(written)
+        raise
     except Exception as e:
         raise Exception(f"图片转PDF失败: {str(e)}")
 
-def images_to_pdf_pillow(image_paths, output_path, size=None):
+def images_to_pdf_pillow(image_paths, output_path, size=None, workers=1, progress=None,
+                         cancel_token=None):
     """
     使用Pillow库将图片转换为PDF
+    每张图片打开、转换、写入后立即释放，不会同时保留所有图片；多页TIFF逐帧转换
+    workers: 转换进程数，None表示使用全部CPU核心；不需要调整大小的RGB/灰度JPEG图片不解码、
+             原样嵌入，其余图片在进程池中转换为RGB并调整大小，输出顺序与输入一致
+    progress: 可选的进度回调 (已处理页数, 总页数, 每秒页数)
+    cancel_token: 可选的取消令牌，取消时删除写了一半的输出文件
     """
+    written = []
     try:
-        images = []
-        
-        for img_path in image_paths:
-            # 打开图片
-            img = Image.open(img_path)
-            
-            # 转换为RGB模式（如果需要）
-            if img.mode != 'RGB':
-                img = img.convert('RGB')
-            
-            # 调整大小（如果指定）
-            if size:
-                img = img.resize(size, Image.Resampling.LANCZOS)
-            
-            images.append(img)
+        pages = expand_frames(image_paths, cancel_token)
+        reporter = ProgressReporter(progress, len(pages))
         
         # 保存为PDF
-        if images:
-            images[0].save(
-                output_path, 
-                "PDF", 
-                save_all=True, 
-                append_images=images[1:]
-            )
+        if pages:
+            written.append(output_path)
+            convert = functools.partial(_pillow_page, size=size)
+            is_passthrough = functools.partial(_is_passthrough, size=size, modes=('RGB', 'L'))
+            page_pdfs = iter_page_pdfs(pages, convert, _passthrough_pillow_page, is_passthrough,
+                                       workers, cancel_token)
+            write_page_pdfs(page_pdfs, output_path, reporter=reporter, cancel_token=cancel_token)
         
-        return f"图片转PDF完成！共转换 {len(images)} 张图片"
+        return f"图片转PDF完成！共转换 {len(image_paths)} 张图片"
         
+    except OperationCancelled:
+        remove_outputs(written)
+        raise
     except Exception as e:
         raise Exception(f"图片转PDF失败: {str(e)}")
 
-def folder_images_to_pdf(folder_path, output_path, image_extensions=None):
+def _subfolder_output_name(folder_path, directory, used_names):
+    """
+    按子文件夹相对路径生成输出文件名，例如 2024/05/01 -> 2024_05_01.pdf
+    不同路径可能得到相同的文件名（a_b/c 与 a/b_c），重名时依次加后缀 _2、_3；
+    used_names 记录已用的文件名（不区分大小写，兼容Windows）
+    """
+    relative = os.path.relpath(directory, folder_path)
+    if relative == os.curdir:
+        relative = os.path.basename(os.path.abspath(folder_path))
+    stem = relative.replace(os.sep, '_')
+    name = stem + '.pdf'
+    suffix = 2
+    while name.lower() in used_names:
+        name = f"{stem}_{suffix}.pdf"
+        suffix += 1
+    used_names.add(name.lower())
+    return name
+
+def _subfolder_pdf_task(image_paths, output_path, deduplicate):
+    # 在子进程中转换一个子文件夹，子文件夹之间并行，文件夹内部不再开进程池
+    images_to_pdf(image_paths, output_path, deduplicate=deduplicate,
+                  cancel_token=worker_cancel_token())
+    return output_path
+
+def _subfolders_to_pdfs(image_files, folder_path, output_dir, deduplicate, workers, progress,
+                        cancel_token):
+    """
+    每个包含图片的文件夹生成一个PDF，多个文件夹在进程池中同时转换
+    """
+    written = []
+    try:
+        os.makedirs(output_dir, exist_ok=True)
+        # find_images 返回的同一文件夹中的图片是连续的
+        groups = [(directory, list(paths)) for directory, paths
+                  in itertools.groupby(image_files, key=os.path.dirname)]
+        reporter = ProgressReporter(progress, len(groups))
+        
+        used_names = set()
+        
+        def tasks():
+            for directory, paths in groups:
+                output_name = _subfolder_output_name(folder_path, directory, used_names)
+                output_path = os.path.join(output_dir, output_name)
+                written.append(output_path)
+                yield paths, output_path, deduplicate
+        
+        workers = resolve_workers(workers, len(groups))
+        if workers == 1:
+            for paths, output_path, _ in tasks():
+                images_to_pdf(paths, output_path, deduplicate=deduplicate,
+                              cancel_token=cancel_token)
+                reporter.advance()
+        else:
+            with create_process_pool(workers, cancel_token) as executor:
+                for _ in imap_ordered(executor, _subfolder_pdf_task, tasks(), workers * 2):
+                    check_cancelled(cancel_token)
+                    reporter.advance()
+        reporter.finish()
+        
+        return (f"图片转PDF完成！共生成 {len(groups)} 个PDF文件，包含 {len(image_files)} 张图片，"
+                f"输出目录: {output_dir}")
+        
+    except OperationCancelled:
+        remove_outputs(written)
+        raise
+
+def folder_images_to_pdf(folder_path, output_path, image_extensions=None, deduplicate=False,
+                         recursive=False, per_subfolder=False, workers=1, progress=None,
+                         cancel_token=None):
     """
     将文件夹中的所有图片转换为一个PDF文件
+    图片用 os.scandir 查找，按自然顺序排列（page2 在 page10 之前），多页TIFF的每一帧是一页
+    recursive: 是否包含子文件夹中的图片，每个文件夹的图片排在其子文件夹之前；
+               默认只转换文件夹本身中的图片
+    per_subfolder: 为每个包含图片的文件夹单独生成一个PDF（与 recursive 一起使用），
+                   此时 output_path 是输出目录，文件名取自文件夹的相对路径；workers 个文件夹同时转换
+    workers: 转换进程数，None表示使用全部CPU核心
     """
-    if image_extensions is None:
-        image_extensions = ['.jpg', '.jpeg', '.png', '.bmp', '.tiff', '.tif']
-    
     try:
-        # 获取文件夹中所有图片文件
-        image_files = []
-        for file in os.listdir(folder_path):
-            if any(file.lower().endswith(ext) for ext in image_extensions):
-                image_files.append(os.path.join(folder_path, file))
+        # 获取文件夹中所有图片文件（按自然顺序）
+        image_files = find_images(folder_path, image_extensions, recursive, cancel_token)
         
         if not image_files:
             raise Exception("文件夹中没有找到支持的图片文件")
         
-        # 按文件名排序
-        image_files.sort()
+        if per_subfolder:
+            return _subfolders_to_pdfs(image_files, folder_path, output_path, deduplicate, workers,
+                                       progress, cancel_token)
         
         # 转换为PDF
-        return images_to_pdf(image_files, output_path)
+        return images_to_pdf(image_files, output_path, deduplicate=deduplicate, workers=workers,
+                             progress=progress, cancel_token=cancel_token)
         
+    except OperationCancelled:
+        raise
     except Exception as e:
         raise Exception(f"文件夹图片转PDF失败: {str(e)}")
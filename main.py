@@ -4,6 +4,7 @@
 import sys
 import os
 import subprocess
+import multiprocessing
 from PyQt5.QtWidgets import QApplication
 from ui import PDFToolbox
 
@@ -25,4 +26,6 @@ def main():
     sys.exit(app.exec_())
 
 if __name__ == "__main__":
+    # 打包为exe后，渲染等功能使用的进程池需要此调用才能正常启动子进程
+    multiprocessing.freeze_support()
     main()
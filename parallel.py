@@ -0,0 +1,77 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import os
+import multiprocessing
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from cancellation import CancelToken
+
+# 子进程中的取消令牌，由进程池初始化函数设置
+_worker_cancel_token = None
+
+def _init_worker(cancel_event):
+    global _worker_cancel_token
+    _worker_cancel_token = CancelToken(cancel_event)
+
+def worker_cancel_token():
+    """
+    返回当前子进程的取消令牌，不在可取消的进程池中运行时返回None
+    """
+    return _worker_cancel_token
+
+class _ProcessPool(ProcessPoolExecutor):
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        # 出错或取消时不再启动排队中的任务，只等待正在运行的任务结束
+        self.shutdown(wait=True, cancel_futures=exc_type is not None)
+        return False
+
+def create_process_pool(workers, cancel_token=None):
+    """
+    创建进程池
+    传入取消令牌时，取消请求会同步到子进程，子进程中的任务通过 worker_cancel_token() 检查
+    """
+    if cancel_token is None:
+        return _ProcessPool(max_workers=workers)
+    
+    cancel_event = multiprocessing.Event()
+    cancel_token.on_cancel(cancel_event.set)
+    return _ProcessPool(max_workers=workers, initializer=_init_worker, initargs=(cancel_event,))
+
+def resolve_workers(workers, task_count):
+    """
+    计算实际使用的进程数
+    workers为None时使用全部CPU核心，且不超过任务数
+    """
+    if workers is None:
+        workers = os.cpu_count() or 1
+    return max(1, min(int(workers), task_count))
+
+def split_range(first, last, chunk_size):
+    """
+    把闭区间 [first, last] 按 chunk_size 切分为若干 (起始, 结束) 分片
+    """
+    chunk_size = max(1, int(chunk_size))
+    return [(start, min(start + chunk_size - 1, last))
+            for start in range(first, last + 1, chunk_size)]
+
+def imap_ordered(executor, function, args_list, max_pending):
+    """
+    把任务提交到执行器并按提交顺序逐个返回结果
+    同时在途的任务不超过 max_pending 个，已完成但未取走的结果也计入其中，
+    因此内存占用只与 max_pending 有关，与任务总数无关
+    """
+    pending = deque()
+    args_iter = iter(args_list)
+    
+    for args in args_iter:
+        pending.append(executor.submit(function, *args))
+        if len(pending) >= max_pending:
+            break
+    
+    while pending:
+        result = pending.popleft().result()
+        for args in args_iter:
+            pending.append(executor.submit(function, *args))
+            break
+        yield result
@@ -2,94 +2,195 @@
 # -*- coding: utf-8 -*-
 
 import os
-import fitz  # PyMuPDF
+import json
+from concurrent.futures import ThreadPoolExecutor
 from PIL import Image
+from parallel import imap_ordered
+from progress import ProgressReporter
+from pdf_session import document_session
+from cancellation import OperationCancelled, check_cancelled, remove_outputs
 
-def extract_images_from_pdf(input_path, output_dir):
+# 写图片文件的线程数，PyMuPDF解码在当前线程进行，写盘与解码同时进行
+WRITE_THREADS = 4
+
+def _write_file(output_path, data):
+    with open(output_path, 'wb') as output_file:
+        output_file.write(data)
+    return output_path
+
+def _raw_length(pdf_document, xref):
+    """
+    图片流压缩后的字节数，优先读取 /Length，不解码图片
+    """
+    value_type, value = pdf_document.xref_get_key(xref, "Length")
+    if value_type == "int":
+        return int(value)
+    return len(pdf_document.xref_stream_raw(xref))
+
+def _metadata_filter(pdf_document, min_width=0, min_height=0, min_bytes=0, colorspaces=None):
+    """
+    生成只根据 page.get_images() 返回的元数据判断图片是否保留的过滤函数，判断时不解码图片
+    colorspaces: 可选，保留的色彩空间名称，例如 {"DeviceRGB", "ICCBased"}
+    """
+    def image_filter(img):
+        # img: (xref, smask, 宽, 高, 位深, 色彩空间, 备用色彩空间, 名称, 编码, ...)
+        if img[2] < min_width or img[3] < min_height:
+            return False
+        if colorspaces and img[5] not in colorspaces:
+            return False
+        return not min_bytes or _raw_length(pdf_document, img[0]) >= min_bytes
+    return image_filter
+
+def _iter_unique_images(pdf_document, base_name, output_folder, manifest, image_filter=None,
+                        reporter=None, cancel_token=None, written=None):
+    """
+    逐页遍历图片，同一个图片对象（xref）只提取一次，生成 (输出路径, 图片数据)
+    文件以图片第一次出现的位置命名；每页用到的图片记录在 manifest 中
+    image_filter: 可选，根据 get_images() 的元数据判断是否保留图片，
+                  不保留的图片不解码、不保存，计入 manifest["skipped"]
+    """
+    images = {}
+    for page_num in range(len(pdf_document)):
+        check_cancelled(cancel_token)
+        page = pdf_document.load_page(page_num)
+        page_files = []
+        
+        for img_index, img in enumerate(page.get_images()):
+            xref = img[0]
+            entry = images.get(xref)
+            if entry is None:
+                if image_filter is not None and not image_filter(img):
+                    # 跳过的图片也记下xref，其他页面再次用到时不再判断
+                    images[xref] = entry = {"file": None}
+                    manifest["skipped"] += 1
+                else:
+                    base_image = pdf_document.extract_image(xref)
+                    if not base_image:
+                        continue
+                    
+                    image_filename = (f"{base_name}_page_{page_num + 1}_img_{img_index + 1}."
+                                      f"{base_image['ext']}")
+                    entry = {"file": image_filename, "xref": xref, "width": base_image["width"],
+                             "height": base_image["height"], "pages": []}
+                    images[xref] = entry
+                    manifest["images"].append(entry)
+                    
+                    image_path = os.path.join(output_folder, image_filename)
+                    if written is not None:
+                        written.append(image_path)
+                    yield image_path, base_image["image"]
+            
+            if entry["file"] is None:
+                continue
+            if not entry["pages"] or entry["pages"][-1] != page_num + 1:
+                entry["pages"].append(page_num + 1)
+            page_files.append(entry["file"])
+        
+        manifest["pages"][str(page_num + 1)] = page_files
+        if reporter is not None:
+            reporter.advance()
+
+def _extract_unique_images(input_path, output_folder, base_name, filter_options=None,
+                           threads=WRITE_THREADS, progress=None, cancel_token=None, written=None):
+    """
+    提取图片并写出清单文件 {base_name}_images.json，返回清单
+    清单中 images 列出每个保存的图片及其出现的页码，pages 列出每页用到的图片文件
+    filter_options: 可选，传给 _metadata_filter 的过滤条件
+    PyMuPDF文档来自文档会话，提取后不关闭，同一文件的后续操作可以直接复用
+    """
+    manifest = {"source": os.path.basename(input_path), "images": [], "pages": {}, "skipped": 0}
+    with document_session(input_path) as session:
+        pdf_document = session.fitz
+        reporter = ProgressReporter(progress, len(pdf_document))
+        image_filter = None
+        if filter_options:
+            image_filter = _metadata_filter(pdf_document, **filter_options)
+        tasks = _iter_unique_images(pdf_document, base_name, output_folder, manifest, image_filter,
+                                    reporter, cancel_token, written)
+        threads = max(1, int(threads))
+        if threads == 1:
+            for image_path, image_bytes in tasks:
+                _write_file(image_path, image_bytes)
+        else:
+            with ThreadPoolExecutor(max_workers=threads) as executor:
+                for _ in imap_ordered(executor, _write_file, tasks, threads * 2):
+                    pass
+    
+    manifest_path = os.path.join(output_folder, f"{base_name}_images.json")
+    if written is not None:
+        written.append(manifest_path)
+    with open(manifest_path, 'w', encoding='utf-8') as manifest_file:
+        json.dump(manifest, manifest_file, ensure_ascii=False, indent=2)
+    return manifest
+
+def extract_images_from_pdf(input_path, output_dir, threads=WRITE_THREADS, progress=None,
+                            cancel_token=None):
     """
     从PDF文件中提取所有图片
+    多个页面共用的图片（如每页的logo）只保存一次，页码与图片文件的对应关系写入
+    {原文件名}_images.json 清单
+    threads: 写图片文件的线程数
+    progress: 可选的进度回调 (已完成页数, 总页数, 每秒页数)
+    cancel_token: 可选的取消令牌，取消时删除已保存的图片
     """
+    written = []
     try:
         # 获取原文件名（不含扩展名）
         base_name = os.path.splitext(os.path.basename(input_path))[0]
         
         # 创建输出目录
         output_folder = os.path.join(output_dir, f"{base_name}_extracted_images")
-        os.makedirs(output_folder, exist_ok=True)
-        
-        # 打开PDF文件
-        pdf_document = fitz.open(input_path)
-        image_count = 0
-        
-        # 遍历每一页
-        for page_num in range(len(pdf_document)):
-            page = pdf_document.load_page(page_num)
-            image_list = page.get_images()
-            
-            for img_index, img in enumerate(image_list):
-                # 获取图片引用
-                xref = img[0]
-                
-                # 提取图片数据
-                base_image = pdf_document.extract_image(xref)
-                image_bytes = base_image["image"]
-                image_ext = base_image["ext"]
-                
-                # 保存图片
-                image_filename = f"{base_name}_page_{page_num + 1}_img_{img_index + 1}.{image_ext}"
-                image_path = os.path.join(output_folder, image_filename)
-                
-                with open(image_path, "wb") as image_file:
-                    image_file.write(image_bytes)
-                
-                image_count += 1
+        if not os.path.isdir(output_folder):
+            os.makedirs(output_folder)
+            written.append(output_folder)
         
-        pdf_document.close()
+        manifest = _extract_unique_images(input_path, output_folder, base_name, threads=threads,
+                                          progress=progress, cancel_token=cancel_token,
+                                          written=written)
         
-        return f"图片提取完成！共提取 {image_count} 张图片，文件保存在: {output_folder}"
+        image_count = len(manifest["images"])
+        use_count = sum(len(files) for files in manifest["pages"].values())
+        return (f"图片提取完成！共提取 {image_count} 张图片（页面中出现 {use_count} 次），"
+                f"文件保存在: {output_folder}")
         
+    except OperationCancelled:
+        remove_outputs(written)
+        raise
     except Exception as e:
         raise Exception(f"图片提取失败: {str(e)}")
 
-def extract_images_with_quality(input_path, output_dir, min_width=100, min_height=100):
+def extract_images_with_quality(input_path, output_dir, min_width=100, min_height=100, min_bytes=0,
+                                colorspaces=None, threads=WRITE_THREADS, progress=None,
+                                cancel_token=None):
     """
     提取图片并过滤小图片
+    过滤只使用 page.get_images() 返回的宽高、色彩空间和图片流的字节数，被过滤的图片不会解码，
+    图标、装饰线条很多的文档可以省去大部分解码时间
+    min_bytes: 图片流（压缩后）小于该字节数时跳过，0表示不限制
+    colorspaces: 可选，只保留这些色彩空间的图片，例如 ["DeviceRGB", "ICCBased"]
+    threads: 写图片文件的线程数
+    progress: 可选的进度回调 (已完成页数, 总页数, 每秒页数)
+    cancel_token: 可选的取消令牌，取消时删除已保存的图片
     """
+    written = []
     try:
         base_name = os.path.splitext(os.path.basename(input_path))[0]
         output_folder = os.path.join(output_dir, f"{base_name}_extracted_images")
-        os.makedirs(output_folder, exist_ok=True)
-        
-        pdf_document = fitz.open(input_path)
-        image_count = 0
-        skipped_count = 0
-        
-        for page_num in range(len(pdf_document)):
-            page = pdf_document.load_page(page_num)
-            image_list = page.get_images()
-            
-            for img_index, img in enumerate(image_list):
-                xref = img[0]
-                base_image = pdf_document.extract_image(xref)
-                image_bytes = base_image["image"]
-                image_ext = base_image["ext"]
-                
-                # 检查图片尺寸
-                image_size = base_image["image_size"]
-                if image_size[0] >= min_width and image_size[1] >= min_height:
-                    image_filename = f"{base_name}_page_{page_num + 1}_img_{img_index + 1}.{image_ext}"
-                    image_path = os.path.join(output_folder, image_filename)
-                    
-                    with open(image_path, "wb") as image_file:
-                        image_file.write(image_bytes)
-                    
-                    image_count += 1
-                else:
-                    skipped_count += 1
+        if not os.path.isdir(output_folder):
+            os.makedirs(output_folder)
+            written.append(output_folder)
         
-        pdf_document.close()
+        filter_options = {"min_width": min_width, "min_height": min_height, "min_bytes": min_bytes,
+                          "colorspaces": set(colorspaces) if colorspaces else None}
+        manifest = _extract_unique_images(input_path, output_folder, base_name, filter_options,
+                                          threads=threads, progress=progress,
+                                          cancel_token=cancel_token, written=written)
         
-        return f"图片提取完成！共提取 {image_count} 张图片，跳过 {skipped_count} 张小图片"
+        return (f"图片提取完成！共提取 {len(manifest['images'])} 张图片，"
+                f"跳过 {manifest['skipped']} 张不符合条件的图片（未解码）")
         
+    except OperationCancelled:
+        remove_outputs(written)
+        raise
     except Exception as e:
         raise Exception(f"图片提取失败: {str(e)}")
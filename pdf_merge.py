@@ -2,34 +2,97 @@
 # -*- coding: utf-8 -*-
 
 import os
-from PyPDF2 import PdfMerger
+from PyPDF2 import PdfMerger, PdfReader
+from stream_writer import StreamingPdfWriter
+from pdf_optimize import deduplicate_in_place, describe_size_change
+from progress import ProgressReporter
+from cancellation import OperationCancelled, check_cancelled, remove_outputs
 
-def merge_pdfs(input_paths, output_path):
+def _merge_all(input_paths, output_path, reporter, cancel_token=None):
     """
-    合并多个PDF文件为一个PDF文件
+    用PdfMerger一次合并所有文件，保留各文件的书签
+    所有输入文件在写出前都保持打开，合并结果完整保存在内存中
     """
+    merger = PdfMerger()
     try:
-        merger = PdfMerger()
-        
         # 添加所有PDF文件
         for pdf_path in input_paths:
+            check_cancelled(cancel_token)
             merger.append(pdf_path)
-        
-        # 确保输出目录存在
-        os.makedirs(os.path.dirname(output_path), exist_ok=True)
+            reporter.advance()
         
         # 写入合并后的PDF
+        check_cancelled(cancel_token)
         with open(output_path, 'wb') as output_file:
             merger.write(output_file)
-        
+    finally:
         merger.close()
+
+def _merge_streaming(input_paths, output_path, reporter, deduplicate=False, cancel_token=None):
+    """
+    流式合并：逐个打开输入文件，把页面及其引用的对象直接写入输出文件后关闭
+    同时只打开一个输入文件，内存占用取决于最大的单个输入文件，与文件总数无关
+    返回写入器，可从中读取去重统计
+    """
+    with open(output_path, 'wb') as output_file:
+        writer = StreamingPdfWriter(output_file, deduplicate=deduplicate)
+        for pdf_path in input_paths:
+            check_cancelled(cancel_token)
+            with open(pdf_path, 'rb') as input_file:
+                writer.import_pages(PdfReader(input_file),
+                                    page_callback=lambda: check_cancelled(cancel_token))
+            reporter.advance()
+        writer.close()
+    return writer
+
+def merge_pdfs(input_paths, output_path, streaming=False, deduplicate=False, progress=None,
+               cancel_token=None):
+    """
+    合并多个PDF文件为一个PDF文件
+    streaming: 是否流式合并。流式合并同时只打开一个输入文件，合并结果直接写入输出文件，
+               适合成百上千个文件的合并，但不保留书签，因此需要显式开启
+    deduplicate: 合并各文件中内容相同的图片、字体等对象（例如每张发票上的同一个logo），
+                 结果中包含去重节省的大小
+    progress: 可选的进度回调 (已添加文件数, 总文件数, 每秒文件数)
+    cancel_token: 可选的取消令牌，取消时不会留下写了一半的输出文件
+    """
+    written = []
+    try:
+        reporter = ProgressReporter(progress, len(input_paths))
+        
+        # 确保输出目录存在
+        output_folder = os.path.dirname(output_path)
+        if output_folder:
+            os.makedirs(output_folder, exist_ok=True)
+        
+        written.append(output_path)
+        result = f"PDF合并完成！输出文件: {output_path}"
+        if streaming:
+            # 流式合并时在写入过程中直接去重
+            writer = _merge_streaming(input_paths, output_path, reporter, deduplicate, cancel_token)
+            if deduplicate:
+                # 重复对象没有写入输出文件，用输入文件总大小作为去重前的大小
+                before = sum(os.path.getsize(path) for path in input_paths)
+                size_change = describe_size_change(before, os.path.getsize(output_path))
+                result += (f"，合并重复对象 {writer.duplicate_count} 个，"
+                           f"文件大小（输入合计 → 输出）{size_change}")
+        else:
+            _merge_all(input_paths, output_path, reporter, cancel_token)
+            if deduplicate:
+                before, after = deduplicate_in_place(output_path, cancel_token)
+                result += f"，去重后文件大小 {describe_size_change(before, after)}"
+        reporter.finish()
         
-        return f"PDF合并完成！输出文件: {output_path}"
+        return result
         
+    except OperationCancelled:
+        remove_outputs(written)
+        raise
     except Exception as e:
         raise Exception(f"PDF合并失败: {str(e)}")
 
-def merge_pdfs_from_folder(folder_path, output_path):
+def merge_pdfs_from_folder(folder_path, output_path, streaming=False, deduplicate=False,
+                           progress=None, cancel_token=None):
     """
     合并文件夹中的所有PDF文件
     """
@@ -43,7 +106,10 @@ def merge_pdfs_from_folder(folder_path, output_path):
         
         input_paths = [os.path.join(folder_path, f) for f in pdf_files]
         
-        return merge_pdfs(input_paths, output_path)
+        return merge_pdfs(input_paths, output_path, streaming=streaming, deduplicate=deduplicate,
+                          progress=progress, cancel_token=cancel_token)
         
+    except OperationCancelled:
+        raise
     except Exception as e:
         raise Exception(f"从文件夹合并PDF失败: {str(e)}")
@@ -0,0 +1,363 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import io
+import math
+import os
+import struct
+import tempfile
+import zlib
+from PIL import Image
+from PyPDF2 import PdfReader
+from PyPDF2.generic import ArrayObject, IndirectObject, NameObject, NumberObject, StreamObject
+from PyPDF2.generic import ContentStream
+from stream_writer import StreamingPdfWriter
+from parallel import create_process_pool, imap_ordered, resolve_workers, worker_cancel_token
+from progress import ProgressReporter
+from cancellation import OperationCancelled, check_cancelled, remove_outputs
+
+# 默认的图片目标分辨率，适合屏幕阅读和邮件发送
+DEFAULT_TARGET_DPI = 150
+
+# 有效分辨率超过目标分辨率的该倍数时才缩小图片，略高于目标的图片重新编码得不偿失
+DOWNSAMPLE_THRESHOLD = 1.5
+
+# 缩小后重新编码JPEG图片的质量
+DEFAULT_JPEG_QUALITY = 80
+
+# 解析表单XObject的最大嵌套深度
+MAX_FORM_DEPTH = 8
+
+# 这些编码可以解码后改用Flate压缩；已经是Flate压缩的流不再重复压缩
+_RECOMPRESSIBLE_FILTERS = ('/ASCIIHexDecode', '/ASCII85Decode', '/LZWDecode', '/FlateDecode')
+
+# 可以缩小的图片色彩空间及对应的PIL模式
+_IMAGE_MODES = {'/DeviceRGB': 'RGB', '/DeviceGray': 'L'}
+
+def format_size(size):
+    """
+    把字节数格式化为便于阅读的文本
+    """
+    if size >= 1024 * 1024:
+        return f"{size / 1024 / 1024:.2f} MB"
+    return f"{size / 1024:.1f} KB"
+
+def describe_size_change(before, after):
+    """
+    生成优化前后文件大小的说明，例如 "12.00 MB → 3.00 MB（减少 75.0%）"
+    """
+    saved = (1 - after / before) * 100 if before else 0
+    return f"{format_size(before)} → {format_size(after)}（减少 {saved:.1f}%）"
+
+def deduplicate_file(input_path, output_path, reporter=None, cancel_token=None):
+    """
+    复制整个文档并合并内容相同的对象（图片、字体、ICC配置等），返回合并的重复对象数
+    书签、表单、页码标签和文档信息一并保留
+    reporter: 可选的 ProgressReporter，按页上报进度
+    """
+    with open(input_path, 'rb') as input_file, open(output_path, 'wb') as output_file:
+        reader = PdfReader(input_file)
+        if reader.is_encrypted:
+            raise Exception("加密的PDF文件需要先解密")
+        if reporter is not None:
+            reporter.set_total(len(reader.pages))
+        
+        def on_page():
+            check_cancelled(cancel_token)
+            if reporter is not None:
+                reporter.advance()
+        
+        writer = StreamingPdfWriter(output_file, deduplicate=True)
+        writer.import_pages(reader, page_callback=on_page, document_entries=True)
+        writer.close()
+    return writer.duplicate_count
+
+def deduplicate_in_place(path, cancel_token=None):
+    """
+    对已生成的PDF文件去重并替换原文件，返回 (原大小, 新大小)
+    先写入同目录下的临时文件，完成后再替换，失败或取消时原文件不受影响
+    """
+    from pdf_session import close_document
+    
+    before = os.path.getsize(path)
+    fd, temp_path = tempfile.mkstemp(suffix=".pdf", prefix=".dedup_",
+                                     dir=os.path.dirname(os.path.abspath(path)))
+    os.close(fd)
+    try:
+        deduplicate_file(path, temp_path, cancel_token=cancel_token)
+        # 会话中打开的句柄会占用文件，Windows下无法替换
+        close_document(path)
+        os.replace(temp_path, path)
+    finally:
+        remove_outputs([temp_path])
+    return before, os.path.getsize(path)
+
+def _resolved(obj, key, default=None):
+    """
+    取字典中的值并解析间接引用
+    """
+    value = obj.get(key)
+    return default if value is None else value.get_object()
+
+def _multiply(m, n):
+    """
+    两个变换矩阵相乘，只计算决定缩放和旋转的前四项
+    """
+    return (m[0] * n[0] + m[1] * n[2], m[0] * n[1] + m[1] * n[3],
+            m[2] * n[0] + m[3] * n[2], m[2] * n[1] + m[3] * n[3])
+
+def _scan_image_dpis(reader, contents, resources, matrix, dpis, depth=0):
+    """
+    跟踪内容流中的变换矩阵，记录每个图片XObject在页面上的有效分辨率
+    同一图片在多处使用时取最低的分辨率（显示得最大的一处），结果写入 dpis: {对象编号: DPI}
+    """
+    xobjects = _resolved(resources, '/XObject') if resources else None
+    if not xobjects:
+        return
+    
+    stack = []
+    ctm = matrix
+    for operands, operator in ContentStream(contents, reader).operations:
+        if operator == b'q':
+            stack.append(ctm)
+        elif operator == b'Q':
+            ctm = stack.pop() if stack else matrix
+        elif operator == b'cm' and len(operands) == 6:
+            ctm = _multiply([float(value) for value in operands[:4]], ctm)
+        elif operator == b'Do' and operands:
+            try:
+                ref = xobjects.raw_get(operands[0])
+            except KeyError:
+                continue
+            if not isinstance(ref, IndirectObject):
+                continue
+            xobject = ref.get_object()
+            subtype = _resolved(xobject, '/Subtype')
+            if subtype == '/Image':
+                # 图片绘制在单位正方形中，变换后两条边的长度就是显示宽高（点）
+                shown_width = math.hypot(ctm[0], ctm[1])
+                shown_height = math.hypot(ctm[2], ctm[3])
+                if shown_width <= 0 or shown_height <= 0:
+                    continue
+                dpi = min(xobject['/Width'] * 72 / shown_width, xobject['/Height'] * 72 / shown_height)
+                dpis[ref.idnum] = min(dpi, dpis.get(ref.idnum, dpi))
+            elif subtype == '/Form' and depth < MAX_FORM_DEPTH:
+                form_matrix = _resolved(xobject, '/Matrix', [1, 0, 0, 1])
+                form_matrix = [float(value) for value in form_matrix[:4]]
+                _scan_image_dpis(reader, xobject, _resolved(xobject, '/Resources', resources),
+                                 _multiply(form_matrix, ctm), dpis, depth + 1)
+
+def _image_mode(image):
+    """
+    返回图片色彩空间对应的PIL模式，不支持的色彩空间返回None
+    ICCBased色彩空间按通道数（/N）判断，缩小后的图片仍使用原来的ICC配置
+    """
+    colorspace = _resolved(image, '/ColorSpace')
+    if isinstance(colorspace, NameObject):
+        return _IMAGE_MODES.get(colorspace)
+    if (isinstance(colorspace, ArrayObject) and len(colorspace) == 2
+            and colorspace[0] == '/ICCBased'):
+        return {1: 'L', 3: 'RGB'}.get(_resolved(colorspace[1].get_object(), '/N'))
+    return None
+
+def _downsample_args(image, dpi, target_dpi, jpeg_quality):
+    """
+    生成缩小图片的任务参数，不支持的编码、色彩空间或带色键蒙版的图片返回None
+    """
+    filters = _resolved(image, '/Filter')
+    if isinstance(filters, ArrayObject):
+        if len(filters) != 1:
+            return None
+        filters = filters[0]
+    mode = _image_mode(image)
+    if (filters not in ('/DCTDecode', '/FlateDecode') or mode is None
+            or _resolved(image, '/BitsPerComponent') != 8 or _resolved(image, '/ImageMask')
+            or '/Mask' in image):
+        return None
+    
+    size = (image['/Width'], image['/Height'])
+    png_predicted = False
+    decode_parms = _resolved(image, '/DecodeParms')
+    if decode_parms is not None:
+        predictor = _resolved(decode_parms, '/Predictor', 1)
+        if predictor >= 10:
+            # PNG预测与PNG文件的图像数据格式相同，每行数据须与图片宽度、通道数一致
+            png_predicted = True
+            if (_resolved(decode_parms, '/Columns', 1) != size[0]
+                    or _resolved(decode_parms, '/Colors', 1) != len(mode)
+                    or _resolved(decode_parms, '/BitsPerComponent', 8) != 8):
+                return None
+        elif predictor != 1:
+            return None
+    
+    scale = target_dpi / dpi
+    new_size = (max(1, round(size[0] * scale)), max(1, round(size[1] * scale)))
+    return image._data, filters, mode, size, png_predicted, new_size, jpeg_quality
+
+def _png_chunk(tag, body):
+    return struct.pack('>I', len(body)) + tag + body + struct.pack('>I', zlib.crc32(tag + body))
+
+def _decode_flate_image(data, mode, size, png_predicted):
+    """
+    解码Flate压缩的图片数据
+    使用PNG预测的数据直接加上PNG文件头交给PIL解码，不在Python中逐行还原预测
+    """
+    if not png_predicted:
+        return Image.frombytes(mode, size, zlib.decompress(data))
+    header = struct.pack('>IIBBBBB', size[0], size[1], 8, 2 if mode == 'RGB' else 0, 0, 0, 0)
+    png = (b'\x89PNG\r\n\x1a\n' + _png_chunk(b'IHDR', header) + _png_chunk(b'IDAT', data)
+           + _png_chunk(b'IEND', b''))
+    return Image.open(io.BytesIO(png))
+
+def _downsample_image(data, filter_name, mode, size, png_predicted, new_size, jpeg_quality):
+    """
+    子进程任务：解码图片、缩小后按原来的编码方式重新压缩，返回 (数据, 编码, 新尺寸)
+    图片无法解码时返回None，保留原图
+    """
+    check_cancelled(worker_cancel_token())
+    try:
+        if filter_name == '/DCTDecode':
+            image = Image.open(io.BytesIO(data))
+            # 让JPEG解码器直接按比例缩小解码，大幅减少解码时间和内存
+            image.draft(image.mode, new_size)
+            if image.mode != mode:
+                return None
+        else:
+            image = _decode_flate_image(data, mode, size, png_predicted)
+        
+        image = image.resize(new_size, Image.Resampling.LANCZOS)
+        if filter_name == '/DCTDecode':
+            output = io.BytesIO()
+            image.save(output, "JPEG", quality=jpeg_quality, optimize=True)
+            return output.getvalue(), filter_name, new_size
+        return zlib.compress(image.tobytes()), filter_name, new_size
+    except Exception:
+        return None
+
+def _stream_with_data(stream, data, filter_name):
+    """
+    复制流对象的字典并换上新的数据和编码，字典中的间接引用保持不变，写出时再重新编号
+    """
+    new_stream = StreamObject()
+    for key, value in stream.items():
+        if key not in ('/Filter', '/DecodeParms', '/Length'):
+            new_stream[NameObject(key)] = value
+    new_stream[NameObject('/Filter')] = NameObject(filter_name)
+    new_stream._data = data
+    return new_stream
+
+def _recompressed_stream(stream):
+    """
+    未压缩或使用低效编码的流改用Flate压缩，压缩后没有变小时返回None
+    元数据流保持原样，便于其他工具直接读取
+    """
+    filters = _resolved(stream, '/Filter')
+    if _resolved(stream, '/Type') == '/Metadata' or '/DecodeParms' in stream:
+        return None
+    if filters is not None:
+        filters = list(filters) if isinstance(filters, ArrayObject) else [filters]
+        if filters == ['/FlateDecode'] or any(name not in _RECOMPRESSIBLE_FILTERS for name in filters):
+            return None
+    data = stream.get_data() if filters else stream._data
+    compressed = zlib.compress(data, 9)
+    if len(compressed) >= len(stream._data):
+        return None
+    return _stream_with_data(stream, compressed, '/FlateDecode')
+
+def optimize_pdf(input_path, output_dir, target_dpi=DEFAULT_TARGET_DPI,
+                 jpeg_quality=DEFAULT_JPEG_QUALITY, workers=None, progress=None, cancel_token=None):
+    """
+    优化PDF文件大小：
+    - 显示分辨率高于 target_dpi 的图片缩小到目标分辨率（多进程处理），JPEG图片按 jpeg_quality 重新编码
+    - 未压缩或使用ASCII/LZW编码的内容流、字体等改用Flate压缩
+    - 内容完全相同的图片、字体等对象只保留一份，未被引用的对象不会写出
+    - 字典、数组等小对象压缩到对象流中，交叉引用表写成交叉引用流
+    输出文件为 {原文件名}_optimized.pdf，结果中包含优化前后的文件大小
+    target_dpi: 图片目标分辨率，为None或0时不缩小图片
+    workers: 缩小图片的进程数，None表示使用全部CPU核心
+    progress: 可选的进度回调 (已完成数, 总数, 每秒处理数)，图片和页面各计一项
+    cancel_token: 可选的取消令牌，取消时删除写了一半的输出文件
+    """
+    written = []
+    try:
+        base_name = os.path.splitext(os.path.basename(input_path))[0]
+        output_path = os.path.join(output_dir, f"{base_name}_optimized.pdf")
+        reporter = ProgressReporter(progress)
+        
+        with open(input_path, 'rb') as input_file:
+            reader = PdfReader(input_file)
+            if reader.is_encrypted:
+                raise Exception("加密的PDF文件需要先解密")
+            
+            # 先找出分辨率过高的图片
+            tasks = []
+            task_refs = []
+            if target_dpi:
+                dpis = {}
+                for page in reader.pages:
+                    check_cancelled(cancel_token)
+                    contents = page.get('/Contents')
+                    if contents is not None:
+                        _scan_image_dpis(reader, contents.get_object(),
+                                         _resolved(page, '/Resources'), (1.0, 0.0, 0.0, 1.0), dpis)
+                for idnum, dpi in dpis.items():
+                    if dpi <= target_dpi * DOWNSAMPLE_THRESHOLD:
+                        continue
+                    args = _downsample_args(reader.get_object(idnum), dpi, target_dpi, jpeg_quality)
+                    if args is not None:
+                        tasks.append(args)
+                        task_refs.append(idnum)
+            reporter.set_total(len(tasks) + len(reader.pages))
+            
+            # 多进程缩小图片，只保留比原图小的结果
+            replacements = {}
+            if tasks:
+                workers = resolve_workers(workers, len(tasks))
+                with create_process_pool(workers, cancel_token) as executor:
+                    results = imap_ordered(executor, _downsample_image, tasks, workers * 2)
+                    for idnum, args, result in zip(task_refs, tasks, results):
+                        check_cancelled(cancel_token)
+                        if result is not None and len(result[0]) < len(args[0]):
+                            replacements[idnum] = result
+                        reporter.advance()
+            
+            recompressed = []
+            
+            def transform(source_ref, stream):
+                replacement = replacements.get(source_ref.idnum)
+                if replacement is not None:
+                    data, filter_name, (width, height) = replacement
+                    new_stream = _stream_with_data(stream, data, filter_name)
+                    new_stream[NameObject('/Width')] = NumberObject(width)
+                    new_stream[NameObject('/Height')] = NumberObject(height)
+                    return new_stream
+                if _resolved(stream, '/Subtype') != '/Image':
+                    new_stream = _recompressed_stream(stream)
+                    if new_stream is not None:
+                        recompressed.append(source_ref.idnum)
+                        return new_stream
+                return stream
+            
+            def on_page():
+                check_cancelled(cancel_token)
+                reporter.advance()
+            
+            written.append(output_path)
+            with open(output_path, 'wb') as output_file:
+                writer = StreamingPdfWriter(output_file, deduplicate=True, object_streams=True)
+                writer.import_pages(reader, page_callback=on_page, document_entries=True,
+                                    stream_transform=transform)
+                writer.close()
+        reporter.finish()
+        
+        size_change = describe_size_change(os.path.getsize(input_path), os.path.getsize(output_path))
+        image_note = f"（目标 {target_dpi} DPI）" if target_dpi else ""
+        return (f"PDF优化完成！缩小图片 {len(replacements)} 张{image_note}，"
+                f"重新压缩数据流 {len(recompressed)} 个，合并重复对象 {writer.duplicate_count} 个，"
+                f"文件大小 {size_change}。文件保存为: {output_path}")
+        
+    except OperationCancelled:
+        remove_outputs(written)
+        raise
+    except Exception as e:
+        raise Exception(f"PDF优化失败: {str(e)}")
@@ -4,40 +4,20 @@
 import os
 import tempfile
 import subprocess
-from pdf2image import convert_from_path
+from pdf_to_image import (get_poppler_path, render_pages_to_files, resolve_backend,
+                          DEFAULT_RENDER_BACKEND)
+from cancellation import OperationCancelled
+from pdf_session import document_session
 
-def find_poppler_path():
-    """
-    动态查找Poppler的bin目录
-    尝试多个常见安装位置
-    """
-    # 常见的Poppler安装路径列表
-    possible_paths = [
-        r'C:\poppler\Library\bin',                # 我们推荐的路径
-        r'C:\poppler\bin',                       # 可能的解压路径
-        r'C:\Program Files\poppler\Library\bin', # 程序文件目录
-        r'C:\Program Files (x86)\poppler\Library\bin',
-        r'D:\poppler\Library\bin',              # D盘可能的路径
-    ]
-    
-    # 尝试每个可能的路径
-    for path in possible_paths:
-        if os.path.exists(path):
-            # 检查是否包含必要的可执行文件
-            required_files = ['pdftoppm.exe', 'pdftocairo.exe']
-            if all(os.path.exists(os.path.join(path, f)) for f in required_files):
-                print(f"找到Poppler路径: {path}")
-                return path
-    
-    print("未找到有效的Poppler路径")
-    return None
-
-# 自动检测Poppler路径，如果找不到则使用None（尝试使用系统PATH）
-POPPLER_PATH = find_poppler_path()
-
-def preview_pdf(input_path, output_dir=None, pages=None, dpi=150):
+def preview_pdf(input_path, output_dir=None, pages=None, dpi=150, workers=1,
+                backend=DEFAULT_RENDER_BACKEND, progress=None, cancel_token=None):
     """
     生成PDF文件的预览图片
+    pages: 可选，预览的页码范围 (起始页, 结束页)
+    workers: 并行渲染的进程数，None表示使用全部CPU核心
+    backend: 渲染后端，auto（默认，优先PyMuPDF在当前进程中渲染）、pdf2image 或 fitz
+    progress: 可选的进度回调 (已完成页数, 总页数, 每秒页数)
+    cancel_token: 可选的取消令牌，取消时删除已生成的预览图片
     """
     try:
         # 获取原文件名（不含扩展名）
@@ -51,35 +31,39 @@ def preview_pdf(input_path, output_dir=None, pages=None, dpi=150):
         output_folder = os.path.join(output_dir, f"{base_name}_preview")
         os.makedirs(output_folder, exist_ok=True)
         
-        # 转换PDF为图片
-        print(f"正在尝试使用Poppler路径: {POPPLER_PATH}")
-        print(f"检查路径是否存在: {os.path.exists(POPPLER_PATH) if POPPLER_PATH else '使用系统PATH'}")
-        if POPPLER_PATH and os.path.exists(POPPLER_PATH):
-            print(f"Poppler路径内容: {os.listdir(POPPLER_PATH)[:5]}...")
-        
-        if pages:
-            images = convert_from_path(input_path, dpi=dpi, first_page=pages[0], last_page=pages[1], poppler_path=POPPLER_PATH)
-        else:
-            images = convert_from_path(input_path, dpi=dpi, poppler_path=POPPLER_PATH)  # 传入poppler路径
-        
-        # 保存预览图片
-        preview_files = []
-        for i, image in enumerate(images):
-            output_path = os.path.join(output_folder, f"{base_name}_preview_{i + 1}.jpg")
-            image.save(output_path, 'JPEG', quality=85)
-            preview_files.append(output_path)
+        # 转换PDF为图片，只有pdf2image后端需要Poppler
+        backend = resolve_backend(backend)
+        if backend == 'pdf2image':
+            poppler_path = get_poppler_path()
+            print(f"正在尝试使用Poppler路径: {poppler_path}")
+            print(f"检查路径是否存在: {os.path.exists(poppler_path) if poppler_path else '使用系统PATH'}")
+            if poppler_path and os.path.exists(poppler_path):
+                print(f"Poppler路径内容: {os.listdir(poppler_path)[:5]}...")
+        
+        # 渲染并保存预览图片
+        first_page, last_page = pages if pages else (1, None)
+        preview_files = render_pages_to_files(input_path, output_folder,
+                                              f"{base_name}_preview_", 'jpg',
+                                              dpi=dpi, fmt='JPEG', quality=85,
+                                              first_page=first_page, last_page=last_page,
+                                              workers=workers, number_by_index=True,
+                                              backend=backend, progress=progress,
+                                              cancel_token=cancel_token)
         
         # 打开第一张预览图片
         if preview_files:
             open_preview_image(preview_files[0])
         
-        return f"PDF预览生成完成！共生成 {len(images)} 张预览图片"
+        return f"PDF预览生成完成！共生成 {len(preview_files)} 张预览图片"
         
+    except OperationCancelled:
+        raise
     except Exception as e:
         error_msg = str(e)
         # 检测是否是Poppler未找到的错误
         if "Unable to get page count" in error_msg or "poppler" in error_msg.lower():
-            detected_path_info = f"检测到的Poppler路径: {POPPLER_PATH}" if POPPLER_PATH else "未检测到Poppler路径"
+            poppler_path = get_poppler_path()
+            detected_path_info = f"检测到的Poppler路径: {poppler_path}" if poppler_path else "未检测到Poppler路径"
             raise Exception(
                 f"PDF预览失败: {error_msg}\n\n"  
                 f"{detected_path_info}\n\n"  
@@ -114,23 +98,23 @@ def open_preview_image(image_path):
 def get_pdf_info(input_path):
     """
     获取PDF文件的基本信息
+    使用文档会话中的PyPDF2读取器，之后对同一文件的其他操作不必重新解析
     """
     try:
-        from PyPDF2 import PdfReader
-        
-        reader = PdfReader(input_path)
-        info = reader.metadata
-        
-        result = {
-            '页数': len(reader.pages),
-            '标题': getattr(info, 'title', '未知'),
-            '作者': getattr(info, 'author', '未知'),
-            '创建者': getattr(info, 'creator', '未知'),
-            '制作工具': getattr(info, 'producer', '未知'),
-            '创建日期': getattr(info, 'creation_date', '未知'),
-            '修改日期': getattr(info, 'modification_date', '未知'),
-            '是否加密': reader.is_encrypted
-        }
+        with document_session(input_path) as session:
+            reader = session.reader
+            info = reader.metadata
+            
+            result = {
+                '页数': len(reader.pages),
+                '标题': getattr(info, 'title', '未知'),
+                '作者': getattr(info, 'author', '未知'),
+                '创建者': getattr(info, 'creator', '未知'),
+                '制作工具': getattr(info, 'producer', '未知'),
+                '创建日期': getattr(info, 'creation_date', '未知'),
+                '修改日期': getattr(info, 'modification_date', '未知'),
+                '是否加密': reader.is_encrypted
+            }
         
         info_text = "PDF文件信息:\n"
         for key, value in result.items():
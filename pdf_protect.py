@@ -3,11 +3,17 @@
 
 import os
 from PyPDF2 import PdfReader, PdfWriter
+from progress import ProgressReporter
+from cancellation import OperationCancelled, check_cancelled, remove_outputs
 
-def protect_pdf(input_path, output_dir, password, owner_password=None):
+def protect_pdf(input_path, output_dir, password, owner_password=None, progress=None,
+                cancel_token=None):
     """
     为PDF文件添加密码保护
+    progress: 可选的进度回调，按页上报，写入加密文件计为最后一步
+    cancel_token: 可选的取消令牌，取消时不会留下写了一半的输出文件
     """
+    written = []
     try:
         # 获取原文件名（不含扩展名）
         base_name = os.path.splitext(os.path.basename(input_path))[0]
@@ -20,8 +26,11 @@ def protect_pdf(input_path, output_dir, password, owner_password=None):
         writer = PdfWriter()
         
         # 添加所有页面
+        reporter = ProgressReporter(progress, len(reader.pages) + 1)
         for page in reader.pages:
+            check_cancelled(cancel_token)
             writer.add_page(page)
+            reporter.advance()
         
         # 添加密码保护
         if owner_password:
@@ -31,17 +40,24 @@ def protect_pdf(input_path, output_dir, password, owner_password=None):
             writer.encrypt(user_password=password, use_128bit=True)
         
         # 保存加密后的PDF
+        check_cancelled(cancel_token)
+        written.append(output_path)
         with open(output_path, 'wb') as output_file:
             writer.write(output_file)
+        reporter.finish()
         
         return f"PDF保护完成！文件已加密保存为: {output_path}"
         
+    except OperationCancelled:
+        remove_outputs(written)
+        raise
     except Exception as e:
         raise Exception(f"PDF保护失败: {str(e)}")
 
-def remove_pdf_protection(input_path, output_dir, password):
+def remove_pdf_protection(input_path, output_dir, password, progress=None):
     """
     移除PDF文件的密码保护
+    progress: 可选的进度回调，按页上报，写入文件计为最后一步
     """
     try:
         base_name = os.path.splitext(os.path.basename(input_path))[0]
@@ -55,21 +71,25 @@ def remove_pdf_protection(input_path, output_dir, password):
         writer = PdfWriter()
         
         # 添加所有页面
+        reporter = ProgressReporter(progress, len(reader.pages) + 1)
         for page in reader.pages:
             writer.add_page(page)
+            reporter.advance()
         
         # 保存未加密的PDF
         with open(output_path, 'wb') as output_file:
             writer.write(output_file)
+        reporter.finish()
         
         return f"PDF解密完成！文件已保存为: {output_path}"
         
     except Exception as e:
         raise Exception(f"PDF解密失败: {str(e)}")
 
-def set_pdf_permissions(input_path, output_dir, password, permissions=None):
+def set_pdf_permissions(input_path, output_dir, password, permissions=None, progress=None):
     """
     设置PDF文件的详细权限
+    progress: 可选的进度回调，按页上报，写入文件计为最后一步
     """
     if permissions is None:
         permissions = {
@@ -89,8 +109,10 @@ def set_pdf_permissions(input_path, output_dir, password, permissions=None):
         reader = PdfReader(input_path)
         writer = PdfWriter()
         
+        reporter = ProgressReporter(progress, len(reader.pages) + 1)
         for page in reader.pages:
             writer.add_page(page)
+            reporter.advance()
         
         # 设置权限
         writer.encrypt(
@@ -101,6 +123,7 @@ def set_pdf_permissions(input_path, output_dir, password, permissions=None):
         
         with open(output_path, 'wb') as output_file:
             writer.write(output_file)
+        reporter.finish()
         
         return f"PDF权限设置完成！文件已保存为: {output_path}"
         
@@ -0,0 +1,241 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import os
+import itertools
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+
+# 所有会话占用内存的估算上限，超出后从最久未使用的会话开始逐个关闭句柄
+MAX_SESSION_BYTES = 512 * 1024 * 1024
+
+# 估算内存占用时 pdfplumber、PyMuPDF 句柄（按需读取并缓存解析出的对象）按文件大小的该比例计；
+# PyPDF2 读取器会把整个文件读入内存，按文件大小计
+HANDLE_COST_RATIO = 0.5
+
+# 会话中的句柄（属性名）
+_HANDLE_NAMES = ('_reader', '_plumber', '_fitz')
+
+_lock = threading.Lock()
+_stats = {'hits': 0, 'misses': 0, 'evictions': 0}
+
+# 句柄最近使用的先后顺序
+_clock = itertools.count()
+
+# 按最近使用顺序排列的会话，键为文件的绝对路径，最久未使用的在最前面
+_sessions = OrderedDict()
+
+class DocumentSession:
+    """
+    一个PDF文件的文档会话
+    按需打开 PyPDF2 读取器、pdfplumber 文档和 PyMuPDF 文档，打开后在多次操作之间复用，
+    同一文件依次执行获取信息、提取文本、提取图片等操作时只解析一次
+    句柄直接按路径打开，内存占用与直接打开文件相同，进程池中的每个子进程也不会多复制一份文件；
+    pdfplumber、PyMuPDF 句柄打开期间占用文件，Windows下覆盖或删除该文件之前需调用
+    close_document()（界面切换文件和退出时会关闭）
+    会话通过 document_session() 获取，文件大小或修改时间变化后自动重新打开
+    """
+
+    def __init__(self, path, stat):
+        self.path = path
+        self.file_key = (stat.st_size, stat.st_mtime_ns)
+        self.file_size = stat.st_size
+        # 三种句柄都不是线程安全的，同一会话同时只允许一个线程使用
+        self.lock = threading.RLock()
+        # 正在使用该会话的次数，大于0时不会被淘汰，由全局锁保护
+        self.users = 0
+        self._reader = None
+        self._plumber = None
+        self._fitz = None
+        # 句柄属性名 -> 最近使用的时间序号
+        self._last_used = {}
+
+    @property
+    def reader(self):
+        """
+        PyPDF2 的 PdfReader
+        """
+        self._last_used['_reader'] = next(_clock)
+        if self._reader is None:
+            from PyPDF2 import PdfReader
+            self._reader = PdfReader(self.path)
+            _evict()
+        return self._reader
+
+    @property
+    def plumber(self):
+        """
+        pdfplumber 文档，逐页使用后应调用 page.flush_cache() 释放版面分析缓存
+        """
+        self._last_used['_plumber'] = next(_clock)
+        if self._plumber is None:
+            import pdfplumber
+            self._plumber = pdfplumber.open(self.path)
+            _evict()
+        return self._plumber
+
+    @property
+    def fitz(self):
+        """
+        PyMuPDF 文档
+        """
+        self._last_used['_fitz'] = next(_clock)
+        if self._fitz is None:
+            import fitz  # PyMuPDF
+            self._fitz = fitz.open(self.path)
+            _evict()
+        return self._fitz
+
+    @property
+    def page_count(self):
+        """
+        总页数，优先使用已经打开的句柄
+        """
+        if self._fitz is not None:
+            return len(self._fitz)
+        if self._plumber is not None:
+            return len(self._plumber.pages)
+        return len(self.reader.pages)
+
+    def open_handles(self):
+        """
+        已打开的句柄属性名，最久未使用的在前
+        """
+        names = [name for name in _HANDLE_NAMES if getattr(self, name) is not None]
+        return sorted(names, key=lambda name: self._last_used.get(name, -1))
+
+    @property
+    def estimated_bytes(self):
+        # 粗略估算：PyPDF2 读取器按文件大小计，其他句柄按文件大小的一部分计
+        total = 0
+        for name in self.open_handles():
+            total += self.file_size if name == '_reader' else self.file_size * HANDLE_COST_RATIO
+        return int(total)
+
+    def close_handle(self, name):
+        """
+        关闭一个句柄，之后再访问时重新打开
+        """
+        handle = getattr(self, name)
+        if handle is not None and name != '_reader':
+            handle.close()
+        setattr(self, name, None)
+
+    def close(self):
+        """
+        关闭所有已打开的句柄，之后再访问时重新打开
+        """
+        for name in _HANDLE_NAMES:
+            self.close_handle(name)
+
+def _acquire(input_path):
+    path = os.path.abspath(input_path)
+    stat = os.stat(path)
+    file_key = (stat.st_size, stat.st_mtime_ns)
+    with _lock:
+        session = _sessions.get(path)
+        if session is not None and session.file_key != file_key:
+            # 文件已被修改，旧会话不再复用，正在使用的由最后一个使用者关闭
+            del _sessions[path]
+            if session.users == 0:
+                session.close()
+            session = None
+
+        if session is None:
+            session = DocumentSession(path, stat)
+            _sessions[path] = session
+            _stats['misses'] += 1
+        else:
+            _sessions.move_to_end(path)
+            _stats['hits'] += 1
+        session.users += 1
+        return session
+
+def _release(session):
+    with _lock:
+        session.users -= 1
+        if session.users == 0 and _sessions.get(session.path) is not session:
+            session.close()
+    _evict()
+
+def _evict():
+    """
+    估算的内存占用超过上限时，从最久未使用的会话开始逐个关闭句柄（会话内最久未使用的先关闭），
+    句柄全部关闭的会话随之移除
+    正在使用的会话和最近使用的会话（通常是刚用完、接下来最可能再用的文件）不关闭，
+    因此只处理一个大文件时，即使超过上限也不会反复重新解析
+    """
+    with _lock:
+        total = sum(session.estimated_bytes for session in _sessions.values())
+        for session in list(_sessions.values())[:-1]:
+            if total <= MAX_SESSION_BYTES:
+                break
+            if session.users:
+                continue
+            for name in session.open_handles():
+                if total <= MAX_SESSION_BYTES:
+                    break
+                before = session.estimated_bytes
+                session.close_handle(name)
+                total -= before - session.estimated_bytes
+                _stats['evictions'] += 1
+            if not session.open_handles():
+                del _sessions[session.path]
+
+@contextmanager
+def document_session(input_path):
+    """
+    获取文件的文档会话，在 with 语句内使用，期间该会话不会被其他线程使用或被淘汰
+
+    用法:
+        with document_session(input_path) as session:
+            reader = session.reader
+    """
+    session = _acquire(input_path)
+    try:
+        with session.lock:
+            yield session
+    finally:
+        _release(session)
+
+def close_document(input_path):
+    """
+    关闭指定文件的会话，例如在覆盖或删除该文件之前（Windows下打开的文件无法删除）
+    """
+    path = os.path.abspath(input_path)
+    with _lock:
+        session = _sessions.pop(path, None)
+        if session is not None and session.users == 0:
+            session.close()
+
+def close_all():
+    """
+    关闭所有会话
+    """
+    with _lock:
+        sessions = list(_sessions.values())
+        _sessions.clear()
+        for session in sessions:
+            if session.users == 0:
+                session.close()
+
+def get_stats():
+    """
+    返回会话命中、未命中和淘汰次数，以及当前会话数和估算的内存占用
+    """
+    with _lock:
+        stats = dict(_stats)
+        stats['sessions'] = len(_sessions)
+        stats['estimated_bytes'] = sum(session.estimated_bytes for session in _sessions.values())
+        return stats
+
+def _forget_sessions_in_child():
+    # fork出的子进程与父进程共享文件描述符和读写位置，子进程不能使用继承来的句柄；
+    # fork时其他线程可能正持有锁，子进程中换一把新锁
+    global _lock
+    _lock = threading.Lock()
+    _sessions.clear()
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_forget_sessions_in_child)
@@ -1,64 +1,524 @@
 #!/usr/bin/env python3
 # -*- coding: utf-8 -*-
 
+import io
 import os
-from PyPDF2 import PdfReader, PdfWriter
+import re
+from concurrent.futures import ThreadPoolExecutor
+from PyPDF2 import PdfReader, PdfWriter, PageObject
+from PyPDF2.generic import ArrayObject, DictionaryObject, IndirectObject, NameObject, StreamObject
+from parallel import imap_ordered
+from progress import ProgressReporter
+from cancellation import OperationCancelled, check_cancelled, remove_outputs
 
-def split_pdf(input_path, output_dir):
+# 并行写出拆分文件的线程数
+WRITE_THREADS = 4
+
+# 按名称引用的资源类别，只保留页面内容流中用到的条目
+_PRUNABLE_RESOURCES = ('/Font', '/XObject', '/ExtGState', '/ColorSpace', '/Pattern',
+                       '/Shading', '/Properties')
+
+# 内容流中的名称对象，例如 /F1、/Im0
+_NAME_PATTERN = re.compile(rb'/([^\s/\[\]()<>{}%]*)')
+_NAME_ESCAPE = re.compile(rb'#([0-9a-fA-F]{2})')
+
+# 按大小拆分时估算的每个对象、每页和每个文件的额外字节数（对象头、交叉引用表等）
+OBJECT_OVERHEAD = 64
+PAGE_OVERHEAD = 256
+FILE_OVERHEAD = 1024
+
+# 估算页面大小时不跟随的键，避免从注释或链接走到其他页面
+_ESTIMATE_SKIP_KEYS = ('/Parent', '/P', '/Dest', '/D', '/A')
+
+# 判断空白页：内容流中的字符串、十六进制串和名称先去掉，剩下的字母记号是操作符
+_NON_OPERATOR_PATTERN = re.compile(rb'\((?:\\.|[^\\()])*\)|<[0-9A-Fa-f\s]*>|/[^\s/\[\]()<>{}%]*')
+_TOKEN_SEPARATOR = re.compile(rb'[\s\[\]{}<>()]+')
+
+# 出现这些操作符说明页面上有文字、矢量图形或内嵌图片
+_MARKING_OPERATORS = {b'Tj', b'TJ', b"'", b'"', b'f', b'F', b'f*', b'B', b'B*', b'b', b'b*',
+                      b'S', b's', b'sh', b'BI'}
+
+# 扫描件中的图片压缩后大小与原始像素数据之比低于该值时视为空白
+BLANK_COMPRESSION_RATIO = 0.02
+
+_COLOR_COMPONENTS = {'/DeviceGray': 1, '/CalGray': 1, '/DeviceRGB': 3, '/CalRGB': 3,
+                     '/Lab': 3, '/DeviceCMYK': 4, '/Indexed': 1}
+
+def _content_data(page):
+    """
+    返回页面内容流解码后的数据
+    """
+    contents = page.get('/Contents')
+    if contents is None:
+        return b''
+    # 内容可以是单个流，也可以是流的数组
+    contents = contents.get_object()
+    streams = contents if isinstance(contents, ArrayObject) else [contents]
+    return b'\n'.join(stream.get_object().get_data() for stream in streams)
+
+def _content_names(page, data=None):
+    """
+    返回页面内容流中出现的所有名称
+    """
+    if data is None:
+        data = _content_data(page)
+    
+    names = set()
+    for raw in set(_NAME_PATTERN.findall(data)):
+        raw = _NAME_ESCAPE.sub(lambda match: bytes([int(match.group(1), 16)]), raw)
+        # 名称的编码不确定，两种解码结果都保留
+        names.add('/' + raw.decode('utf-8', 'replace'))
+        names.add('/' + raw.decode('latin-1'))
+    return names
+
+def _pruned_page(page):
+    """
+    返回只引用内容流中用到的资源的页面副本，原页面不受影响
+    很多PDF的所有页面共用一个包含全部字体和图片的资源字典，
+    不裁剪的话每个拆分文件都会带上整份文档的字体和图片
+    """
+    resources = page.get('/Resources')
+    if resources is None:
+        return page
+    resources = resources.get_object()
+    names = _content_names(page)
+    
+    pruned = DictionaryObject()
+    for key, value in resources.items():
+        category = value.get_object()
+        if key in _PRUNABLE_RESOURCES and isinstance(category, DictionaryObject):
+            kept = DictionaryObject()
+            for name, resource in category.items():
+                if name not in names:
+                    continue
+                # 没有自己资源字典的表单对象会使用页面的资源，这种页面不做裁剪
+                resource_object = resource.get_object()
+                if (key == '/XObject' and isinstance(resource_object, DictionaryObject)
+                        and resource_object.get('/Subtype') == '/Form'
+                        and '/Resources' not in resource_object):
+                    return page
+                kept[name] = resource
+            if not kept:
+                continue
+            value = kept
+        pruned[key] = value
+    
+    # 沿用原页面的对象编号，注释中指向原页面的 /P 引用会对应到新页面
+    new_page = PageObject(page.pdf, page.indirect_reference)
+    new_page.update(page)
+    new_page[NameObject('/Resources')] = pruned
+    return new_page
+
+def _stream_length(stream):
+    length = stream.get('/Length')
+    if length is not None:
+        return int(length.get_object())
+    return len(stream.get_data())
+
+def _page_object_sizes(page):
+    """
+    估算页面引用的每个间接对象写出后的字节数，返回 {对象编号: 字节数}
+    只读取对象字典中的 /Length，不解码也不试写
+    """
+    sizes = {}
+    stack = [value for key, value in page.items() if key not in _ESTIMATE_SKIP_KEYS]
+    while stack:
+        obj = stack.pop()
+        if isinstance(obj, IndirectObject):
+            if obj.idnum in sizes:
+                continue
+            target = obj.get_object()
+            if isinstance(target, DictionaryObject) and target.get('/Type') == '/Page':
+                continue
+            size = OBJECT_OVERHEAD
+            if isinstance(target, StreamObject):
+                size += _stream_length(target)
+            sizes[obj.idnum] = size
+            obj = target
+        if isinstance(obj, DictionaryObject):
+            stack.extend(value for key, value in obj.items() if key not in _ESTIMATE_SKIP_KEYS)
+        elif isinstance(obj, ArrayObject):
+            stack.extend(obj)
+    return sizes
+
+def iter_size_groups(reader, max_bytes, reporter=None, cancel_token=None):
+    """
+    按估算大小对页面分组，逐组返回页面索引列表，只顺序遍历一次页面
+    同一组中多个页面共用的对象只计算一次；单页超过上限时单独成为一组
+    """
+    group = []
+    seen = set()
+    group_size = FILE_OVERHEAD
+    for page_index, page in enumerate(reader.pages):
+        check_cancelled(cancel_token)
+        sizes = _page_object_sizes(_pruned_page(page))
+        page_size = PAGE_OVERHEAD + sum(size for idnum, size in sizes.items() if idnum not in seen)
+        
+        if group and group_size + page_size > max_bytes:
+            yield group
+            group = []
+            seen = set()
+            group_size = FILE_OVERHEAD
+            page_size = PAGE_OVERHEAD + sum(sizes.values())
+        
+        group.append(page_index)
+        seen.update(sizes)
+        group_size += page_size
+        if reporter is not None:
+            reporter.advance()
+    
+    if group:
+        yield group
+
+def _image_compression_ratio(image):
+    """
+    图片压缩后大小与原始像素数据大小之比，无法计算时返回None
+    """
+    try:
+        width = int(image['/Width'])
+        height = int(image['/Height'])
+        if image.get('/ImageMask'):
+            bits_per_pixel = 1
+        else:
+            color_space = image.get('/ColorSpace', NameObject('/DeviceRGB')).get_object()
+            if isinstance(color_space, ArrayObject):
+                family = color_space[0]
+                if family == '/ICCBased':
+                    components = int(color_space[1].get_object().get('/N', 3))
+                else:
+                    components = _COLOR_COMPONENTS.get(family, 3)
+            else:
+                components = _COLOR_COMPONENTS.get(color_space, 3)
+            bits_per_pixel = int(image.get('/BitsPerComponent', 8)) * components
+    except (KeyError, TypeError, ValueError, IndexError):
+        return None
+    
+    raw_size = width * height * bits_per_pixel / 8
+    if raw_size <= 0:
+        return None
+    return _stream_length(image) / raw_size
+
+def is_blank_page(page, max_compression_ratio=BLANK_COMPRESSION_RATIO):
+    """
+    判断页面是否为空白页（例如扫描件中插入的分隔页）
+    没有文字和矢量图形，且绘制的图片压缩率都很高（几乎全白）时视为空白
+    只读取内容流和图片字典，不解码图片
+    """
+    data = _content_data(page)
+    tokens = set(_TOKEN_SEPARATOR.split(_NON_OPERATOR_PATTERN.sub(b' ', data)))
+    if tokens & _MARKING_OPERATORS:
+        return False
+    if b'Do' not in tokens:
+        return True
+    
+    resources = page.get('/Resources')
+    xobjects = resources.get_object().get('/XObject') if resources is not None else None
+    if xobjects is None:
+        return True
+    xobjects = xobjects.get_object()
+    
+    for name in _content_names(page, data):
+        xobject = xobjects.get(name)
+        if xobject is None:
+            continue
+        xobject = xobject.get_object()
+        if xobject.get('/Subtype') != '/Image':
+            return False
+        ratio = _image_compression_ratio(xobject)
+        if ratio is None or ratio > max_compression_ratio:
+            return False
+    return True
+
+def iter_blank_separated_groups(reader, max_compression_ratio=BLANK_COMPRESSION_RATIO,
+                                reporter=None, cancel_token=None):
+    """
+    以空白页为分隔对页面分组，逐组返回页面索引列表，空白页本身不输出
+    """
+    group = []
+    for page_index, page in enumerate(reader.pages):
+        check_cancelled(cancel_token)
+        if is_blank_page(page, max_compression_ratio):
+            if group:
+                yield group
+            group = []
+        else:
+            group.append(page_index)
+        if reporter is not None:
+            reporter.advance()
+    
+    if group:
+        yield group
+
+def bookmark_page_groups(reader):
+    """
+    按顶层书签对页面分组，返回 [(书签标题, 页面索引列表)]
+    第一个书签之前的页面单独成为一组，标题为None
+    """
+    page_count = len(reader.pages)
+    starts = {}
+    for item in reader.outline:
+        # 嵌套列表是上一个书签的子书签
+        if isinstance(item, list):
+            continue
+        try:
+            page_index = reader.get_destination_page_number(item)
+        except Exception:
+            continue
+        if page_index is not None and 0 <= page_index < page_count:
+            starts.setdefault(page_index, str(item.title))
+    
+    if not starts:
+        raise Exception("PDF文件中没有可用的书签")
+    
+    boundaries = sorted(starts)
+    groups = []
+    if boundaries[0] > 0:
+        groups.append((None, list(range(0, boundaries[0]))))
+    for i, start in enumerate(boundaries):
+        end = boundaries[i + 1] if i + 1 < len(boundaries) else page_count
+        groups.append((starts[start], list(range(start, end))))
+    return groups
+
+def _safe_file_name(title):
+    """
+    把书签标题转换为可用作文件名的文本
+    """
+    name = re.sub(r'[\\/:*?"<>|\s]+', '_', title).strip('._')
+    return name[:80]
+
+def _serialize_part(reader, page_indexes, prune_resources=True):
+    """
+    把指定页面写成一个PDF文件的内容（字节串）
+    同一输出文件中多个页面共用的字体、图片只写入一次
+    """
+    writer = PdfWriter()
+    for page_index in page_indexes:
+        page = reader.pages[page_index]
+        writer.add_page(_pruned_page(page) if prune_resources else page)
+    
+    buffer = io.BytesIO()
+    writer.write(buffer)
+    return buffer.getvalue()
+
+def _write_file(output_path, data):
+    with open(output_path, 'wb') as output_file:
+        output_file.write(data)
+    return output_path
+
+def write_page_groups(reader, page_groups, output_paths, threads=WRITE_THREADS,
+                      prune_resources=True, reporter=None, cancel_token=None, written=None):
+    """
+    把源文件的页面分组写出为多个PDF文件，源文件只解析一次
+    page_groups: 每个输出文件包含的页面索引（从0开始）列表，
+                 可以是生成器，写出前一组后才取下一组
+    output_paths: 与 page_groups 一一对应的输出路径，同样可以是生成器
+    threads: 写文件的线程数，PDF内容在当前线程生成（PdfReader不是线程安全的），
+             写盘在线程池中进行，同时在途的文件不超过 threads * 2 个
+    prune_resources: 每页只保留内容流中用到的资源
+    written: 可选列表，每个开始写出的文件路径会加入其中，用于取消时清理
+    """
+    def iter_tasks():
+        for page_indexes, output_path in zip(page_groups, output_paths):
+            check_cancelled(cancel_token)
+            data = _serialize_part(reader, page_indexes, prune_resources)
+            if written is not None:
+                written.append(output_path)
+            yield output_path, data
+    
+    threads = max(1, int(threads))
+    if threads == 1:
+        for output_path, data in iter_tasks():
+            _write_file(output_path, data)
+            if reporter is not None:
+                reporter.advance()
+        return
+    
+    with ThreadPoolExecutor(max_workers=threads) as executor:
+        for _ in imap_ordered(executor, _write_file, iter_tasks(), threads * 2):
+            if reporter is not None:
+                reporter.advance()
+
+def _part_paths(output_dir, base_name):
+    """
+    依次生成 {base_name}_part_{编号}.pdf 形式的输出路径
+    """
+    number = 0
+    while True:
+        number += 1
+        yield os.path.join(output_dir, f"{base_name}_part_{number}.pdf")
+
+def parse_page_range(page_range, page_count=None):
+    """
+    解析页码范围字符串，"1-3" 或 "5"，返回页面索引列表（从0开始）
+    """
+    if '-' in page_range:
+        start, end = map(int, page_range.split('-'))
+    else:
+        start = end = int(page_range)
+    if start < 1 or end < start or (page_count is not None and end > page_count):
+        raise Exception(f"无效的页码范围: {page_range}")
+    return list(range(start - 1, end))
+
+def split_pdf(input_path, output_dir, threads=WRITE_THREADS, progress=None, cancel_token=None):
     """
     拆分PDF文件的每一页为单独的PDF文件
+    threads: 并行写出文件的线程数
+    progress: 可选的进度回调 (已完成页数, 总页数, 每秒页数)
+    cancel_token: 可选的取消令牌，取消时删除已拆分出的文件
     """
+    written = []
     try:
         # 读取PDF文件
         reader = PdfReader(input_path)
         total_pages = len(reader.pages)
+        reporter = ProgressReporter(progress, total_pages)
         
         # 获取原文件名（不含扩展名）
         base_name = os.path.splitext(os.path.basename(input_path))[0]
         
         # 创建输出目录
         output_folder = os.path.join(output_dir, f"{base_name}_split")
-        os.makedirs(output_folder, exist_ok=True)
+        if not os.path.isdir(output_folder):
+            os.makedirs(output_folder)
+            written.append(output_folder)
         
         # 拆分每一页
-        for page_num in range(total_pages):
-            writer = PdfWriter()
-            writer.add_page(reader.pages[page_num])
-            
-            output_path = os.path.join(output_folder, f"{base_name}_page_{page_num + 1}.pdf")
-            with open(output_path, 'wb') as output_file:
-                writer.write(output_file)
+        page_groups = [[page_num] for page_num in range(total_pages)]
+        output_paths = [os.path.join(output_folder, f"{base_name}_page_{page_num + 1}.pdf")
+                        for page_num in range(total_pages)]
+        write_page_groups(reader, page_groups, output_paths, threads=threads,
+                          reporter=reporter, cancel_token=cancel_token, written=written)
         
+        reporter.finish()
         return f"PDF拆分完成！共拆分 {total_pages} 页，文件保存在: {output_folder}"
         
+    except OperationCancelled:
+        remove_outputs(written)
+        raise
     except Exception as e:
         raise Exception(f"PDF拆分失败: {str(e)}")
 
-def split_pdf_by_range(input_path, output_dir, page_ranges):
+def split_pdf_by_range(input_path, output_dir, page_ranges, threads=WRITE_THREADS, progress=None,
+                       cancel_token=None):
     """
     按指定范围拆分PDF文件
     page_ranges: 例如 ["1-3", "5-7", "9-12"]
+    threads: 并行写出文件的线程数
+    progress: 可选的进度回调 (已完成文件数, 总文件数, 每秒文件数)
+    cancel_token: 可选的取消令牌，取消时删除已生成的文件
     """
+    written = []
     try:
         reader = PdfReader(input_path)
         base_name = os.path.splitext(os.path.basename(input_path))[0]
+        reporter = ProgressReporter(progress, len(page_ranges))
         
-        for i, page_range in enumerate(page_ranges):
-            writer = PdfWriter()
-            
-            if '-' in page_range:
-                start, end = map(int, page_range.split('-'))
-                for page_num in range(start - 1, end):
-                    writer.add_page(reader.pages[page_num])
-            else:
-                page_num = int(page_range) - 1
-                writer.add_page(reader.pages[page_num])
-            
-            output_path = os.path.join(output_dir, f"{base_name}_part_{i + 1}.pdf")
-            with open(output_path, 'wb') as output_file:
-                writer.write(output_file)
+        page_count = len(reader.pages)
+        page_groups = [parse_page_range(page_range, page_count) for page_range in page_ranges]
+        output_paths = [os.path.join(output_dir, f"{base_name}_part_{i + 1}.pdf")
+                        for i in range(len(page_ranges))]
+        write_page_groups(reader, page_groups, output_paths, threads=threads,
+                          reporter=reporter, cancel_token=cancel_token, written=written)
         
+        reporter.finish()
         return f"PDF按范围拆分完成！共生成 {len(page_ranges)} 个文件"
         
+    except OperationCancelled:
+        remove_outputs(written)
+        raise
     except Exception as e:
         raise Exception(f"PDF按范围拆分失败: {str(e)}")
+
+def split_pdf_by_size(input_path, output_dir, max_size_mb=10, threads=WRITE_THREADS, progress=None,
+                      cancel_token=None):
+    """
+    按目标大小拆分PDF文件，每个文件不超过 max_size_mb（单页超过上限时单独成为一个文件）
+    文件大小根据页面引用对象的长度估算，不需要试写；边估算边写出，只遍历一次页面
+    progress: 可选的进度回调 (已处理页数, 总页数, 每秒页数)
+    cancel_token: 可选的取消令牌，取消时删除已生成的文件
+    """
+    written = []
+    try:
+        if max_size_mb <= 0:
+            raise Exception("目标大小必须大于0")
+        
+        reader = PdfReader(input_path)
+        base_name = os.path.splitext(os.path.basename(input_path))[0]
+        reporter = ProgressReporter(progress, len(reader.pages))
+        
+        page_groups = iter_size_groups(reader, max_size_mb * 1024 * 1024, reporter, cancel_token)
+        write_page_groups(reader, page_groups, _part_paths(output_dir, base_name), threads=threads,
+                          cancel_token=cancel_token, written=written)
+        
+        reporter.finish()
+        return f"PDF按大小拆分完成！共生成 {len(written)} 个文件，每个文件约不超过 {max_size_mb} MB"
+        
+    except OperationCancelled:
+        remove_outputs(written)
+        raise
+    except Exception as e:
+        raise Exception(f"PDF按大小拆分失败: {str(e)}")
+
+def split_pdf_by_bookmarks(input_path, output_dir, threads=WRITE_THREADS, progress=None,
+                           cancel_token=None):
+    """
+    按顶层书签拆分PDF文件，每个书签到下一个书签之前的页面保存为一个文件
+    文件名为 {原文件名}_{序号}_{书签标题}.pdf
+    progress: 可选的进度回调 (已完成文件数, 总文件数, 每秒文件数)
+    cancel_token: 可选的取消令牌，取消时删除已生成的文件
+    """
+    written = []
+    try:
+        reader = PdfReader(input_path)
+        base_name = os.path.splitext(os.path.basename(input_path))[0]
+        groups = bookmark_page_groups(reader)
+        reporter = ProgressReporter(progress, len(groups))
+        
+        output_paths = []
+        for number, (title, _) in enumerate(groups, 1):
+            file_name = f"{base_name}_{number}"
+            if title and _safe_file_name(title):
+                file_name += f"_{_safe_file_name(title)}"
+            output_paths.append(os.path.join(output_dir, f"{file_name}.pdf"))
+        
+        write_page_groups(reader, [pages for _, pages in groups], output_paths, threads=threads,
+                          reporter=reporter, cancel_token=cancel_token, written=written)
+        
+        reporter.finish()
+        return f"PDF按书签拆分完成！共生成 {len(groups)} 个文件"
+        
+    except OperationCancelled:
+        remove_outputs(written)
+        raise
+    except Exception as e:
+        raise Exception(f"PDF按书签拆分失败: {str(e)}")
+
+def split_pdf_by_blank_pages(input_path, output_dir, max_compression_ratio=BLANK_COMPRESSION_RATIO,
+                             threads=WRITE_THREADS, progress=None, cancel_token=None):
+    """
+    以空白分隔页拆分PDF文件（例如扫描批次中每份文件之间插入的白纸），分隔页不输出
+    max_compression_ratio: 扫描图片压缩后与原始大小之比低于该值时视为空白
+    progress: 可选的进度回调 (已处理页数, 总页数, 每秒页数)
+    cancel_token: 可选的取消令牌，取消时删除已生成的文件
+    """
+    written = []
+    try:
+        reader = PdfReader(input_path)
+        base_name = os.path.splitext(os.path.basename(input_path))[0]
+        reporter = ProgressReporter(progress, len(reader.pages))
+        
+        page_groups = iter_blank_separated_groups(reader, max_compression_ratio, reporter,
+                                                  cancel_token)
+        write_page_groups(reader, page_groups, _part_paths(output_dir, base_name), threads=threads,
+                          cancel_token=cancel_token, written=written)
+        
+        reporter.finish()
+        if not written:
+            raise Exception("所有页面都被识别为空白页")
+        return f"PDF按空白页拆分完成！共生成 {len(written)} 个文件"
+        
+    except OperationCancelled:
+        remove_outputs(written)
+        raise
+    except Exception as e:
+        raise Exception(f"PDF按空白页拆分失败: {str(e)}")
@@ -2,81 +2,390 @@
 # -*- coding: utf-8 -*-
 
 import os
-import pdfplumber
+import re
+import csv
+from collections import Counter
 import pandas as pd
+from PyPDF2.generic import ArrayObject
+import result_cache
+from parallel import create_process_pool, imap_ordered, resolve_workers, worker_cancel_token
+from progress import ProgressReporter
+from pdf_session import document_session
+from cancellation import OperationCancelled, check_cancelled, remove_outputs
 
-def extract_tables_from_pdf(input_path, output_dir):
+# 并行提取时每个进程任务处理的候选页数
+PAGES_PER_TASK = 10
+
+# 候选页判断：矩形按4条边、直线按1条边累计，至少要有这么多条边才可能围成两行以上的表格
+MIN_RULING_EDGES = 5
+
+# 解析表单XObject的最大嵌套深度
+MAX_FORM_DEPTH = 4
+
+# 表格导出方式：combined 所有表格写入一个工作簿和一个长表文件，per_table 每个表格单独保存
+EXPORT_COMBINED = 'combined'
+EXPORT_PER_TABLE = 'per_table'
+
+# 长表文件的列：页码、表格序号、行号、列号、列名、单元格内容
+LONG_FORMAT_COLUMNS = ['page', 'table', 'row', 'column', 'column_name', 'value']
+
+# 内容流中的字符串、十六进制串和名称先去掉，剩下的字母记号是操作符
+_NON_OPERATOR_PATTERN = re.compile(rb'\((?:\\.|[^\\()])*\)|<[0-9A-Fa-f\s]*>|/[^\s/\[\]()<>{}%]*')
+_TOKEN_SEPARATOR = re.compile(rb'[\s\[\]{}<>()]+')
+
+def _content_streams(obj):
+    """
+    返回页面或表单XObject的内容流对象列表
+    """
+    # 表单XObject本身就是内容流；页面的 /Contents 可以是单个流，也可以是流的数组
+    if obj.get('/Subtype') == '/Form':
+        return [obj]
+    contents = obj.get('/Contents')
+    if contents is None:
+        return []
+    contents = contents.get_object()
+    if isinstance(contents, ArrayObject):
+        return [stream.get_object() for stream in contents]
+    return [contents]
+
+def count_ruling_edges(obj, depth=0):
+    """
+    统计页面（包括其中的表单XObject）绘制的表格线条数，只扫描内容流中的操作符，不做版面分析
+    矩形（re）计4条边，直线（l）计1条边，用作裁剪路径的矩形（re W n）不计
+    """
+    operators = Counter()
+    for stream in _content_streams(obj):
+        data = _NON_OPERATOR_PATTERN.sub(b' ', stream.get_data())
+        operators.update(token for token in _TOKEN_SEPARATOR.split(data)
+                         if token in (b're', b'l', b'W', b'W*'))
+    edges = max(0, operators[b're'] - operators[b'W'] - operators[b'W*']) * 4 + operators[b'l']
+    
+    resources = obj.get('/Resources')
+    xobjects = resources.get_object().get('/XObject') if resources is not None else None
+    if xobjects is not None and depth < MAX_FORM_DEPTH:
+        for xobject in xobjects.get_object().values():
+            xobject = xobject.get_object()
+            if xobject.get('/Subtype') == '/Form':
+                edges += count_ruling_edges(xobject, depth + 1)
+    return edges
+
+def find_table_pages(input_path, cancel_token=None):
+    """
+    预扫描，返回 (总页数, 可能含有表格的页码列表)
+    pdfplumber默认按线条识别表格，没有足够线条的页面不会识别出表格，直接跳过
+    """
+    with document_session(input_path) as session:
+        reader = session.reader
+        candidates = []
+        for page_num, page in enumerate(reader.pages, 1):
+            check_cancelled(cancel_token)
+            try:
+                edges = count_ruling_edges(page)
+            except Exception:
+                # 内容流无法解析时交给pdfplumber处理
+                edges = MIN_RULING_EDGES
+            if edges >= MIN_RULING_EDGES:
+                candidates.append(page_num)
+        return len(reader.pages), candidates
+
+def iter_page_tables(input_path, page_numbers, cancel_token=None):
+    """
+    逐页用pdfplumber提取表格，返回 (页码, 表格列表)，只分析 page_numbers 中的页面
+    pdfplumber文档来自文档会话，同一进程处理的多个分片和后续操作共用
+    """
+    with document_session(input_path) as session:
+        pdf = session.plumber
+        for page_num in page_numbers:
+            check_cancelled(cancel_token)
+            page = pdf.pages[page_num - 1]
+            tables = page.extract_tables()
+            page.flush_cache()
+            yield page_num, tables
+
+def _collect_page_tables(input_path, page_numbers):
+    """
+    子进程任务：提取一组页面的表格
+    """
+    return list(iter_page_tables(input_path, page_numbers, worker_cancel_token()))
+
+def _iter_tables_parallel(input_path, page_numbers, workers, cancel_token=None):
+    """
+    多进程提取表格，按页码顺序返回 (页码, 表格列表)
+    """
+    shards = [page_numbers[i:i + PAGES_PER_TASK] for i in range(0, len(page_numbers), PAGES_PER_TASK)]
+    workers = resolve_workers(workers, len(shards))
+    if workers == 1:
+        yield from iter_page_tables(input_path, page_numbers, cancel_token)
+        return
+    
+    tasks = [(input_path, shard) for shard in shards]
+    with create_process_pool(workers, cancel_token) as executor:
+        for results in imap_ordered(executor, _collect_page_tables, tasks, workers * 2):
+            check_cancelled(cancel_token)
+            yield from results
+
+class CombinedTableWriter:
+    """
+    把所有表格逐个写入一个多工作表的Excel文件和一个长表文件
+    工作簿使用openpyxl的只写模式，每个表格写完即落盘，不在内存中保留；
+    长表文件每个单元格一行，带页码、表格序号等索引列，可以是CSV或Parquet（需要pyarrow）
+    """
+    
+    def __init__(self, output_folder, base_name, long_format='csv'):
+        from openpyxl import Workbook
+        
+        if long_format not in ('csv', 'parquet'):
+            raise Exception(f"不支持的长表格式: {long_format}")
+        self.excel_path = os.path.join(output_folder, f"{base_name}_tables.xlsx")
+        self.long_path = os.path.join(output_folder, f"{base_name}_tables.{long_format}")
+        self.table_count = 0
+        self._workbook = Workbook(write_only=True)
+        self._csv_file = None
+        self._parquet_writer = None
+        if long_format == 'csv':
+            self._csv_file = open(self.long_path, 'w', newline='', encoding='utf-8-sig')
+            self._csv_writer = csv.writer(self._csv_file)
+            self._csv_writer.writerow(LONG_FORMAT_COLUMNS)
+        else:
+            try:
+                import pyarrow
+                import pyarrow.parquet
+            except ImportError:
+                raise Exception("导出Parquet需要安装pyarrow: pip install pyarrow")
+            self._pyarrow = pyarrow
+            schema = pyarrow.schema([('page', pyarrow.int32()), ('table', pyarrow.int32()),
+                                     ('row', pyarrow.int32()), ('column', pyarrow.int32()),
+                                     ('column_name', pyarrow.string()), ('value', pyarrow.string())])
+            self._parquet_writer = pyarrow.parquet.ParquetWriter(self.long_path, schema)
+    
+    @property
+    def paths(self):
+        return [self.excel_path, self.long_path]
+    
+    def add(self, page_num, table_num, rows):
+        """
+        写入一个表格，rows 的第一行为表头
+        """
+        self.table_count += 1
+        sheet = self._workbook.create_sheet(f"p{page_num}_t{table_num}")
+        for row in rows:
+            sheet.append(row)
+        
+        header = rows[0]
+        records = [(page_num, table_num, row_num, column_num,
+                    header[column_num - 1] if column_num <= len(header) else None, value)
+                   for row_num, row in enumerate(rows[1:], 1)
+                   for column_num, value in enumerate(row, 1)]
+        if self._csv_file is not None:
+            self._csv_writer.writerows(records)
+        else:
+            schema = self._parquet_writer.schema
+            columns = list(zip(*records)) if records else [[]] * len(LONG_FORMAT_COLUMNS)
+            batch = self._pyarrow.record_batch(
+                [self._pyarrow.array(column, type=field.type) for column, field in zip(columns, schema)],
+                schema=schema)
+            self._parquet_writer.write_batch(batch)
+    
+    def close(self):
+        if self._csv_file is not None:
+            self._csv_file.close()
+        if self._parquet_writer is not None:
+            self._parquet_writer.close()
+        # 只写模式的工作簿至少需要一个工作表
+        if self.table_count == 0:
+            self._workbook.create_sheet("tables")
+        self._workbook.save(self.excel_path)
+
+def _write_table_files(df, path_prefix, written):
+    """
+    把一个表格分别保存为Excel和CSV文件
+    """
+    # 保存为Excel文件
+    excel_path = f"{path_prefix}.xlsx"
+    written.append(excel_path)
+    df.to_excel(excel_path, index=False)
+    
+    # 同时保存为CSV文件
+    csv_path = f"{path_prefix}.csv"
+    written.append(csv_path)
+    df.to_csv(csv_path, index=False, encoding='utf-8-sig')
+
+def extract_tables_from_pdf(input_path, output_dir, workers=1, prefilter=True,
+                            export=EXPORT_COMBINED, long_format='csv', use_cache=True,
+                            progress=None, cancel_token=None):
     """
     从PDF文件中提取表格
+    workers: 提取进程数，None表示使用全部CPU核心
+    prefilter: 先扫描内容流中的线条，只对可能含有表格的页面运行pdfplumber的表格识别
+    export: combined 时所有表格写入 {原文件名}_tables.xlsx（每个表格一个工作表）和一个长表文件；
+            per_table 时每个表格单独保存为Excel和CSV文件
+    long_format: 长表文件格式，csv 或 parquet
+    use_cache: 同一文件提取过时直接返回缓存的结果
+    progress: 可选的进度回调 (已完成页数, 总页数, 每秒页数)
+    cancel_token: 可选的取消令牌，取消时删除已保存的表格文件
     """
+    written = []
     try:
         # 获取原文件名（不含扩展名）
         base_name = os.path.splitext(os.path.basename(input_path))[0]
         
         # 创建输出目录
         output_folder = os.path.join(output_dir, f"{base_name}_tables")
-        os.makedirs(output_folder, exist_ok=True)
+        
+        cache_key = None
+        if use_cache:
+            cache_key = result_cache.make_key('extract_tables', input_path, name=base_name,
+                                              engine='pdfplumber', prefilter=prefilter,
+                                              export=export, long_format=long_format)
+            cached_result = result_cache.lookup(cache_key, output_dir)
+            if cached_result is not None:
+                ProgressReporter(progress).finish()
+                return cached_result
+        
+        if not os.path.isdir(output_folder):
+            os.makedirs(output_folder)
+            written.append(output_folder)
         
         table_count = 0
         
-        with pdfplumber.open(input_path) as pdf:
-            for page_num, page in enumerate(pdf.pages):
-                # 提取表格
-                tables = page.extract_tables()
-                
+        # 预扫描找出候选页，其余页面直接计入进度
+        if prefilter:
+            page_count, page_numbers = find_table_pages(input_path, cancel_token)
+        else:
+            with document_session(input_path) as session:
+                page_count = session.page_count
+            page_numbers = list(range(1, page_count + 1))
+        reporter = ProgressReporter(progress, page_count)
+        reporter.advance(page_count - len(page_numbers))
+        
+        combined = None
+        if export == EXPORT_COMBINED:
+            combined = CombinedTableWriter(output_folder, base_name, long_format)
+            written.extend(combined.paths)
+        elif export != EXPORT_PER_TABLE:
+            raise Exception(f"不支持的导出方式: {export}")
+        
+        try:
+            for page_num, tables in _iter_tables_parallel(input_path, page_numbers, workers,
+                                                          cancel_token):
                 for table_num, table in enumerate(tables):
                     if table and len(table) > 1:  # 确保表格有数据
+                        table_count += 1
+                        if combined is not None:
+                            combined.add(page_num, table_num + 1, table)
+                            continue
+                        
                         # 转换为DataFrame
                         df = pd.DataFrame(table[1:], columns=table[0])
-                        
-                        # 保存为Excel文件
-                        excel_filename = f"{base_name}_page_{page_num + 1}_table_{table_num + 1}.xlsx"
-                        excel_path = os.path.join(output_folder, excel_filename)
-                        df.to_excel(excel_path, index=False)
-                        
-                        # 同时保存为CSV文件
-                        csv_filename = f"{base_name}_page_{page_num + 1}_table_{table_num + 1}.csv"
-                        csv_path = os.path.join(output_folder, csv_filename)
-                        df.to_csv(csv_path, index=False, encoding='utf-8-sig')
-                        
-                        table_count += 1
+                        file_name = f"{base_name}_page_{page_num}_table_{table_num + 1}"
+                        _write_table_files(df, os.path.join(output_folder, file_name), written)
+                
+                reporter.advance()
+        finally:
+            if combined is not None:
+                combined.close()
+        reporter.finish()
         
-        return f"表格提取完成！共提取 {table_count} 个表格，文件保存在: {output_folder}"
+        result = (f"表格提取完成！共扫描 {page_count} 页，分析其中 {len(page_numbers)} 页，"
+                  f"提取 {table_count} 个表格，文件保存在: {output_folder}")
+        if cache_key:
+            result_cache.store(cache_key, output_dir, [output_folder], result)
+        return result
         
+    except OperationCancelled:
+        remove_outputs(written)
+        raise
     except Exception as e:
         raise Exception(f"表格提取失败: {str(e)}")
 
-def extract_tables_with_camelot(input_path, output_dir):
+def _camelot_tables_task(input_path, page_numbers):
+    """
+    子进程任务：用Camelot提取一组页面的表格，返回 [(DataFrame, 准确率, 页码)]
+    """
+    import camelot
+    
+    check_cancelled(worker_cancel_token())
+    tables = camelot.read_pdf(input_path, pages=",".join(str(page) for page in page_numbers))
+    return [(table.df, table.parsing_report['accuracy'], int(table.page)) for table in tables]
+
+def extract_tables_with_camelot(input_path, output_dir, workers=1, prefilter=True,
+                                export=EXPORT_COMBINED, long_format='csv', progress=None,
+                                cancel_token=None):
     """
     使用Camelot库提取表格（需要安装camelot-py和ghostscript）
+    export, long_format: 导出方式，与 extract_tables_from_pdf 相同
+    workers: 提取进程数，None表示使用全部CPU核心；候选页分组后交给各进程
+    prefilter: 只把可能含有表格的页面交给Camelot，与pdfplumber提取使用相同的预扫描
+    progress: 可选的进度回调 (已完成页数, 总页数, 每秒页数)，按页面分组上报
+    cancel_token: 可选的取消令牌，Camelot解析一组页面的过程中无法中断，在每组前后检查
     """
+    written = []
     try:
         import camelot
         
         base_name = os.path.splitext(os.path.basename(input_path))[0]
         output_folder = os.path.join(output_dir, f"{base_name}_tables_camelot")
-        os.makedirs(output_folder, exist_ok=True)
+        if not os.path.isdir(output_folder):
+            os.makedirs(output_folder)
+            written.append(output_folder)
         
-        # 使用Camelot提取表格
-        tables = camelot.read_pdf(input_path, pages='all')
+        if prefilter:
+            page_count, page_numbers = find_table_pages(input_path, cancel_token)
+        else:
+            with document_session(input_path) as session:
+                page_count = session.page_count
+            page_numbers = list(range(1, page_count + 1))
+        reporter = ProgressReporter(progress, page_count)
+        reporter.advance(page_count - len(page_numbers))
+        
+        shards = [page_numbers[i:i + PAGES_PER_TASK]
+                  for i in range(0, len(page_numbers), PAGES_PER_TASK)]
+        workers = resolve_workers(workers, len(shards))
+        tasks = [(input_path, shard) for shard in shards]
+        
+        def iter_results():
+            if workers == 1:
+                for task in tasks:
+                    check_cancelled(cancel_token)
+                    yield _camelot_tables_task(*task)
+                return
+            with create_process_pool(workers, cancel_token) as executor:
+                yield from imap_ordered(executor, _camelot_tables_task, tasks, workers * 2)
+        
+        combined = None
+        if export == EXPORT_COMBINED:
+            combined = CombinedTableWriter(output_folder, base_name, long_format)
+            written.extend(combined.paths)
+        elif export != EXPORT_PER_TABLE:
+            raise Exception(f"不支持的导出方式: {export}")
         
         table_count = 0
-        for i, table in enumerate(tables):
-            if table.parsing_report['accuracy'] > 50:  # 准确率阈值
-                # 保存为Excel
-                excel_filename = f"{base_name}_table_{i + 1}.xlsx"
-                excel_path = os.path.join(output_folder, excel_filename)
-                table.df.to_excel(excel_path, index=False)
-                
-                # 保存为CSV
-                csv_filename = f"{base_name}_table_{i + 1}.csv"
-                csv_path = os.path.join(output_folder, csv_filename)
-                table.df.to_csv(csv_path, index=False, encoding='utf-8-sig')
-                
-                table_count += 1
+        page_table_counts = Counter()
+        try:
+            for shard, tables in zip(shards, iter_results()):
+                for df, accuracy, page_num in tables:
+                    check_cancelled(cancel_token)
+                    if accuracy > 50:  # 准确率阈值
+                        table_count += 1
+                        page_table_counts[page_num] += 1
+                        if combined is not None:
+                            # Camelot的表头在第一行数据中
+                            combined.add(page_num, page_table_counts[page_num], df.values.tolist())
+                        else:
+                            file_name = f"{base_name}_table_{table_count}"
+                            _write_table_files(df, os.path.join(output_folder, file_name), written)
+                reporter.advance(len(shard))
+        finally:
+            if combined is not None:
+                combined.close()
         
-        return f"Camelot表格提取完成！共提取 {table_count} 个表格"
+        reporter.finish()
+        return (f"Camelot表格提取完成！共扫描 {page_count} 页，分析其中 {len(page_numbers)} 页，"
+                f"提取 {table_count} 个表格")
         
+    except OperationCancelled:
+        remove_outputs(written)
+        raise
     except ImportError:
         raise Exception("请安装camelot-py: pip install camelot-py[base]")
     except Exception as e:
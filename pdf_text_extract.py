@@ -2,13 +2,127 @@
 # -*- coding: utf-8 -*-
 
 import os
-from PyPDF2 import PdfReader
-import pdfplumber
+import re
+from cancellation import OperationCancelled, check_cancelled, remove_outputs
+from parallel import create_process_pool, imap_ordered, resolve_workers, split_range, worker_cancel_token
+from progress import ProgressReporter
+from pdf_session import document_session
+import result_cache
 
-def extract_text_from_pdf(input_path, output_dir):
+# 快速提取结果的质量分数低于该值时，该页改用pdfplumber重新提取
+MIN_TEXT_SCORE = 0.9
+
+# 并行提取时每个进程任务处理的页数
+PAGES_PER_TASK = 20
+
+# 乱码特征：(cid:x) 未映射字形、替换字符、控制字符、私用区字符
+_GARBLED_PATTERN = re.compile(r'\(cid:\d+\)|[\ufffd\x00-\x08\x0e-\x1f\ue000-\uf8ff]')
+
+def score_page_text(text):
+    """
+    评估单页提取文本的质量，返回0~1之间的分数
+    空页面为0分，乱码字符占比越高分数越低
+    """
+    if not text:
+        return 0.0
+    
+    visible_length = len(text) - sum(1 for ch in text if ch.isspace())
+    if visible_length == 0:
+        return 0.0
+    
+    garbled_length = sum(len(match) for match in _GARBLED_PATTERN.findall(text))
+    return max(0.0, 1.0 - garbled_length / visible_length)
+
+def iter_page_texts(input_path, first_page=1, last_page=None, cancel_token=None):
+    """
+    逐页提取文本，返回 (页码, 文本, 使用的方法)
+    先用速度快的PyPDF2提取，只有结果为空或疑似乱码的页面才用pdfplumber重新提取
+    两种解析结果都来自文档会话，同一文件的后续操作可以直接复用
+    cancel_token: 可选的取消令牌，每页提取前检查
+    """
+    with document_session(input_path) as session:
+        reader = session.reader
+        if last_page is None:
+            last_page = len(reader.pages)
+        
+        for page_index in range(first_page - 1, last_page):
+            check_cancelled(cancel_token)
+            text = reader.pages[page_index].extract_text() or ""
+            method = "PyPDF2"
+            
+            score = score_page_text(text)
+            if score < MIN_TEXT_SCORE:
+                # 仅在需要时才打开pdfplumber，纯文本文档全程只解析一次
+                plumber_page = session.plumber.pages[page_index]
+                plumber_text = plumber_page.extract_text() or ""
+                # 释放该页的版面分析缓存，避免随页数累积
+                plumber_page.flush_cache()
+                if score_page_text(plumber_text) > score:
+                    text = plumber_text
+                    method = "pdfplumber"
+            
+            yield page_index + 1, text, method
+
+def iter_plumber_page_texts(input_path, first_page=1, last_page=None, cancel_token=None):
+    """
+    使用pdfplumber逐页提取文本，返回 (页码, 文本)
+    """
+    with document_session(input_path) as session:
+        pdf = session.plumber
+        if last_page is None:
+            last_page = len(pdf.pages)
+        for page_index in range(first_page - 1, last_page):
+            check_cancelled(cancel_token)
+            page = pdf.pages[page_index]
+            text = page.extract_text()
+            page.flush_cache()
+            yield page_index + 1, text
+
+def _collect_page_range(iter_function, input_path, first_page, last_page):
+    """
+    子进程任务：提取一段页面的文本，同一子进程处理的多个分片共用该进程中的文档会话
+    """
+    return list(iter_function(input_path, first_page, last_page,
+                              cancel_token=worker_cancel_token()))
+
+def iter_texts_parallel(input_path, iter_function=iter_page_texts, workers=None,
+                        pages_per_task=PAGES_PER_TASK, progress=None, cancel_token=None):
+    """
+    多进程提取文本，按页码顺序返回 iter_function 产生的结果
+    页码范围切分给多个进程，每个进程独立打开文件；workers为1时在当前进程逐页提取
+    progress: 可选的进度回调 (已完成页数, 总页数, 每秒页数)
+    cancel_token: 可选的取消令牌，取消请求会同步到子进程
+    """
+    with document_session(input_path) as session:
+        page_count = session.page_count
+    reporter = ProgressReporter(progress, page_count)
+    shards = split_range(1, page_count, pages_per_task)
+    workers = resolve_workers(workers, len(shards))
+    
+    if workers == 1:
+        for item in iter_function(input_path, cancel_token=cancel_token):
+            yield item
+            reporter.advance()
+        return
+    
+    tasks = [(iter_function, input_path, start, end) for start, end in shards]
+    with create_process_pool(workers, cancel_token) as executor:
+        # 只保留少量已完成的分片等待写出，内存不随页数增长
+        for results in imap_ordered(executor, _collect_page_range, tasks, workers * 2):
+            check_cancelled(cancel_token)
+            yield from results
+            reporter.advance(len(results))
+
+def extract_text_from_pdf(input_path, output_dir, workers=1, use_cache=True, progress=None,
+                          cancel_token=None):
     """
     从PDF文件中提取文本内容
+    workers: 提取进程数，None表示使用全部CPU核心
+    use_cache: 同一文件以相同参数提取过时直接返回缓存的结果
+    progress: 可选的进度回调 (已完成页数, 总页数, 每秒页数)
+    cancel_token: 可选的取消令牌，取消时删除写了一半的文本文件
     """
+    written = []
     try:
         # 获取原文件名（不含扩展名）
         base_name = os.path.splitext(os.path.basename(input_path))[0]
@@ -16,61 +130,148 @@ def extract_text_from_pdf(input_path, output_dir):
         # 输出文件路径
         output_path = os.path.join(output_dir, f"{base_name}_extracted_text.txt")
         
-        # 方法1: 使用PyPDF2提取文本
-        text_pypdf2 = ""
-        with open(input_path, 'rb') as file:
-            reader = PdfReader(file)
-            for page in reader.pages:
-                text_pypdf2 += page.extract_text() + "\n\n"
-        
-        # 方法2: 使用pdfplumber提取文本（通常更准确）
-        text_pdfplumber = ""
-        with pdfplumber.open(input_path) as pdf:
-            for page in pdf.pages:
-                page_text = page.extract_text()
-                if page_text:
-                    text_pdfplumber += page_text + "\n\n"
-        
-        # 选择更好的提取结果
-        if len(text_pdfplumber.strip()) > len(text_pypdf2.strip()):
-            final_text = text_pdfplumber
-            method = "pdfplumber"
-        else:
-            final_text = text_pypdf2
-            method = "PyPDF2"
+        cache_key = None
+        if use_cache:
+            cache_key = result_cache.make_key('extract_text', input_path, name=base_name,
+                                              min_score=MIN_TEXT_SCORE)
+            cached_result = result_cache.lookup(cache_key, output_dir)
+            if cached_result is not None:
+                ProgressReporter(progress).finish()
+                return cached_result
         
-        # 保存文本文件
+        # 逐页选择提取方法，每页文本提取后立即写入文件并累计统计，内存中只保留当前页
+        page_count = 0
+        fallback_count = 0
+        char_count = 0
+        word_count = 0
+        newline_count = 0
+        written.append(output_path)
         with open(output_path, 'w', encoding='utf-8') as text_file:
-            text_file.write(final_text)
+            for page_num, page_text, page_method in iter_texts_parallel(input_path, workers=workers,
+                                                                        progress=progress,
+                                                                        cancel_token=cancel_token):
+                page_count += 1
+                if page_method == "pdfplumber":
+                    fallback_count += 1
+                if not page_text:
+                    continue
+                
+                # 每段以空行结尾，段与段之间不会把一个单词拆开，可以逐段统计
+                chunk = page_text + "\n\n"
+                text_file.write(chunk)
+                char_count += len(chunk)
+                word_count += len(chunk.split())
+                newline_count += chunk.count('\n')
+        
+        if fallback_count == 0:
+            method = "PyPDF2"
+        elif fallback_count == page_count:
+            method = "pdfplumber"
+        else:
+            method = f"PyPDF2（其中{fallback_count}页使用pdfplumber）"
         
-        # 统计信息
-        char_count = len(final_text)
-        word_count = len(final_text.split())
-        line_count = len(final_text.split('\n'))
+        # 行数与按换行符切分的段数一致
+        line_count = newline_count + 1
         
-        return f"文本提取完成！使用{method}方法，共提取{char_count}字符，{word_count}单词，{line_count}行。文件保存为: {output_path}"
+        result = f"文本提取完成！使用{method}方法，共提取{char_count}字符，{word_count}单词，{line_count}行。文件保存为: {output_path}"
+        if cache_key:
+            result_cache.store(cache_key, output_dir, [output_path], result)
+        return result
         
+    except OperationCancelled:
+        remove_outputs(written)
+        raise
     except Exception as e:
         raise Exception(f"文本提取失败: {str(e)}")
 
-def extract_text_by_pages(input_path, output_dir):
+def extract_text_by_pages(input_path, output_dir, workers=1, use_cache=True, progress=None,
+                          cancel_token=None):
     """
     按页提取文本，每页保存为一个文件
+    workers: 提取进程数，None表示使用全部CPU核心
+    use_cache: 同一文件提取过时直接返回缓存的结果
+    progress: 可选的进度回调 (已完成页数, 总页数, 每秒页数)
+    cancel_token: 可选的取消令牌，取消时删除已写出的文件
     """
+    written = []
     try:
         base_name = os.path.splitext(os.path.basename(input_path))[0]
         output_folder = os.path.join(output_dir, f"{base_name}_text_pages")
-        os.makedirs(output_folder, exist_ok=True)
         
-        with pdfplumber.open(input_path) as pdf:
-            for page_num, page in enumerate(pdf.pages):
-                text = page.extract_text()
-                if text:
-                    output_path = os.path.join(output_folder, f"{base_name}_page_{page_num + 1}.txt")
-                    with open(output_path, 'w', encoding='utf-8') as text_file:
-                        text_file.write(text)
+        cache_key = None
+        if use_cache:
+            cache_key = result_cache.make_key('extract_text_by_pages', input_path, name=base_name)
+            cached_result = result_cache.lookup(cache_key, output_dir)
+            if cached_result is not None:
+                ProgressReporter(progress).finish()
+                return cached_result
+        
+        if not os.path.isdir(output_folder):
+            os.makedirs(output_folder)
+            written.append(output_folder)
+        
+        for page_num, text in iter_texts_parallel(input_path, iter_plumber_page_texts, workers,
+                                                  progress=progress, cancel_token=cancel_token):
+            if text:
+                output_path = os.path.join(output_folder, f"{base_name}_page_{page_num}.txt")
+                written.append(output_path)
+                with open(output_path, 'w', encoding='utf-8') as text_file:
+                    text_file.write(text)
         
-        return f"按页文本提取完成！文件保存在: {output_folder}"
+        result = f"按页文本提取完成！文件保存在: {output_folder}"
+        if cache_key:
+            result_cache.store(cache_key, output_dir, [output_folder], result)
+        return result
         
+    except OperationCancelled:
+        remove_outputs(written)
+        raise
     except Exception as e:
         raise Exception(f"按页文本提取失败: {str(e)}")
+
+def _extract_text_task(input_path, output_dir):
+    """
+    子进程任务：提取单个文件的文本，使用进程池的取消令牌
+    """
+    return extract_text_from_pdf(input_path, output_dir, cancel_token=worker_cancel_token())
+
+def extract_text_from_pdfs(input_paths, output_dir=None, workers=None, progress=None,
+                           cancel_token=None):
+    """
+    批量提取多个PDF文件的文本，每个文件由一个进程处理
+    output_dir: 输出目录，为None时保存在各PDF文件所在目录
+    progress: 可选的进度回调 (已完成文件数, 总文件数, 每秒文件数)
+    cancel_token: 可选的取消令牌，取消后未开始的文件不再处理，正在处理的文件删除部分输出
+    """
+    try:
+        if not input_paths:
+            raise Exception("没有选择要提取文本的PDF文件")
+        
+        workers = resolve_workers(workers, len(input_paths))
+        reporter = ProgressReporter(progress, len(input_paths))
+        success_count = 0
+        failures = []
+        
+        with create_process_pool(workers, cancel_token) as executor:
+            futures = [executor.submit(_extract_text_task, path,
+                                       output_dir or os.path.dirname(os.path.abspath(path)))
+                       for path in input_paths]
+            for path, future in zip(input_paths, futures):
+                try:
+                    future.result()
+                    success_count += 1
+                except OperationCancelled:
+                    raise
+                except Exception as e:
+                    failures.append(f"{os.path.basename(path)}: {str(e)}")
+                reporter.advance()
+        
+        result = f"批量文本提取完成！成功 {success_count} 个，失败 {len(failures)} 个"
+        if failures:
+            result += "\n" + "\n".join(failures)
+        return result
+        
+    except OperationCancelled:
+        raise
+    except Exception as e:
+        raise Exception(f"批量文本提取失败: {str(e)}")
@@ -3,8 +3,24 @@
 
 import os
 import subprocess
-from pdf2image import convert_from_path
+import functools
+import importlib.util
+from pdf2image import convert_from_path, pdfinfo_from_path
 from PIL import Image
+from cancellation import OperationCancelled, check_cancelled, remove_outputs
+from parallel import create_process_pool, resolve_workers, split_range, worker_cancel_token
+from progress import ProgressReporter
+from pdf_session import document_session
+import result_cache
+
+# 渲染后端：pdf2image 调用poppler的pdftoppm子进程渲染，经PPM临时文件读回；
+# fitz 用PyMuPDF在当前进程中渲染，像素图直接编码为PNG/JPEG，不需要poppler；
+# auto 在安装了PyMuPDF时使用fitz，否则使用pdf2image
+RENDER_BACKENDS = ('auto', 'pdf2image', 'fitz')
+DEFAULT_RENDER_BACKEND = 'auto'
+
+# Pillow保存JPEG时的默认质量，fitz后端未指定质量时使用相同的值
+DEFAULT_JPEG_QUALITY = 75
 
 def find_poppler_path():
     """
@@ -32,81 +48,283 @@ def find_poppler_path():
     print("未找到有效的Poppler路径")
     return None
 
-# 自动检测Poppler路径，如果找不到则使用None（尝试使用系统PATH）
-POPPLER_PATH = find_poppler_path()
+@functools.lru_cache(maxsize=None)
+def get_poppler_path():
+    """
+    首次渲染时才检测Poppler路径，之后直接返回检测结果
+    找不到时返回None（尝试使用系统PATH）
+    """
+    return find_poppler_path()
 
-def pdf_to_images(input_path, output_dir, dpi=200, fmt='PNG'):
+# 流式渲染时每批渲染的页数，峰值内存只与该值有关，与PDF总页数无关
+DEFAULT_CHUNK_SIZE = 10
+
+@functools.lru_cache(maxsize=None)
+def _fitz_available():
+    return importlib.util.find_spec("fitz") is not None
+
+def resolve_backend(backend=DEFAULT_RENDER_BACKEND):
     """
-    将PDF文件的每一页转换为图片
+    返回实际使用的渲染后端名称（pdf2image 或 fitz）
     """
-    try:
-        # 获取原文件名（不含扩展名）
-        base_name = os.path.splitext(os.path.basename(input_path))[0]
-        
-        # 转换PDF为图片，传入poppler路径
-        images = convert_from_path(input_path, dpi=dpi, poppler_path=POPPLER_PATH)
+    if backend not in RENDER_BACKENDS:
+        raise Exception(f"不支持的渲染后端: {backend}，可选: {', '.join(RENDER_BACKENDS)}")
+    if backend == 'auto':
+        return 'fitz' if _fitz_available() else 'pdf2image'
+    return backend
+
+def get_page_count(input_path, backend=DEFAULT_RENDER_BACKEND):
+    """
+    获取PDF页数（只读取文件信息，不渲染页面）
+    """
+    if resolve_backend(backend) == 'fitz':
+        with document_session(input_path) as session:
+            return len(session.fitz)
+    info = pdfinfo_from_path(input_path, poppler_path=get_poppler_path())
+    return int(info['Pages'])
+
+def iter_page_pixmaps(input_path, dpi=200, first_page=1, last_page=None, cancel_token=None):
+    """
+    用PyMuPDF在当前进程中逐页渲染，返回 (页码, 像素图)
+    文档来自文档会话，多次渲染同一文件时不重复解析
+    """
+    with document_session(input_path) as session:
+        document = session.fitz
+        if last_page is None:
+            last_page = len(document)
+        for page_num in range(first_page, last_page + 1):
+            check_cancelled(cancel_token)
+            yield page_num, document.load_page(page_num - 1).get_pixmap(dpi=dpi, alpha=False)
+
+def pixmap_to_image(pixmap):
+    """
+    把RGB像素图转换为Pillow图片
+    """
+    return Image.frombytes("RGB", (pixmap.width, pixmap.height), pixmap.samples)
+
+def iter_pdf_pages(input_path, dpi=200, first_page=1, last_page=None,
+                   chunk_size=DEFAULT_CHUNK_SIZE, cancel_token=None,
+                   backend=DEFAULT_RENDER_BACKEND):
+    """
+    按批次流式渲染PDF页面，逐页返回 (页码, 图片)
+    每次只渲染 chunk_size 页，调用方保存并释放后才会渲染下一批；fitz后端逐页渲染
+    cancel_token: 可选的取消令牌，每批渲染前检查；pdf2image 后端渲染一批时无法中断，
+                  传入取消令牌时逐页渲染，取消后最多再等一页
+    backend: 渲染后端，见 RENDER_BACKENDS
+    """
+    if resolve_backend(backend) == 'fitz':
+        for page_num, pixmap in iter_page_pixmaps(input_path, dpi, first_page, last_page,
+                                                  cancel_token):
+            yield page_num, pixmap_to_image(pixmap)
+        return
+    
+    if last_page is None:
+        last_page = get_page_count(input_path, 'pdf2image')
+    chunk_size = max(1, int(chunk_size))
+    if cancel_token is not None:
+        # pdftoppm 进程运行期间无法取消，每次只渲染一页，使取消及时生效
+        chunk_size = 1
+    
+    for chunk_start in range(first_page, last_page + 1, chunk_size):
+        check_cancelled(cancel_token)
+        chunk_end = min(chunk_start + chunk_size - 1, last_page)
+        images = convert_from_path(input_path, dpi=dpi, first_page=chunk_start,
+                                   last_page=chunk_end, poppler_path=get_poppler_path())
         
-        # 直接在原文件所在目录保存图片，不创建子文件夹
-        saved_files = []
-        for i, image in enumerate(images):
-            output_path = os.path.join(output_dir, f"{base_name}_page_{i + 1}.{fmt.lower()}")
-            image.save(output_path, fmt.upper())
+        for offset in range(len(images)):
+            # 交出图片后立即解除列表引用，保存完即可被回收
+            image, images[offset] = images[offset], None
+            yield chunk_start + offset, image
+
+def save_page_image(image, output_path, fmt='PNG', quality=None, size=None):
+    """
+    保存单页图片，可选调整大小
+    quality: JPEG质量，为None时使用Pillow默认值
+    """
+    # 调整图片大小（如果指定）
+    if size:
+        image = image.resize(size, Image.Resampling.LANCZOS)
+    
+    # 根据格式保存
+    if fmt.upper() == 'JPEG' and quality is not None:
+        image.save(output_path, 'JPEG', quality=quality)
+    else:
+        image.save(output_path, fmt.upper())
+
+def save_page_pixmap(pixmap, output_path, fmt='PNG', quality=None):
+    """
+    保存fitz渲染的像素图，PNG和JPEG由PyMuPDF直接编码，其他格式经Pillow保存
+    quality: JPEG质量，为None时与Pillow默认值相同
+    """
+    fmt = fmt.upper()
+    if fmt == 'PNG':
+        pixmap.save(output_path, 'png')
+    elif fmt == 'JPEG':
+        pixmap.save(output_path, 'jpeg',
+                    jpg_quality=quality if quality is not None else DEFAULT_JPEG_QUALITY)
+    else:
+        save_page_image(pixmap_to_image(pixmap), output_path, fmt, quality)
+
+def _render_range_to_files(input_path, output_dir, file_prefix, file_ext, index_base,
+                           first_page, last_page, dpi, fmt, quality, size, chunk_size,
+                           backend=DEFAULT_RENDER_BACKEND, reporter=None, cancel_token=None):
+    """
+    渲染一段连续页面并直接保存（可在子进程中运行），返回保存的文件路径列表
+    fitz后端不调整大小时像素图直接写入文件，不经过Pillow
+    取消时删除本段已保存的图片
+    """
+    if cancel_token is None:
+        cancel_token = worker_cancel_token()
+    
+    if resolve_backend(backend) == 'fitz' and not size:
+        pages = iter_page_pixmaps(input_path, dpi, first_page, last_page, cancel_token)
+        save = functools.partial(save_page_pixmap, fmt=fmt, quality=quality)
+    else:
+        pages = iter_pdf_pages(input_path, dpi=dpi, first_page=first_page, last_page=last_page,
+                               chunk_size=chunk_size, cancel_token=cancel_token, backend=backend)
+        save = functools.partial(save_page_image, fmt=fmt, quality=quality, size=size)
+    
+    saved_files = []
+    try:
+        for page_num, page in pages:
+            check_cancelled(cancel_token)
+            output_path = os.path.join(output_dir,
+                                       f"{file_prefix}{page_num - index_base + 1}.{file_ext}")
+            save(page, output_path)
             saved_files.append(output_path)
-        
-        return f"PDF转图片完成！共转换 {len(images)} 页，文件已直接保存在原PDF文件旁边"
-        
+            if reporter is not None:
+                reporter.advance()
+    except OperationCancelled:
+        remove_outputs(saved_files)
+        raise
     except Exception as e:
-        error_msg = str(e)
-        # 针对Poppler未找到的错误，提供更详细的提示
-        if "Unable to get page count" in error_msg or "poppler" in error_msg.lower():
-            detected_path_info = f"检测到的Poppler路径: {POPPLER_PATH}" if POPPLER_PATH else "未检测到Poppler路径"
-            raise Exception(f"PDF转图片失败: {error_msg}\n\n{detected_path_info}\n\n"  
-                           "请按照以下步骤安装和配置Poppler:\n"  
-                           "1. 访问 https://github.com/oschwartz10612/poppler-windows/releases/ 下载Poppler\n"  
-                           "2. 解压到 C:\\poppler 目录，确保目录结构为 C:\\poppler\\Library\\bin\n"  
-                           "3. 确认bin目录中包含 pdftoppm.exe 和 pdftocairo.exe 两个文件\n"  
-                           "4. 完成后重启程序，系统将自动检测Poppler")
-        else:
-            raise Exception(f"PDF转图片失败: {error_msg}")
+        # PyMuPDF的异常对象无法在进程间传递（pickle），子进程中只保留错误信息
+        raise Exception(str(e))
+    return saved_files
+
+def render_pages_to_files(input_path, output_dir, file_prefix, file_ext, dpi=200, fmt='PNG',
+                          quality=None, size=None, first_page=1, last_page=None,
+                          chunk_size=DEFAULT_CHUNK_SIZE, workers=1, number_by_index=False,
+                          backend=DEFAULT_RENDER_BACKEND, progress=None, cancel_token=None):
+    """
+    渲染PDF页面并保存为图片，返回按页码排序的文件路径列表
+    文件名为 {file_prefix}{编号}.{file_ext}，编号默认为页码，
+    number_by_index为True时使用本次渲染范围内的序号（从1开始）
+    workers: 渲染进程数，大于1时按 chunk_size 把页码范围切分给进程池并行渲染
+    backend: 渲染后端，见 RENDER_BACKENDS
+    progress: 可选的进度回调 (已完成页数, 总页数, 每秒页数)
+    cancel_token: 可选的取消令牌，取消时删除已保存的图片并抛出 OperationCancelled
+    """
+    if last_page is None:
+        last_page = get_page_count(input_path, backend)
+    reporter = ProgressReporter(progress, max(0, last_page - first_page + 1))
+    
+    index_base = first_page if number_by_index else 1
+    shards = split_range(first_page, last_page, chunk_size)
+    workers = resolve_workers(workers, len(shards))
+    
+    if workers == 1:
+        return _render_range_to_files(input_path, output_dir, file_prefix, file_ext, index_base,
+                                      first_page, last_page, dpi, fmt, quality, size, chunk_size,
+                                      backend, reporter, cancel_token)
+    
+    # 每个分片由一个进程独立渲染并保存，按提交顺序收集结果保证页码有序
+    # 取消请求通过进程池同步到子进程，子进程在当前批次渲染完后停止并删除自己的输出
+    saved_files = []
+    futures = []
+    try:
+        with create_process_pool(workers, cancel_token) as executor:
+            futures = [executor.submit(_render_range_to_files, input_path, output_dir, file_prefix,
+                                       file_ext, index_base, start, end, dpi, fmt, quality, size,
+                                       chunk_size, backend)
+                       for start, end in shards]
+            for future in futures:
+                shard_files = future.result()
+                saved_files.extend(shard_files)
+                reporter.advance(len(shard_files))
+    except OperationCancelled:
+        # 退出进程池时正在运行的分片已结束，删除所有已完成分片的输出
+        for future in futures:
+            if not future.cancelled() and future.exception() is None:
+                remove_outputs(future.result())
+        raise
+    return saved_files
+
+def _render_error(error_msg):
+    """
+    生成PDF转图片失败的异常，针对Poppler未找到的错误提供更详细的提示
+    """
+    if "Unable to get page count" in error_msg or "poppler" in error_msg.lower():
+        poppler_path = get_poppler_path()
+        detected_path_info = f"检测到的Poppler路径: {poppler_path}" if poppler_path else "未检测到Poppler路径"
+        return Exception(f"PDF转图片失败: {error_msg}\n\n{detected_path_info}\n\n"  
+                         "请按照以下步骤安装和配置Poppler:\n"  
+                         "1. 访问 https://github.com/oschwartz10612/poppler-windows/releases/ 下载Poppler\n"  
+                         "2. 解压到 C:\\poppler 目录，确保目录结构为 C:\\poppler\\Library\\bin\n"  
+                         "3. 确认bin目录中包含 pdftoppm.exe 和 pdftocairo.exe 两个文件\n"  
+                         "4. 完成后重启程序，系统将自动检测Poppler")
+    return Exception(f"PDF转图片失败: {error_msg}")
+
+def pdf_to_images(input_path, output_dir, dpi=200, fmt='PNG', chunk_size=DEFAULT_CHUNK_SIZE,
+                  workers=1, backend=DEFAULT_RENDER_BACKEND, use_cache=True, progress=None,
+                  cancel_token=None):
+    """
+    将PDF文件的每一页转换为图片
+    chunk_size: 每批渲染的页数，页面渲染后立即保存，内存占用与总页数无关
+    workers: 并行渲染的进程数，None表示使用全部CPU核心
+    backend: 渲染后端，auto（默认，优先PyMuPDF）、pdf2image 或 fitz
+    use_cache: 同一文件以相同参数转换过时直接返回缓存的图片
+    progress: 可选的进度回调 (已完成页数, 总页数, 每秒页数)
+    cancel_token: 可选的取消令牌
+    """
+    return pdf_to_images_custom(input_path, output_dir, dpi=dpi, fmt=fmt, quality=None,
+                                chunk_size=chunk_size, workers=workers, backend=backend,
+                                use_cache=use_cache, progress=progress,
+                                cancel_token=cancel_token)
 
 def pdf_to_images_custom(input_path, output_dir, dpi=200, fmt='PNG', 
-                        quality=95, size=None):
+                        quality=95, size=None, chunk_size=DEFAULT_CHUNK_SIZE, workers=1,
+                        backend=DEFAULT_RENDER_BACKEND, use_cache=True, progress=None,
+                        cancel_token=None):
     """
     自定义参数的PDF转图片功能
     size: 可选，指定图片大小 (width, height)
+    chunk_size: 每批渲染的页数
+    workers: 并行渲染的进程数，None表示使用全部CPU核心
+    backend: 渲染后端，auto（默认，优先PyMuPDF）、pdf2image 或 fitz
+    use_cache: 同一文件以相同参数转换过时直接返回缓存的图片
+    progress: 可选的进度回调 (已完成页数, 总页数, 每秒页数)
+    cancel_token: 可选的取消令牌，取消时已转换的图片会被删除
     """
     try:
         base_name = os.path.splitext(os.path.basename(input_path))[0]
+        backend = resolve_backend(backend)
         
-        # 转换PDF为图片，传入poppler路径
-        images = convert_from_path(input_path, dpi=dpi, poppler_path=POPPLER_PATH)
+        cache_key = None
+        if use_cache:
+            # 两种后端的抗锯齿结果略有不同，分别缓存
+            cache_key = result_cache.make_key('pdf_to_images', input_path, name=base_name,
+                                              dpi=dpi, fmt=fmt.upper(), quality=quality, size=size,
+                                              backend=backend)
+            cached_result = result_cache.lookup(cache_key, output_dir)
+            if cached_result is not None:
+                ProgressReporter(progress).finish()
+                return cached_result
         
-        for i, image in enumerate(images):
-            # 调整图片大小（如果指定）
-            if size:
-                image = image.resize(size, Image.Resampling.LANCZOS)
-            
-            # 直接在原文件所在目录保存图片，不创建子文件夹
-            output_path = os.path.join(output_dir, f"{base_name}_page_{i + 1}.{fmt.lower()}")
-            
-            # 根据格式保存
-            if fmt.upper() == 'JPEG':
-                image.save(output_path, 'JPEG', quality=quality)
-            else:
-                image.save(output_path, fmt.upper())
+        # 直接在原文件所在目录保存图片，不创建子文件夹
+        saved_files = render_pages_to_files(input_path, output_dir,
+                                            f"{base_name}_page_", fmt.lower(),
+                                            dpi=dpi, fmt=fmt, quality=quality, size=size,
+                                            chunk_size=chunk_size, workers=workers,
+                                            backend=backend, progress=progress,
+                                            cancel_token=cancel_token)
         
-        return f"PDF转图片完成！共转换 {len(images)} 页，文件已直接保存在原PDF文件旁边"
+        result = f"PDF转图片完成！共转换 {len(saved_files)} 页，文件已直接保存在原PDF文件旁边"
+        if cache_key:
+            result_cache.store(cache_key, output_dir, saved_files, result)
+        return result
         
+    except OperationCancelled:
+        raise
     except Exception as e:
-        error_msg = str(e)
-        # 针对Poppler未找到的错误，提供更详细的提示
-        if "Unable to get page count" in error_msg or "poppler" in error_msg.lower():
-            detected_path_info = f"检测到的Poppler路径: {POPPLER_PATH}" if POPPLER_PATH else "未检测到Poppler路径"
-            raise Exception(f"PDF转图片失败: {error_msg}\n\n{detected_path_info}\n\n"  
-                           "请按照以下步骤安装和配置Poppler:\n"  
-                           "1. 访问 https://github.com/oschwartz10612/poppler-windows/releases/ 下载Poppler\n"  
-                           "2. 解压到 C:\\poppler 目录，确保目录结构为 C:\\poppler\\Library\\bin\n"  
-                           "3. 确认bin目录中包含 pdftoppm.exe 和 pdftocairo.exe 两个文件\n"  
-                           "4. 完成后重启程序，系统将自动检测Poppler")
-        else:
-            raise Exception(f"PDF转图片失败: {error_msg}")
\ No newline at end of file
+        raise _render_error(str(e))
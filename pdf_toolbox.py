@@ -0,0 +1,268 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+PDF工具箱命令行入口，无需图形界面即可调用各项功能
+
+用法示例:
+    python -m pdf_toolbox split 文件.pdf
+    python -m pdf_toolbox to-image 文件.pdf --dpi 300 --fmt JPEG
+    python -m pdf_toolbox batch extract-text --glob "scans/*.pdf" --workers 4
+    python -m pdf_toolbox batch --manifest jobs.jsonl --workers 8
+
+所有命令都向标准输出打印JSON格式的结果，包含每个任务的耗时
+"""
+
+import os
+import sys
+import glob
+import json
+import time
+import argparse
+import importlib
+from concurrent.futures import ProcessPoolExecutor
+
+# 命令名 -> (模块名, 函数名)
+COMMANDS = {
+    'split': ('pdf_split', 'split_pdf'),
+    'split-range': ('pdf_split', 'split_pdf_by_range'),
+    'split-size': ('pdf_split', 'split_pdf_by_size'),
+    'split-bookmarks': ('pdf_split', 'split_pdf_by_bookmarks'),
+    'split-blank': ('pdf_split', 'split_pdf_by_blank_pages'),
+    'merge': ('pdf_merge', 'merge_pdfs'),
+    'merge-folder': ('pdf_merge', 'merge_pdfs_from_folder'),
+    'to-image': ('pdf_to_image', 'pdf_to_images_custom'),
+    'extract-text': ('pdf_text_extract', 'extract_text_from_pdf'),
+    'extract-text-pages': ('pdf_text_extract', 'extract_text_by_pages'),
+    'extract-tables': ('pdf_table_extract', 'extract_tables_from_pdf'),
+    'extract-images': ('pdf_image_extract', 'extract_images_from_pdf'),
+    'images-to-pdf': ('image_to_pdf', 'images_to_pdf'),
+    'folder-images-to-pdf': ('image_to_pdf', 'folder_images_to_pdf'),
+    'protect': ('pdf_protect', 'protect_pdf'),
+    'unprotect': ('pdf_protect', 'remove_pdf_protection'),
+    'info': ('pdf_preview', 'get_pdf_info'),
+    'optimize': ('pdf_optimize', 'optimize_pdf'),
+}
+
+# 以单个PDF为输入、结果写入 output_dir 的命令，可用于 batch --glob
+PER_FILE_COMMANDS = ['split', 'split-range', 'split-size', 'split-bookmarks', 'split-blank',
+                     'to-image', 'extract-text', 'extract-text-pages', 'extract-tables',
+                     'extract-images', 'protect', 'unprotect', 'info', 'optimize']
+
+def _add_input_output(parser):
+    parser.add_argument("input_path", help="输入PDF文件")
+    parser.add_argument("-o", "--output-dir", dest="output_dir",
+                        help="输出目录，默认为输入文件所在目录")
+
+def _add_command_arguments(parser, command):
+    """
+    为每个命令添加与功能函数参数同名的命令行参数
+    """
+    if command == 'info':
+        parser.add_argument("input_path", help="输入PDF文件")
+    elif command in ('merge', 'images-to-pdf'):
+        dest = 'input_paths' if command == 'merge' else 'image_paths'
+        parser.add_argument(dest, nargs="+", help="输入文件，按顺序合并")
+        parser.add_argument("-o", "--output", dest="output_path", required=True, help="输出PDF文件")
+    elif command in ('merge-folder', 'folder-images-to-pdf'):
+        parser.add_argument("folder_path", help="输入文件夹")
+        parser.add_argument("-o", "--output", dest="output_path", required=True, help="输出PDF文件")
+    else:
+        _add_input_output(parser)
+
+    if command in ('merge', 'merge-folder', 'images-to-pdf', 'folder-images-to-pdf'):
+        parser.add_argument("--deduplicate", action="store_true",
+                            help="内容相同的图片、字体等对象只保留一份")
+        if command in ('merge', 'merge-folder'):
+            parser.add_argument("--streaming", action="store_true",
+                                help="流式合并，同时只打开一个输入文件，适合大量文件，但不保留书签")
+        if command in ('images-to-pdf', 'folder-images-to-pdf'):
+            parser.add_argument("--workers", type=int, default=1,
+                                help="转换进程数，JPEG图片原样嵌入不占用进程")
+        if command == 'folder-images-to-pdf':
+            parser.add_argument("--recursive", action="store_true",
+                                help="包含子文件夹中的图片")
+            parser.add_argument("--per-subfolder", dest="per_subfolder", action="store_true",
+                                help="每个文件夹单独生成一个PDF，-o 指定输出目录，"
+                                     "与 --recursive 一起使用")
+
+    if command == 'split-range':
+        parser.add_argument("page_ranges", nargs="+", help="页码范围，例如 1-3 5 7-9")
+    elif command == 'split-size':
+        parser.add_argument("--max-size-mb", dest="max_size_mb", type=float, default=10,
+                            help="每个文件的目标大小上限（MB）")
+    elif command == 'split-blank':
+        parser.add_argument("--max-compression-ratio", dest="max_compression_ratio", type=float,
+                            help="扫描图片压缩率低于该值时视为空白页")
+    elif command == 'to-image':
+        parser.add_argument("--dpi", type=int, default=200)
+        parser.add_argument("--fmt", default="PNG", help="图片格式，如 PNG、JPEG")
+        parser.add_argument("--quality", type=int, default=95, help="JPEG质量")
+        parser.add_argument("--workers", type=int, default=1, help="渲染进程数")
+        parser.add_argument("--backend", choices=['auto', 'pdf2image', 'fitz'], default='auto',
+                            help="渲染后端：fitz 使用PyMuPDF在进程内渲染，pdf2image 调用poppler，"
+                                 "auto 优先使用fitz")
+    elif command == 'optimize':
+        parser.add_argument("--target-dpi", dest="target_dpi", type=int, default=150,
+                            help="图片目标分辨率，0表示不缩小图片")
+        parser.add_argument("--jpeg-quality", dest="jpeg_quality", type=int, default=80,
+                            help="缩小后JPEG图片的质量")
+        parser.add_argument("--workers", type=int, default=None, help="缩小图片的进程数")
+    elif command in ('extract-text', 'extract-text-pages', 'extract-tables'):
+        parser.add_argument("--workers", type=int, default=1, help="提取进程数")
+        if command == 'extract-tables':
+            parser.add_argument("--no-prefilter", dest="prefilter", action="store_false",
+                                help="不做线条预扫描，每页都运行表格识别")
+            parser.add_argument("--export", choices=['combined', 'per_table'], default='combined',
+                                help="combined: 所有表格写入一个工作簿和一个长表文件；"
+                                     "per_table: 每个表格单独保存")
+            parser.add_argument("--long-format", dest="long_format", choices=['csv', 'parquet'],
+                                default='csv', help="长表文件格式（parquet需要pyarrow）")
+    elif command in ('protect', 'unprotect'):
+        parser.add_argument("--password", required=True)
+        if command == 'protect':
+            parser.add_argument("--owner-password", dest="owner_password")
+
+    if command in ('to-image', 'extract-text', 'extract-text-pages', 'extract-tables'):
+        parser.add_argument("--no-cache", dest="use_cache", action="store_false",
+                            help="不使用结果缓存")
+
+def _parse_param(text):
+    """
+    解析 key=value 形式的附加参数，value按JSON解析，失败时作为字符串
+    """
+    key, sep, value = text.partition("=")
+    if not sep:
+        raise argparse.ArgumentTypeError(f"参数格式应为 key=value: {text}")
+    try:
+        value = json.loads(value)
+    except ValueError:
+        pass
+    return key.replace("-", "_"), value
+
+def make_job(command, args):
+    """
+    生成任务描述，未指定输出目录时使用输入文件所在目录
+    """
+    args = {key: value for key, value in args.items() if value is not None}
+    if 'input_path' in args and command != 'info' and not args.get('output_dir'):
+        args['output_dir'] = os.path.dirname(os.path.abspath(args['input_path']))
+    return {'command': command, 'args': args}
+
+def run_job(job):
+    """
+    执行单个任务并返回可序列化为JSON的结果
+    """
+    start = time.perf_counter()
+    record = {'command': job['command'], 'args': job['args']}
+    try:
+        if job['command'] not in COMMANDS:
+            raise Exception(f"未知命令: {job['command']}")
+        module_name, function_name = COMMANDS[job['command']]
+        function = getattr(importlib.import_module(module_name), function_name)
+        if job['args'].get('output_dir'):
+            os.makedirs(job['args']['output_dir'], exist_ok=True)
+        record['result'] = function(**job['args'])
+        record['ok'] = True
+    except Exception as e:
+        record['error'] = str(e)
+        record['ok'] = False
+    record['seconds'] = round(time.perf_counter() - start, 4)
+    return record
+
+def run_jobs(jobs, workers=None):
+    """
+    并发执行多个任务，结果按任务顺序返回
+    """
+    if not jobs:
+        return []
+    if workers == 1 or len(jobs) == 1:
+        return [run_job(job) for job in jobs]
+
+    from parallel import resolve_workers
+    workers = resolve_workers(workers, len(jobs))
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        return list(executor.map(run_job, jobs))
+
+def load_manifest(manifest_path):
+    """
+    读取任务清单：JSON数组，或每行一个JSON对象的JSONL文件
+    每个任务形如 {"command": "extract-text", "input_path": "a.pdf", "workers": 2}
+    """
+    with open(manifest_path, 'r', encoding='utf-8') as f:
+        content = f.read().strip()
+
+    if content.startswith('['):
+        entries = json.loads(content)
+    else:
+        entries = [json.loads(line) for line in content.splitlines() if line.strip()]
+
+    jobs = []
+    for entry in entries:
+        entry = dict(entry)
+        command = entry.pop('command', None)
+        jobs.append(make_job(command, entry))
+    return jobs
+
+def build_parser():
+    parser = argparse.ArgumentParser(prog="pdf_toolbox", description="PDF工具箱命令行")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    for command in COMMANDS:
+        module_name, function_name = COMMANDS[command]
+        command_parser = subparsers.add_parser(command, help=f"{module_name}.{function_name}")
+        _add_command_arguments(command_parser, command)
+
+    batch_parser = subparsers.add_parser("batch", help="批量执行任务")
+    batch_parser.add_argument("batch_command", nargs="?", choices=PER_FILE_COMMANDS,
+                              help="对 --glob 匹配的每个文件执行的命令")
+    source = batch_parser.add_mutually_exclusive_group(required=True)
+    source.add_argument("--glob", dest="pattern", help="输入文件通配符，支持 ** 递归匹配")
+    source.add_argument("--manifest", help="任务清单文件（JSON或JSONL）")
+    batch_parser.add_argument("-o", "--output-dir", dest="output_dir",
+                              help="输出目录，默认为各输入文件所在目录")
+    batch_parser.add_argument("--param", action="append", type=_parse_param, default=[],
+                              help="传给每个任务的附加参数，格式 key=value，可重复")
+    batch_parser.add_argument("--workers", type=int, default=None,
+                              help="同时执行的任务数，默认使用全部CPU核心")
+
+    return parser
+
+def main(argv=None):
+    parser = build_parser()
+    args = parser.parse_args(argv)
+    start = time.perf_counter()
+
+    if args.command == "batch":
+        if args.manifest:
+            jobs = load_manifest(args.manifest)
+        else:
+            if not args.batch_command:
+                parser.error("使用 --glob 时需要指定要执行的命令")
+            paths = sorted(glob.glob(args.pattern, recursive=True))
+            extra = dict(args.param)
+            jobs = [make_job(args.batch_command,
+                             dict(extra, input_path=path, output_dir=args.output_dir))
+                    for path in paths]
+
+        records = run_jobs(jobs, args.workers)
+        output = {
+            'jobs': records,
+            'succeeded': sum(1 for record in records if record['ok']),
+            'failed': sum(1 for record in records if not record['ok']),
+            'seconds': round(time.perf_counter() - start, 4),
+        }
+    else:
+        job_args = vars(args)
+        command = job_args.pop('command')
+        output = run_job(make_job(command, job_args))
+
+    json.dump(output, sys.stdout, ensure_ascii=False, indent=2)
+    sys.stdout.write("\n")
+
+    if 'jobs' in output:
+        return 0 if output['failed'] == 0 else 1
+    return 0 if output['ok'] else 1
+
+if __name__ == "__main__":
+    sys.exit(main())
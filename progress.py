@@ -0,0 +1,58 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import time
+
+# 两次回调之间的最小间隔（秒），进度上报本身不会拖慢逐页处理的循环
+MIN_REPORT_INTERVAL = 0.1
+
+class ProgressReporter:
+    """
+    进度上报器
+    功能函数接受 progress 回调参数，处理过程中调用 advance() 上报进度，
+    回调参数为 (已完成数, 总数, 每秒处理数)，按时间间隔节流，未传回调时不做任何事
+    """
+
+    def __init__(self, callback=None, total=0, min_interval=MIN_REPORT_INTERVAL):
+        self.callback = callback
+        self.total = total
+        self.done = 0
+        self.min_interval = min_interval
+        self._start = time.perf_counter()
+        self._last_report = None
+
+    def set_total(self, total):
+        """
+        设置总数（通常在打开文件得到页数后调用），并立即上报一次
+        """
+        self.total = total
+        if self.callback is not None:
+            self._report(time.perf_counter())
+
+    def advance(self, count=1):
+        """
+        完成 count 项，距上次上报超过间隔或全部完成时调用回调
+        """
+        self.done += count
+        if self.callback is None:
+            return
+        now = time.perf_counter()
+        if (self._last_report is None or now - self._last_report >= self.min_interval
+                or self.done >= self.total):
+            self._report(now)
+
+    def finish(self):
+        """
+        操作结束（包括命中缓存直接返回的情况），把进度补满
+        """
+        if self.total < self.done or self.total == 0:
+            self.total = max(self.done, 1)
+        self.done = self.total
+        if self.callback is not None:
+            self._report(time.perf_counter())
+
+    def _report(self, now):
+        self._last_report = now
+        elapsed = now - self._start
+        rate = self.done / elapsed if elapsed > 0 else 0.0
+        self.callback(self.done, self.total, rate)
@@ -0,0 +1,180 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import os
+import json
+import time
+import shutil
+import hashlib
+import tempfile
+import threading
+
+# 缓存目录，每个缓存条目是其中的一个子目录
+CACHE_DIR = os.path.join(os.path.expanduser("~"), ".pdf_toolbox_cache")
+
+# 缓存总大小上限，超出后按最近使用时间淘汰最旧的条目
+MAX_CACHE_BYTES = 2 * 1024 * 1024 * 1024
+
+# 保存结果信息时用该占位符替换输出目录，命中时换成新的输出目录
+_OUTPUT_DIR_PLACEHOLDER = "<<OUTPUT_DIR>>"
+
+_lock = threading.Lock()
+_stats = {'hits': 0, 'misses': 0}
+
+# 文件内容摘要的进程内缓存，键为 (路径, 大小, 修改时间)
+_digest_memo = {}
+
+def file_digest(path):
+    """
+    计算文件内容的SHA-256摘要，文件未修改时直接返回上次的结果
+    """
+    stat = os.stat(path)
+    memo_key = (os.path.abspath(path), stat.st_size, stat.st_mtime_ns)
+    digest = _digest_memo.get(memo_key)
+    if digest is None:
+        sha = hashlib.sha256()
+        with open(path, 'rb') as f:
+            for block in iter(lambda: f.read(1024 * 1024), b''):
+                sha.update(block)
+        digest = sha.hexdigest()
+        _digest_memo[memo_key] = digest
+    return digest
+
+def make_key(operation, input_path, **params):
+    """
+    根据文件内容、操作名称和参数生成缓存键
+    """
+    payload = json.dumps({
+        'operation': operation,
+        'file': file_digest(input_path),
+        'params': params,
+    }, sort_keys=True, default=str)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+def _entry_dir(key):
+    return os.path.join(CACHE_DIR, key)
+
+def _copy_path(src, dst):
+    if os.path.isdir(src):
+        shutil.copytree(src, dst, dirs_exist_ok=True)
+    else:
+        os.makedirs(os.path.dirname(dst), exist_ok=True)
+        shutil.copy2(src, dst)
+
+def _path_size(path):
+    if os.path.isdir(path):
+        return sum(os.path.getsize(os.path.join(root, name))
+                   for root, _, names in os.walk(path) for name in names)
+    return os.path.getsize(path)
+
+def lookup(key, output_dir):
+    """
+    查找缓存，命中时把缓存的输出文件复制到 output_dir 并返回结果信息
+    未命中返回None
+    """
+    manifest_path = os.path.join(_entry_dir(key), "manifest.json")
+    try:
+        with open(manifest_path, 'r', encoding='utf-8') as f:
+            manifest = json.load(f)
+
+        files_dir = os.path.join(_entry_dir(key), "files")
+        for rel_path in manifest['outputs']:
+            _copy_path(os.path.join(files_dir, rel_path), os.path.join(output_dir, rel_path))
+
+        # 更新访问时间，淘汰时按该时间排序
+        os.utime(manifest_path, None)
+    except (OSError, ValueError, KeyError):
+        with _lock:
+            _stats['misses'] += 1
+        return None
+
+    with _lock:
+        _stats['hits'] += 1
+    return manifest['result'].replace(_OUTPUT_DIR_PLACEHOLDER, output_dir)
+
+def store(key, output_dir, output_paths, result):
+    """
+    保存操作结果到缓存
+    output_paths: 操作生成的文件或文件夹，必须位于 output_dir 下
+    """
+    entry_dir = _entry_dir(key)
+    if os.path.exists(entry_dir):
+        return
+
+    try:
+        os.makedirs(CACHE_DIR, exist_ok=True)
+        # 先写入临时目录再整体改名，其他进程不会读到写了一半的条目
+        staging_dir = tempfile.mkdtemp(prefix=".staging_", dir=CACHE_DIR)
+        try:
+            outputs = []
+            size = 0
+            for path in output_paths:
+                rel_path = os.path.relpath(path, output_dir or os.curdir)
+                _copy_path(path, os.path.join(staging_dir, "files", rel_path))
+                outputs.append(rel_path)
+                size += _path_size(path)
+
+            manifest = {
+                'result': result.replace(output_dir, _OUTPUT_DIR_PLACEHOLDER) if output_dir else result,
+                'outputs': outputs,
+                'size': size,
+                'created': time.time(),
+            }
+            with open(os.path.join(staging_dir, "manifest.json"), 'w', encoding='utf-8') as f:
+                json.dump(manifest, f, ensure_ascii=False)
+
+            os.replace(staging_dir, entry_dir)
+        except OSError:
+            shutil.rmtree(staging_dir, ignore_errors=True)
+            raise
+
+        evict()
+    except OSError:
+        # 缓存写入失败不影响操作本身
+        pass
+
+def evict(max_bytes=None):
+    """
+    按最近使用时间淘汰缓存条目，直到总大小不超过上限
+    """
+    if max_bytes is None:
+        max_bytes = MAX_CACHE_BYTES
+
+    entries = []
+    total_size = 0
+    with os.scandir(CACHE_DIR) as it:
+        for entry in it:
+            if not entry.is_dir() or entry.name.startswith('.'):
+                continue
+            manifest_path = os.path.join(entry.path, "manifest.json")
+            try:
+                with open(manifest_path, 'r', encoding='utf-8') as f:
+                    size = json.load(f)['size']
+                last_used = os.path.getmtime(manifest_path)
+            except (OSError, ValueError, KeyError):
+                continue
+            entries.append((last_used, size, entry.path))
+            total_size += size
+
+    entries.sort()
+    for _, size, path in entries:
+        if total_size <= max_bytes:
+            break
+        shutil.rmtree(path, ignore_errors=True)
+        total_size -= size
+
+def clear_cache():
+    """
+    清空所有缓存
+    """
+    shutil.rmtree(CACHE_DIR, ignore_errors=True)
+    with _lock:
+        _stats['hits'] = 0
+        _stats['misses'] = 0
+
+def get_stats():
+    """
+    返回缓存命中和未命中次数
+    """
+    with _lock:
+        return dict(_stats)
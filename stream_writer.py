@@ -0,0 +1,392 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import hashlib
+import io
+import zlib
+from PyPDF2.generic import (ArrayObject, DecodedStreamObject, DictionaryObject, IndirectObject,
+                            NameObject, NumberObject, StreamObject)
+
+# 只复制页面时不复制的键：/Parent 改为指向输出文件的页面树，结构树在输出中不存在；
+# 复制整个文档时结构树一并复制，保留 /StructParents
+_PAGE_SKIP_KEYS = ('/Parent', '/StructParents')
+
+# 复制整个文档时一并复制的文档目录条目（书签、命名目标、页码标签、表单、
+# 可选内容（图层）的默认显示状态、标记结构树、打开动作等）
+_CATALOG_KEYS = ('/Outlines', '/Names', '/Dests', '/PageLabels', '/PageMode', '/PageLayout',
+                 '/ViewerPreferences', '/AcroForm', '/Metadata', '/Lang', '/OCProperties',
+                 '/MarkInfo', '/StructTreeRoot', '/OpenAction', '/AA', '/URI')
+
+# 这些类型的对象按身份区分（例如两个同名图层可以有不同的显示状态），不参与去重
+_IDENTITY_TYPES = ('/Page', '/Pages', '/OCG', '/OCMD')
+
+# 含有这些键的对象属于书签链、注释、表单字段等结构，与所在位置有关，不参与去重
+_LINK_KEYS = ('/Parent', '/P', '/Next', '/Prev', '/First', '/Last', '/Kids', '/Dest', '/D', '/A',
+              '/Rect', '/StructParent')
+
+# 启用对象流时每个对象流最多容纳的对象数
+OBJECT_STREAM_SIZE = 100
+
+class StreamingPdfWriter:
+    """
+    流式PDF写入器
+    每个对象生成后立即写入文件，内存中只保留对象编号和偏移量，
+    输出文件的大小不受内存限制；close() 时写出页面树、目录和交叉引用表
+    """
+    
+    def __init__(self, output_file, deduplicate=False, object_streams=False):
+        """
+        deduplicate: 按内容去重，内容完全相同的图片、字体、ICC配置等对象
+                     （包括来自不同文件的）只写入一次
+        object_streams: 把字典、数组等非流对象成批压缩到对象流中，交叉引用表也写成压缩的
+                        交叉引用流（PDF 1.5），页面、字体描述等小对象多的文件可明显减小
+        """
+        self._file = output_file
+        self._offsets = {}
+        self._next_number = 1
+        self._page_refs = []
+        self._catalog_entries = DictionaryObject()
+        self._info_ref = None
+        self._pages_ref = self.reserve()
+        self.deduplicate = deduplicate
+        # 对象内容摘要 -> 输出文件中的引用
+        self._digests = {}
+        self._unique_count = 0
+        self.duplicate_count = 0
+        self.object_streams = object_streams
+        # 对象编号 -> (所在对象流的编号, 在对象流中的序号)
+        self._compressed = {}
+        # 尚未写出的对象流内容：[(对象编号, 序列化后的内容)]
+        self._object_batch = []
+        self._file.write(b"%PDF-1.7\n%\xe2\xe3\xcf\xd3\n")
+    
+    @property
+    def page_count(self):
+        return len(self._page_refs)
+    
+    def reserve(self):
+        """
+        预留一个对象编号，返回指向它的引用，之后用 write_object 写入内容
+        """
+        ref = IndirectObject(self._next_number, 0, self)
+        self._next_number += 1
+        return ref
+    
+    def write_object(self, ref, obj):
+        """
+        写入预留编号的对象，obj 中的间接引用必须指向本文件中的对象
+        """
+        if self.object_streams and not isinstance(obj, StreamObject):
+            buffer = io.BytesIO()
+            obj.write_to_stream(buffer, None)
+            self._object_batch.append((ref.idnum, buffer.getvalue()))
+            if len(self._object_batch) >= OBJECT_STREAM_SIZE:
+                self._flush_object_stream()
+            return
+        self._offsets[ref.idnum] = self._file.tell()
+        self._file.write(f"{ref.idnum} 0 obj\n".encode('ascii'))
+        obj.write_to_stream(self._file, None)
+        self._file.write(b"\nendobj\n")
+    
+    def _flush_object_stream(self):
+        """
+        把积累的非流对象写成一个压缩的对象流
+        """
+        if not self._object_batch:
+            return
+        ref = self.reserve()
+        header = []
+        body = []
+        offset = 0
+        for index, (number, data) in enumerate(self._object_batch):
+            header.append(f"{number} {offset}")
+            body.append(data)
+            offset += len(data) + 1
+            self._compressed[number] = (ref.idnum, index)
+        header = " ".join(header).encode('ascii') + b"\n"
+        stream = StreamObject()
+        stream[NameObject('/Type')] = NameObject('/ObjStm')
+        stream[NameObject('/N')] = NumberObject(len(self._object_batch))
+        stream[NameObject('/First')] = NumberObject(len(header))
+        stream[NameObject('/Filter')] = NameObject('/FlateDecode')
+        stream._data = zlib.compress(header + b"\n".join(body) + b"\n")
+        self._object_batch = []
+        self._offsets[ref.idnum] = self._file.tell()
+        self._file.write(f"{ref.idnum} 0 obj\n".encode('ascii'))
+        stream.write_to_stream(self._file, None)
+        self._file.write(b"\nendobj\n")
+    
+    def add_object(self, obj):
+        ref = self.reserve()
+        self.write_object(ref, obj)
+        return ref
+    
+    def add_page(self, page, ref=None):
+        """
+        写入页面字典并加入页面树
+        """
+        page[NameObject('/Parent')] = self._pages_ref
+        if ref is None:
+            ref = self.reserve()
+        self.write_object(ref, page)
+        self._page_refs.append(ref)
+        return ref
+    
+    def import_pages(self, reader, pages=None, page_callback=None, document_entries=False,
+                     stream_transform=None):
+        """
+        把 reader 中的页面及其引用的所有对象复制到输出文件
+        pages: 要复制的页面索引，默认全部页面
+        page_callback: 可选，复制每页之前调用，可用于检查取消请求和上报进度
+        document_entries: 同时复制书签、表单、页码标签等文档级条目和文档信息，
+                          用于完整复制单个文档
+        stream_transform: 可选，stream_transform(源引用, 流对象) 返回写出时替代的流对象，
+                          用于重新压缩内容流、替换缩小后的图片等；去重仍按原始内容计算
+        同一个 reader 中多个页面共用的对象只写入一次
+        """
+        importer = _ReaderImporter(self, reader, stream_transform, document_entries)
+        importer.import_pages(pages, page_callback)
+        if document_entries:
+            importer.import_document_entries()
+    
+    def close(self):
+        """
+        写出页面树、文档目录、交叉引用表和文件尾
+        """
+        pages = DictionaryObject({
+            NameObject('/Type'): NameObject('/Pages'),
+            NameObject('/Kids'): ArrayObject(self._page_refs),
+            NameObject('/Count'): NumberObject(len(self._page_refs)),
+        })
+        self.write_object(self._pages_ref, pages)
+        catalog = DictionaryObject(self._catalog_entries)
+        catalog[NameObject('/Type')] = NameObject('/Catalog')
+        catalog[NameObject('/Pages')] = self._pages_ref
+        catalog_ref = self.add_object(catalog)
+        if self.object_streams:
+            self._flush_object_stream()
+            self._write_xref_stream(catalog_ref)
+            return
+        info = f" /Info {self._info_ref.idnum} 0 R" if self._info_ref is not None else ""
+        
+        xref_offset = self._file.tell()
+        lines = [f"xref\n0 {self._next_number}\n", "0000000000 65535 f \n"]
+        for number in range(1, self._next_number):
+            offset = self._offsets.get(number)
+            if offset is None:
+                lines.append("0000000000 65535 f \n")
+            else:
+                lines.append(f"{offset:010d} 00000 n \n")
+        lines.append(f"trailer\n<< /Size {self._next_number} /Root {catalog_ref.idnum} 0 R{info} >>\n"
+                     f"startxref\n{xref_offset}\n%%EOF\n")
+        self._file.write("".join(lines).encode('ascii'))
+    
+    def _write_xref_stream(self, catalog_ref):
+        """
+        写出交叉引用流，对象流中的对象用第2类条目记录所在对象流和序号
+        """
+        ref = self.reserve()
+        xref_offset = self._file.tell()
+        self._offsets[ref.idnum] = xref_offset
+        offset_width = max(4, (xref_offset.bit_length() + 7) // 8)
+        rows = []
+        for number in range(self._next_number):
+            if number in self._offsets:
+                rows.append(b'\x01' + self._offsets[number].to_bytes(offset_width, 'big') + b'\x00\x00')
+            elif number in self._compressed:
+                stream_number, index = self._compressed[number]
+                rows.append(b'\x02' + stream_number.to_bytes(offset_width, 'big')
+                            + index.to_bytes(2, 'big'))
+            else:
+                rows.append(b'\x00' + bytes(offset_width) + b'\xff\xff')
+        
+        stream = StreamObject()
+        stream[NameObject('/Type')] = NameObject('/XRef')
+        stream[NameObject('/Size')] = NumberObject(self._next_number)
+        stream[NameObject('/W')] = ArrayObject([NumberObject(1), NumberObject(offset_width),
+                                                NumberObject(2)])
+        stream[NameObject('/Root')] = catalog_ref
+        if self._info_ref is not None:
+            stream[NameObject('/Info')] = self._info_ref
+        stream[NameObject('/Filter')] = NameObject('/FlateDecode')
+        stream._data = zlib.compress(b"".join(rows))
+        self._file.write(f"{ref.idnum} 0 obj\n".encode('ascii'))
+        stream.write_to_stream(self._file, None)
+        self._file.write(f"\nendobj\nstartxref\n{xref_offset}\n%%EOF\n".encode('ascii'))
+
+class _ReaderImporter:
+    """
+    把一个 PdfReader 中的对象重新编号后写入 StreamingPdfWriter
+    """
+    
+    def __init__(self, writer, reader, stream_transform=None, keep_structure=False):
+        """
+        keep_structure: 保留页面的 /StructParents，复制整个文档（包括结构树）时使用
+        """
+        if reader.is_encrypted:
+            raise Exception("不支持加密的PDF文件")
+        self.writer = writer
+        self.reader = reader
+        self.stream_transform = stream_transform
+        self.page_skip_keys = ('/Parent',) if keep_structure else _PAGE_SKIP_KEYS
+        self.number_map = {}
+        self.pending = []
+        # 对象编号 -> 内容摘要，计算中的对象为None（用于发现循环引用）
+        self.digests = {}
+        # reader.pages 中的页面已合并了从页面树继承的属性（资源、页面大小等），写出时使用这些页面
+        self.flattened_pages = {page.indirect_reference.idnum: page for page in reader.pages
+                                if page.indirect_reference is not None}
+    
+    def _ref(self, source_ref):
+        """
+        返回源对象在输出文件中的引用，首次遇到时分配编号并排队等待写出
+        """
+        ref = self.number_map.get(source_ref.idnum)
+        if ref is not None:
+            return ref
+        
+        digest = None
+        if self.writer.deduplicate and source_ref.idnum not in self.flattened_pages:
+            digest = self._digest(source_ref)
+            ref = self.writer._digests.get(digest)
+            if ref is not None:
+                self.number_map[source_ref.idnum] = ref
+                self.writer.duplicate_count += 1
+                return ref
+        
+        ref = self.writer.reserve()
+        self.number_map[source_ref.idnum] = ref
+        self.pending.append((source_ref, ref))
+        if digest is not None:
+            self.writer._digests[digest] = ref
+        return ref
+    
+    def _unique_digest(self):
+        # 不参与去重的对象使用不会重复的摘要
+        self.writer._unique_count += 1
+        return b'unique:%d' % self.writer._unique_count
+    
+    def _digest(self, source_ref):
+        """
+        计算对象内容的摘要，引用的子对象按其摘要参与计算，
+        因此来自不同文件但内容相同的对象（包括其引用的字体文件、软蒙版等）摘要相同
+        页面、书签、注释等与位置相关的对象以及循环引用中的对象返回唯一摘要
+        """
+        idnum = source_ref.idnum
+        if idnum in self.digests:
+            digest = self.digests[idnum]
+            return digest if digest is not None else self._unique_digest()
+        if idnum in self.flattened_pages:
+            return self._unique_digest()
+        
+        self.digests[idnum] = None
+        sha = hashlib.sha256()
+        try:
+            unique = not self._hash_into(sha, source_ref.get_object())
+        except RecursionError:
+            unique = True
+        digest = self._unique_digest() if unique else sha.digest()
+        self.digests[idnum] = digest
+        return digest
+    
+    def _hash_into(self, sha, obj):
+        """
+        把对象内容写入摘要，对象不参与去重时返回False
+        """
+        if isinstance(obj, IndirectObject):
+            sha.update(b'R' + self._digest(obj))
+        elif isinstance(obj, DictionaryObject):
+            if any(key in obj for key in _LINK_KEYS) or obj.get('/Type') in _IDENTITY_TYPES:
+                return False
+            sha.update(b'S<<' if isinstance(obj, StreamObject) else b'<<')
+            for key in sorted(obj):
+                if key == '/Length':
+                    continue
+                sha.update(key.encode('utf-8', 'replace'))
+                # 取原始值，间接引用经 _digest 按编号缓存摘要，不展开重复计算
+                if not self._hash_into(sha, obj.raw_get(key)):
+                    return False
+            sha.update(b'>>')
+            if isinstance(obj, StreamObject):
+                sha.update(hashlib.sha256(obj._data).digest())
+        elif isinstance(obj, ArrayObject):
+            sha.update(b'[')
+            for item in obj:
+                if not self._hash_into(sha, item):
+                    return False
+            sha.update(b']')
+        else:
+            sha.update(type(obj).__name__.encode('ascii') + b':' + repr(obj).encode('utf-8', 'replace'))
+        return True
+    
+    def _copy(self, obj):
+        """
+        复制直接对象，其中的间接引用换成输出文件中的编号
+        """
+        if isinstance(obj, IndirectObject):
+            return self._ref(obj)
+        if isinstance(obj, StreamObject):
+            # 流数据保持原有编码直接写出，不解码
+            copy = DecodedStreamObject()
+            for key, value in obj.items():
+                copy[key] = self._copy(value)
+            copy.set_data(obj._data)
+            return copy
+        if isinstance(obj, DictionaryObject):
+            copy = DictionaryObject()
+            is_page = obj.get('/Type') == '/Page'
+            for key, value in obj.items():
+                if is_page and key in self.page_skip_keys:
+                    continue
+                copy[key] = self._copy(value)
+            return copy
+        if isinstance(obj, ArrayObject):
+            return ArrayObject(self._copy(item) for item in obj)
+        return obj
+    
+    def _flush(self):
+        """
+        写出所有已分配编号但尚未写出的对象
+        """
+        while self.pending:
+            source_ref, ref = self.pending.pop()
+            page = self.flattened_pages.get(source_ref.idnum)
+            if page is not None:
+                copy = self._copy(page)
+                copy[NameObject('/Parent')] = self.writer._pages_ref
+            else:
+                obj = source_ref.get_object()
+                if self.stream_transform is not None and isinstance(obj, StreamObject):
+                    obj = self.stream_transform(source_ref, obj)
+                copy = self._copy(obj)
+            self.writer.write_object(ref, copy)
+    
+    def import_document_entries(self):
+        """
+        复制文档目录中的书签、表单等条目和文档信息，书签指向的页面使用已复制的页面
+        """
+        catalog = self.reader.trailer['/Root'].get_object()
+        for key in _CATALOG_KEYS:
+            if key in catalog:
+                self.writer._catalog_entries[NameObject(key)] = self._copy(catalog[key])
+        info = self.reader.trailer.get('/Info')
+        if info is not None:
+            info = self._copy(info)
+            if not isinstance(info, IndirectObject):
+                info = self.writer.add_object(info)
+            self.writer._info_ref = info
+        self._flush()
+    
+    def import_pages(self, pages=None, page_callback=None):
+        reader_pages = self.reader.pages
+        if pages is None:
+            pages = range(len(reader_pages))
+        for page_index in pages:
+            if page_callback is not None:
+                page_callback()
+            page = reader_pages[page_index]
+            if page.indirect_reference is None:
+                self.writer.add_page(self._copy(page))
+            else:
+                self.writer._page_refs.append(self._ref(page.indirect_reference))
+            self._flush()
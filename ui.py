@@ -7,40 +7,83 @@ import subprocess
 from PyQt5.QtWidgets import (QApplication, QMainWindow, QWidget, QVBoxLayout, 
                              QHBoxLayout, QGridLayout, QPushButton, QLabel, 
                              QFrame, QTextEdit, QFileDialog, QMessageBox,
-                             QProgressBar, QListWidget, QListWidgetItem, QInputDialog, QLineEdit)
-from PyQt5.QtCore import Qt, QThread, pyqtSignal, QSize
+                             QProgressBar, QListWidget, QListWidgetItem, QInputDialog, QLineEdit,
+                             QCheckBox)
+from PyQt5.QtCore import Qt, QObject, QRunnable, QThreadPool, pyqtSignal, QSize
 from PyQt5.QtGui import QFont, QDragEnterEvent, QDropEvent, QIcon
 
-# 导入功能模块
-from pdf_split import split_pdf
-from pdf_merge import merge_pdfs
-from pdf_to_image import pdf_to_images
-from pdf_image_extract import extract_images_from_pdf
-from pdf_table_extract import extract_tables_from_pdf
-from pdf_text_extract import extract_text_from_pdf
-from image_to_pdf import images_to_pdf
-from batch_print import batch_print_pdfs
-from pdf_protect import protect_pdf
-from pdf_preview import preview_pdf
+# 功能模块及其依赖（pdfplumber、pandas、PyMuPDF等）较重，在首次点击对应按钮时才导入
+import result_cache
+from cancellation import CancelToken, OperationCancelled
 
-# 工作线程类
-class WorkerThread(QThread):
-    progress = pyqtSignal(int)
-    finished = pyqtSignal(str)
-    error = pyqtSignal(str)
-    
-    def __init__(self, function, *args, **kwargs):
+# 同时运行的任务数上限，其余任务排队等待
+MAX_CONCURRENT_JOBS = 2
+
+# 任务状态
+JOB_QUEUED = "等待中"
+JOB_RUNNING = "运行中"
+JOB_CANCELLING = "正在取消"
+JOB_FINISHED = "已完成"
+JOB_FAILED = "失败"
+JOB_CANCELLED = "已取消"
+
+def format_seconds(seconds):
+    """
+    把剩余秒数格式化为便于阅读的文字
+    """
+    seconds = int(seconds + 0.5)
+    if seconds < 60:
+        return f"{seconds} 秒"
+    minutes, seconds = divmod(seconds, 60)
+    if minutes < 60:
+        return f"{minutes} 分 {seconds} 秒"
+    hours, minutes = divmod(minutes, 60)
+    return f"{hours} 小时 {minutes} 分"
+
+# 任务信号（QRunnable不是QObject，需要单独的对象发出信号）
+class JobSignals(QObject):
+    started = pyqtSignal(int)
+    progress = pyqtSignal(int, int, int, float)
+    finished = pyqtSignal(int, str)
+    error = pyqtSignal(int, str)
+    cancelled = pyqtSignal(int)
+
+# 任务类，由线程池调度执行
+class Job(QRunnable):
+    def __init__(self, job_id, name, function, *args, **kwargs):
         super().__init__()
+        # 任务对象由主窗口持有，执行完毕后不由线程池删除
+        self.setAutoDelete(False)
+        self.job_id = job_id
+        self.name = name
         self.function = function
         self.args = args
         self.kwargs = kwargs
+        self.state = JOB_QUEUED
+        # 功能函数在每页之间检查该令牌，取消后在当前页处理完时停止并清理已生成的文件
+        self.cancel_token = CancelToken()
+        self.done = 0
+        self.total = 0
+        self.rate = 0.0
+        self.signals = JobSignals()
+        
+    def report_progress(self, done, total, rate):
+        # 功能函数中的进度回调已按时间节流，这里直接转发到界面线程
+        self.signals.progress.emit(self.job_id, done, total, rate)
         
     def run(self):
+        if self.cancel_token.cancelled:
+            self.signals.cancelled.emit(self.job_id)
+            return
+        self.signals.started.emit(self.job_id)
         try:
-            result = self.function(*self.args, **self.kwargs)
-            self.finished.emit(result)
+            result = self.function(*self.args, progress=self.report_progress,
+                                   cancel_token=self.cancel_token, **self.kwargs)
+            self.signals.finished.emit(self.job_id, result)
+        except OperationCancelled:
+            self.signals.cancelled.emit(self.job_id)
         except Exception as e:
-            self.error.emit(str(e))
+            self.signals.error.emit(self.job_id, str(e))
 
 # 拖拽标签组件
 class DropLabel(QLabel):
@@ -153,7 +196,8 @@ class FunctionButton(QPushButton):
             "#FF9800": "#F57C00",
             "#795548": "#5D4037",
             "#607D8B": "#455A64",
-            "#E91E63": "#C2185B"
+            "#E91E63": "#C2185B",
+            "#3F51B5": "#303F9F"
         }
         return colors.get(color, color)
 
@@ -163,7 +207,11 @@ class PDFToolbox(QMainWindow):
         super().__init__()
         self.current_file = ""
         self.output_dir = ""
-        self.worker_thread = None
+        self.thread_pool = QThreadPool()
+        self.thread_pool.setMaxThreadCount(MAX_CONCURRENT_JOBS)
+        self.jobs = {}
+        self.job_items = {}
+        self.next_job_id = 1
         self.initUI()
         
     def initUI(self):
@@ -309,16 +357,23 @@ class PDFToolbox(QMainWindow):
             ("图片转PDF", "#FF9800", self.images_to_pdf),
             ("批量打印", "#795548", self.batch_print),
             ("PDF保护", "#607D8B", self.protect_pdf),
-            ("PDF预览", "#E91E63", self.preview_pdf)
+            ("PDF预览", "#E91E63", self.preview_pdf),
+            ("PDF优化", "#3F51B5", self.optimize_pdf)
         ]
         
         # 添加功能按钮到网格
         for i, (name, color, func) in enumerate(functions):
             btn = FunctionButton(name, color)
-            btn.clicked.connect(func)
+            btn.clicked.connect(lambda checked=False, func=func: self.call_handler(func))
             grid_layout.addWidget(btn, i // 2, i % 2)
         
         layout.addLayout(grid_layout)
+        
+        # PDF合并、图片转PDF时是否合并重复的图片、字体等对象（需要额外处理一遍输出文件，默认关闭）
+        self.deduplicate_checkbox = QCheckBox("合并/图片转PDF时去除重复对象（减小文件，耗时更长）")
+        self.deduplicate_checkbox.setChecked(False)
+        self.deduplicate_checkbox.setStyleSheet("QCheckBox { font-size: 13px; color: #555; }")
+        layout.addWidget(self.deduplicate_checkbox)
         layout.addStretch()
         
         return panel
@@ -363,7 +418,35 @@ class PDFToolbox(QMainWindow):
                 line-height: 1.5;
             }
         """)
-        layout.addWidget(self.status_display)
+        layout.addWidget(self.status_display, 3)
+        
+        # 任务队列
+        jobs_title = QLabel("📋 任务队列")
+        jobs_title.setStyleSheet("""
+            QLabel {
+                font-size: 16px;
+                font-weight: bold;
+                color: #333;
+                padding: 4px 0;
+            }
+        """)
+        layout.addWidget(jobs_title)
+        
+        self.job_list = QListWidget()
+        self.job_list.setStyleSheet("""
+            QListWidget {
+                border: 1px solid #e0e0e0;
+                border-radius: 8px;
+                padding: 6px;
+                background-color: #f8f9fa;
+                font-size: 13px;
+            }
+        """)
+        layout.addWidget(self.job_list, 1)
+        
+        cancel_btn = FunctionButton("取消选中任务", "#607D8B")
+        cancel_btn.clicked.connect(self.cancel_selected_job)
+        layout.addWidget(cancel_btn)
         
         # 初始状态消息
         welcome_msg = """
@@ -385,6 +468,13 @@ class PDFToolbox(QMainWindow):
         
         return panel
         
+    def call_handler(self, handler):
+        # 功能模块在按钮处理函数中才导入，缺少依赖时显示错误而不是让程序崩溃
+        try:
+            handler()
+        except ImportError as e:
+            self.show_error(f"功能模块加载失败，请检查依赖是否安装: {str(e)}")
+        
     def select_file(self):
         file_path, _ = QFileDialog.getOpenFileName(
             self, "选择PDF文件", "", "PDF文件 (*.pdf)"
@@ -394,6 +484,10 @@ class PDFToolbox(QMainWindow):
         
     def on_file_dropped(self, file_path):
         if os.path.exists(file_path):
+            if self.current_file and self.current_file != file_path:
+                # 释放上一个文件的文档会话，不再占用该文件
+                from pdf_session import close_document
+                close_document(self.current_file)
             self.current_file = file_path
             file_name = os.path.basename(file_path)
             self.file_label.setText(f"📄 已选择: {file_name}\n📍 路径: {file_path}")
@@ -402,27 +496,128 @@ class PDFToolbox(QMainWindow):
         else:
             self.show_error("文件不存在！")
         
-    def run_function(self, function, *args, **kwargs):
-        if self.worker_thread and self.worker_thread.isRunning():
-            self.show_error("请等待当前操作完成！")
+    def run_function(self, name, function, *args, **kwargs):
+        # 在任务名称中标明处理的文件，便于区分同时运行的多个任务
+        if args and isinstance(args[0], str):
+            name = f"{name}: {os.path.basename(args[0])}"
+        elif args and isinstance(args[0], list):
+            name = f"{name}: {len(args[0])} 个文件"
+        
+        job = Job(self.next_job_id, name, function, *args, **kwargs)
+        self.next_job_id += 1
+        job.signals.started.connect(self.on_job_started)
+        job.signals.progress.connect(self.on_job_progress)
+        job.signals.finished.connect(self.on_function_finished)
+        job.signals.error.connect(self.on_function_error)
+        job.signals.cancelled.connect(self.on_job_cancelled)
+        
+        item = QListWidgetItem()
+        item.setData(Qt.UserRole, job.job_id)
+        self.job_list.insertItem(0, item)
+        self.jobs[job.job_id] = job
+        self.job_items[job.job_id] = item
+        self.update_job_item(job)
+        
+        self.thread_pool.start(job)
+        self.update_progress_bar()
+        
+    def update_job_item(self, job):
+        text = f"#{job.job_id} {job.name} — {job.state}"
+        if job.state in (JOB_RUNNING, JOB_CANCELLING) and job.total:
+            text += f" {job.done}/{job.total}"
+            if job.rate > 0:
+                eta = (job.total - job.done) / job.rate
+                text += f"（{job.rate:.1f}/秒，剩余约 {format_seconds(eta)}）"
+        self.job_items[job.job_id].setText(text)
+        
+    def set_job_state(self, job_id, state):
+        job = self.jobs[job_id]
+        job.state = state
+        self.update_job_item(job)
+        self.update_progress_bar()
+        
+    def update_progress_bar(self):
+        active = any(job.state in (JOB_QUEUED, JOB_RUNNING, JOB_CANCELLING)
+                     for job in self.jobs.values())
+        self.progress_bar.setVisible(active)
+        if not active:
             return
-            
-        self.progress_bar.setVisible(True)
-        self.progress_bar.setRange(0, 0)  # 不确定进度
         
-        self.worker_thread = WorkerThread(function, *args, **kwargs)
-        self.worker_thread.finished.connect(self.on_function_finished)
-        self.worker_thread.error.connect(self.on_function_error)
-        self.worker_thread.start()
+        # 汇总所有运行中任务的进度，剩余时间取最慢的任务
+        running = [job for job in self.jobs.values() if job.state in (JOB_RUNNING, JOB_CANCELLING)]
+        if not running or not all(job.total for job in running):
+            self.progress_bar.setRange(0, 0)  # 尚未得到总量，显示不确定进度
+            return
         
-    def on_function_finished(self, result):
-        self.progress_bar.setVisible(False)
+        done = sum(job.done for job in running)
+        total = sum(job.total for job in running)
+        self.progress_bar.setRange(0, total)
+        self.progress_bar.setValue(min(done, total))
+        
+        etas = [(job.total - job.done) / job.rate for job in running if job.rate > 0]
+        if etas:
+            self.progress_bar.setFormat(f"%p%  剩余约 {format_seconds(max(etas))}")
+        else:
+            self.progress_bar.setFormat("%p%")
+        
+    def on_job_progress(self, job_id, done, total, rate):
+        job = self.jobs[job_id]
+        job.done = done
+        job.total = total
+        job.rate = rate
+        self.update_job_item(job)
+        self.update_progress_bar()
+        
+    def on_job_started(self, job_id):
+        if self.jobs[job_id].state == JOB_QUEUED:
+            self.set_job_state(job_id, JOB_RUNNING)
+        
+    def on_job_cancelled(self, job_id):
+        job = self.jobs[job_id]
+        self.set_job_state(job_id, JOB_CANCELLED)
+        self.status_display.append(f"⚠️ 任务 #{job_id} {job.name} 已取消")
+        
+    def on_function_finished(self, job_id, result):
+        # 取消请求到达时操作已经完成，仍按取消处理
+        if self.jobs[job_id].cancel_token.cancelled:
+            self.on_job_cancelled(job_id)
+            return
+        self.set_job_state(job_id, JOB_FINISHED)
         self.status_display.append(f"✅ {result}")
+        self.show_cache_stats()
         
-    def on_function_error(self, error_msg):
-        self.progress_bar.setVisible(False)
+    def show_cache_stats(self):
+        stats = result_cache.get_stats()
+        if stats['hits'] or stats['misses']:
+            self.status_display.append(f"💾 结果缓存：命中 {stats['hits']} 次，未命中 {stats['misses']} 次")
+        
+    def on_function_error(self, job_id, error_msg):
+        if self.jobs[job_id].cancel_token.cancelled:
+            self.on_job_cancelled(job_id)
+            return
+        self.set_job_state(job_id, JOB_FAILED)
         self.show_error(f"操作失败: {error_msg}")
         
+    def cancel_selected_job(self):
+        item = self.job_list.currentItem()
+        if item is None:
+            self.show_error("请先在任务队列中选择要取消的任务！")
+            return
+        self.cancel_job(item.data(Qt.UserRole))
+        
+    def cancel_job(self, job_id):
+        job = self.jobs[job_id]
+        if job.state not in (JOB_QUEUED, JOB_RUNNING):
+            return
+        job.cancel_token.cancel()
+        
+        # 尚未开始的任务直接从线程池队列中移除
+        if job.state == JOB_QUEUED and self.thread_pool.tryTake(job):
+            self.on_job_cancelled(job_id)
+        else:
+            # 运行中的任务在处理完当前页后自行停止并删除部分输出，随后释放线程池位置
+            self.set_job_state(job_id, JOB_CANCELLING)
+        
     def show_error(self, message):
         self.status_display.append(f"❌ {message}")
         
@@ -430,52 +625,63 @@ class PDFToolbox(QMainWindow):
         if not self.check_file_selected():
             return
         self.status_display.append("\n🔧 正在执行PDF拆分...")
-        self.run_function(split_pdf, self.current_file, self.output_dir)
+        from pdf_split import split_pdf
+        self.run_function("PDF拆分", split_pdf, self.current_file, self.output_dir)
         
     def merge_pdf(self):
         self.status_display.append("\n🔧 正在执行PDF合并...")
         files, _ = QFileDialog.getOpenFileNames(self, "选择要合并的PDF文件", "", "PDF文件 (*.pdf)")
         if files:
+            from pdf_merge import merge_pdfs
             output_path = os.path.join(os.path.dirname(files[0]), "merged.pdf")
-            self.run_function(merge_pdfs, files, output_path)
+            self.run_function("PDF合并", merge_pdfs, files, output_path,
+                              deduplicate=self.deduplicate_checkbox.isChecked())
         
     def pdf_to_image(self):
         if not self.check_file_selected():
             return
         self.status_display.append("\n🔧 正在将PDF转换为图片...")
-        self.run_function(pdf_to_images, self.current_file, self.output_dir)
+        from pdf_to_image import pdf_to_images
+        self.run_function("PDF转图片", pdf_to_images, self.current_file, self.output_dir, workers=None)
         
     def extract_images(self):
         if not self.check_file_selected():
             return
         self.status_display.append("\n🔧 正在从PDF中提取图片...")
-        self.run_function(extract_images_from_pdf, self.current_file, self.output_dir)
+        from pdf_image_extract import extract_images_from_pdf
+        self.run_function("提取图片", extract_images_from_pdf, self.current_file, self.output_dir)
         
     def extract_tables(self):
         if not self.check_file_selected():
             return
         self.status_display.append("\n🔧 正在从PDF中提取表格...")
-        self.run_function(extract_tables_from_pdf, self.current_file, self.output_dir)
+        from pdf_table_extract import extract_tables_from_pdf
+        self.run_function("提取表格", extract_tables_from_pdf, self.current_file, self.output_dir,
+                          workers=None)
         
     def extract_text(self):
         if not self.check_file_selected():
             return
         self.status_display.append("\n🔧 正在从PDF中提取文本...")
-        self.run_function(extract_text_from_pdf, self.current_file, self.output_dir)
+        from pdf_text_extract import extract_text_from_pdf
+        self.run_function("提取文本", extract_text_from_pdf, self.current_file, self.output_dir)
         
     def images_to_pdf(self):
         self.status_display.append("\n🔧 正在将图片导入为PDF...")
         files, _ = QFileDialog.getOpenFileNames(self, "选择图片文件", "", 
                                               "图片文件 (*.png *.jpg *.jpeg *.bmp *.tiff)")
         if files:
+            from image_to_pdf import images_to_pdf
             output_path = os.path.join(os.path.dirname(files[0]), "images_to_pdf.pdf")
-            self.run_function(images_to_pdf, files, output_path)
+            self.run_function("图片转PDF", images_to_pdf, files, output_path,
+                              deduplicate=self.deduplicate_checkbox.isChecked(), workers=None)
         
     def batch_print(self):
         if not self.check_file_selected():
             return
         self.status_display.append("\n🔧 正在执行批量打印...")
-        self.run_function(batch_print_pdfs, [self.current_file])
+        from batch_print import batch_print_pdfs
+        self.run_function("批量打印", batch_print_pdfs, [self.current_file])
         
     def protect_pdf(self):
         if not self.check_file_selected():
@@ -497,7 +703,8 @@ class PDFToolbox(QMainWindow):
             
             if confirm_ok and confirm_password == password:
                 self.status_display.append("\n🔧 正在为PDF添加保护...")
-                self.run_function(protect_pdf, self.current_file, self.output_dir, password)
+                from pdf_protect import protect_pdf
+                self.run_function("PDF保护", protect_pdf, self.current_file, self.output_dir, password)
             elif not confirm_ok:
                 # 用户取消了确认
                 self.status_display.append("❌ PDF保护操作已取消")
@@ -515,7 +722,15 @@ class PDFToolbox(QMainWindow):
         if not self.check_file_selected():
             return
         self.status_display.append("\n🔧 正在预览PDF...")
-        self.run_function(preview_pdf, self.current_file)
+        from pdf_preview import preview_pdf
+        self.run_function("PDF预览", preview_pdf, self.current_file, workers=None)
+        
+    def optimize_pdf(self):
+        if not self.check_file_selected():
+            return
+        self.status_display.append("\n🔧 正在优化PDF文件大小...")
+        from pdf_optimize import optimize_pdf
+        self.run_function("PDF优化", optimize_pdf, self.current_file, self.output_dir)
         
     def check_file_selected(self):
         if not self.current_file:
@@ -524,7 +739,12 @@ class PDFToolbox(QMainWindow):
         return True
 
     def closeEvent(self, event):
-        if self.worker_thread and self.worker_thread.isRunning():
-            self.worker_thread.terminate()
-            self.worker_thread.wait()
+        # 取消所有任务，运行中的任务在当前页处理完后停止，不使用 terminate 强行终止线程
+        for job in self.jobs.values():
+            if job.state in (JOB_QUEUED, JOB_RUNNING):
+                job.cancel_token.cancel()
+        self.thread_pool.clear()
+        self.thread_pool.waitForDone()
+        from pdf_session import close_all
+        close_all()
         event.accept()